@@ -30,10 +30,14 @@ THE SOFTWARE.
 
 import re
 import os
+import time
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
 from pprint import pprint
-from bs4 import BeautifulSoup
-from lendingclub.filters import Filter, FilterByLoanID, SavedFilter
-from lendingclub.session import Session
+from lendingclub.filters import Filter, FilterByLoanID, SavedFilter, FilterValidationError
+from lendingclub.session import Session, SessionError, DeadlineExceeded, PRIORITY_HIGH, PRIORITY_BULK
+from lendingclub.journal import OrderJournal
 
 
 class LendingClub:
@@ -48,6 +52,9 @@ class LendingClub:
         The user's password, for authentication.
     logger : `Logger <http://docs.python.org/2/library/logging.html>`_
         A python logger used to get debugging output from this module.
+    session_file : string, optional
+        Save the authenticated session to this file and resume it the next time you authenticate,
+        instead of logging in again. (see :attr:`lendingclub.session.Session.session_file`)
 
     Examples
     --------
@@ -74,10 +81,14 @@ class LendingClub:
     __logger = None
     session = None
     order = None
+    __seen = None
+    __seen_lock = None
 
-    def __init__(self, email=None, password=None, logger=None):
-        self.session = Session(email, password)
+    def __init__(self, email=None, password=None, logger=None, session_file=None, transport=None):
+        self.session = Session(email, password, session_file=session_file, transport=transport)
         self.order = Order(self.session)
+        self.__seen = OrderedDict()
+        self.__seen_lock = threading.Lock()
 
         if logger is not None:
             self.set_logger(logger)
@@ -101,6 +112,44 @@ class LendingClub:
         self.__logger = logger
         self.session.set_logger(self.__logger)
 
+    def __remember(self, loans):
+        """
+        Remember when loans were last returned by a search, for :func:`recently_seen()`
+        """
+        with self.__seen_lock:
+            for loan in loans:
+                # Move it to the end, so the loans are kept in the order they were last seen
+                self.__seen.pop(loan['loan_id'], None)
+                self.__seen[loan['loan_id']] = loan['searched_at']
+
+            # Forget the loans that haven't been seen for the longest time
+            while len(self.__seen) > 10000:
+                self.__seen.popitem(last=False)
+
+    def recently_seen(self, loan_ids, max_age):
+        """
+        Check if every loan was returned by :func:`search()` or :func:`iter_search()` within
+        the last `max_age` seconds, so they were still available to invest in.
+
+        Parameters
+        ----------
+        loan_ids : list
+            The loan IDs
+        max_age : float
+            The maximum number of seconds since each loan was seen
+
+        Returns
+        -------
+        boolean
+        """
+        oldest = time.time() - max_age
+        with self.__seen_lock:
+            for loan_id in loan_ids:
+                seen = self.__seen.get(int(loan_id) if str(loan_id).isdigit() else loan_id)
+                if seen is None or seen < oldest:
+                    return False
+        return True
+
     def version(self):
         """
         Return the version number of the Lending Club Investor tool
@@ -163,7 +212,7 @@ class LendingClub:
         cash = False
         try:
             response = self.session.get('/browse/cashBalanceAj.action')
-            json_response = response.json()
+            json_response = self.session.json(response)
 
             if self.session.json_success(json_response):
                 self.__log('Cash available: {0}'.format(json_response['cashBalance']))
@@ -215,8 +264,8 @@ class LendingClub:
             A list of portfolios (or names, if `names_only` is True)
         """
         folios = []
-        response = self.session.get('/data/portfolioManagement?method=getLCPortfolios')
-        json_response = response.json()
+        response = self.session.get('/data/portfolioManagement?method=getLCPortfolios', priority=PRIORITY_BULK)
+        json_response = self.session.json(response)
 
         # Get portfolios and create a list of names
         if self.session.json_success(json_response):
@@ -301,7 +350,8 @@ class LendingClub:
 
         # Send
         response = self.session.post('/data/portfolioManagement', query=query, data=post)
-        json_response = response.json()
+        self.session.cache.invalidate('/data/portfolioManagement')
+        json_response = self.session.json(response)
 
         # Failed
         if not self.session.json_success(json_response):
@@ -322,7 +372,7 @@ class LendingClub:
 
         return False
 
-    def search(self, filters=None, start_index=0, limit=100):
+    def search(self, filters=None, start_index=0, limit=100, deadline=None):
         """
         Search for a list of notes that can be invested in.
         (similar to searching for notes in the Browse section on the site)
@@ -338,11 +388,15 @@ class LendingClub:
             (default is 0)
         limit : int, optional
             The number of results to return per request. (default is 100)
+        deadline : float, optional
+            Give up if the search isn't done by this time (a `time.time()` timestamp),
+            and raise :class:`lendingclub.session.DeadlineExceeded`
 
         Returns
         -------
         dict
-            A dictionary object with the list of matching loans under the `loans` key.
+            A dictionary object with the list of matching loans under the `loans` key. Each loan
+            has a `searched_at` timestamp of when it was returned. (see :attr:`Order.availability_max_age`)
         """
         assert filters is None or isinstance(filters, Filter), 'filter is not a lendingclub.filters.Filter'
 
@@ -359,8 +413,10 @@ class LendingClub:
         }
 
         # Make request
-        response = self.session.post('/browse/browseNotesAj.action', data=payload)
-        json_response = response.json()
+        with self.session.deadline(deadline):
+            response = self.session.post('/browse/browseNotesAj.action', data=payload, idempotent=True)
+        searched_at = time.time()
+        json_response = self.session.json(response)
 
         if self.session.json_success(json_response):
             results = json_response['searchresult']
@@ -368,16 +424,65 @@ class LendingClub:
             # Normalize results by converting loanGUID -> loan_id
             for loan in results['loans']:
                 loan['loan_id'] = int(loan['loanGUID'])
+                loan['searched_at'] = searched_at
 
             # Validate that fractions do indeed match the filters
             if filters is not None:
                 filters.validate(results['loans'])
 
+            self.__remember(results['loans'])
             return results
 
         return False
 
-    def build_portfolio(self, cash, max_per_note=25, min_percent=0, max_percent=20, filters=None, automatically_invest=False, do_not_clear_staging=False):
+    def iter_search(self, filters=None, start_index=0, limit=100):
+        """
+        Like :func:`search()`, but yields each loan as soon as it has been parsed from the response,
+        instead of loading the whole page first. Use this for large pages, to reduce memory use and
+        get to the first loan sooner.
+
+        Parameters
+        ----------
+        filters : lendingclub.filters.*, optional
+            The filter to use to search for notes. If no filter is passed, a wildcard search
+            will be performed.
+        start_index : int, optional
+            The result index to start on. (default is 0)
+        limit : int, optional
+            The number of results to return. (default is 100)
+
+        Returns
+        -------
+        generator
+            The matching loans, each with a `searched_at` timestamp. Nothing is yielded if the search fails.
+        """
+        assert filters is None or isinstance(filters, Filter), 'filter is not a lendingclub.filters.Filter'
+
+        if filters:
+            filter_string = filters.search_string()
+        else:
+            filter_string = 'default'
+        payload = {
+            'method': 'search',
+            'filter': filter_string,
+            'startindex': start_index,
+            'pagesize': limit
+        }
+
+        response = self.session.post('/browse/browseNotesAj.action', data=payload, stream=True)
+        searched_at = time.time()
+        for loan in self.session.iter_json(response, 'loans'):
+            loan['loan_id'] = int(loan['loanGUID'])
+            loan['searched_at'] = searched_at
+
+            # Validate that fractions do indeed match the filters
+            if filters is not None:
+                filters.validate_one(loan)
+
+            self.__remember([loan])
+            yield loan
+
+    def build_portfolio(self, cash, max_per_note=25, min_percent=0, max_percent=20, filters=None, automatically_invest=False, do_not_clear_staging=False, deadline=None):
         """
         Returns a list of loan notes that are diversified by your min/max percent request and filters.
         One way to invest in these loan notes, is to start an order and use add_batch to add all the
@@ -401,6 +506,9 @@ class LendingClub:
         do_not_clear_staging : boolean, optional
             Similar to automatically_invest, don't do this unless you know what you're doing.
             Setting this to True stops the method from clearing the loan staging area before returning
+        deadline : float, optional
+            Give up if the portfolio isn't built (and invested, with `automatically_invest`) by this time
+            (a `time.time()` timestamp), and raise :class:`lendingclub.session.DeadlineExceeded`
 
         Returns
         -------
@@ -477,6 +585,14 @@ class LendingClub:
         assert filters is None or isinstance(filters, Filter), 'filter is not a lendingclub.filters.Filter'
         assert max_per_note >= 25, 'max_per_note must be greater than or equal to 25'
 
+        with self.session.deadline(deadline):
+            return self.__build_portfolio(cash, max_per_note, min_percent, max_percent, filters, automatically_invest, do_not_clear_staging)
+
+    def __build_portfolio(self, cash, max_per_note, min_percent, max_percent, filters, automatically_invest, do_not_clear_staging):
+        """
+        Build the portfolio for :func:`build_portfolio()`
+        """
+
         # Set filters
         if filters:
             filter_str = filters.search_string()
@@ -494,7 +610,7 @@ class LendingClub:
         }
         self.__log('POST VALUES -- amount: {0}, max_per_note: {1}, filter: ...'.format(cash, max_per_note))
         response = self.session.post('/portfolio/lendingMatchOptionsV2.action', data=payload)
-        json_response = response.json()
+        json_response = self.session.json(response)
 
         # Options were found
         if self.session.json_success(json_response) and 'lmOptions' in json_response:
@@ -539,14 +655,15 @@ class LendingClub:
                 'lending_match_point': match_index,
                 'lending_match_version': 'v2'
             }
-            self.session.get('/portfolio/recommendPortfolio.action', query=payload)
+            self.session.get('/portfolio/recommendPortfolio.action', query=payload, idempotent=False)
+            self.session.staged_loans = None
 
             # Get all loan fractions
             payload = {
                 'method': 'getPortfolio'
             }
-            response = self.session.get('/data/portfolio', query=payload)
-            json_response = response.json()
+            response = self.session.get('/data/portfolio', query=payload, idempotent=False)
+            json_response = self.session.json(response)
 
             # Extract fractions from response
             fractions = []
@@ -632,8 +749,8 @@ class LendingClub:
                 'pagesize': limit,
                 'namespace': '/account'
             }
-            response = self.session.post('/account/loansAj.action', data=payload)
-            json_response = response.json()
+            response = self.session.post('/account/loansAj.action', data=payload, idempotent=True, priority=PRIORITY_BULK)
+            json_response = self.session.json(response)
 
             # Notes returned
             if self.session.json_success(json_response):
@@ -655,6 +772,50 @@ class LendingClub:
 
         return notes
 
+    def iter_notes(self, start_index=0, limit=100, get_all=False, sort_by='loanId', sort_dir='asc'):
+        """
+        Like :func:`my_notes()`, but yields each note as soon as it has been parsed from the response,
+        instead of loading all of them first. Use this on accounts with a lot of notes.
+
+        Parameters
+        ----------
+        start_index : int, optional
+            The result index to start on. (default is 0)
+        limit : int, optional
+            The number of results to load per request. (default is 100)
+        get_all : boolean, optional
+            Keep loading notes until all of them have been returned
+        sort_by : string, optional
+            What key to sort on
+        sort_dir : {'asc', 'desc'}, optional
+            Which direction to sort
+
+        Returns
+        -------
+        generator
+            Your notes. Nothing more is yielded after a request fails.
+        """
+        index = start_index
+        while True:
+            payload = {
+                'sortBy': sort_by,
+                'dir': sort_dir,
+                'startindex': index,
+                'pagesize': limit,
+                'namespace': '/account'
+            }
+            response = self.session.post('/account/loansAj.action', data=payload, stream=True, priority=PRIORITY_BULK)
+
+            count = 0
+            for note in self.session.iter_json(response, 'loans'):
+                count += 1
+                yield note
+
+            # A short page is the last one
+            if get_all is not True or count < limit:
+                break
+            index += limit
+
     def get_note(self, note_id):
         """
         Get a loan note that you've invested in by ID
@@ -807,16 +968,22 @@ class LendingClub:
 
         return found
 
-    def start_order(self):
+    def start_order(self, journal_file=None):
         """
         Start a new investment order for loans
 
+        Parameters
+        ----------
+        journal_file : string, optional
+            A file to journal the order to, so it can be resumed after a crash.
+            (see :func:`lendingclub.Order.resume()`)
+
         Returns
         -------
         lendingclub.Order
             The :class:`lendingclub.Order` object you can use for investing in loan notes.
         """
-        order = Order(lc=self)
+        order = Order(lc=self, journal_file=journal_file)
         return order
 
 
@@ -829,6 +996,8 @@ class Order:
     ----------
     lc : :class:`lendingclub.LendingClub`
         The LendingClub API object that is used to communicate with lendingclub.com
+    journal_file : string, optional
+        A file to journal the order to, so it can be resumed after a crash (see :func:`resume()`)
 
     Examples
     --------
@@ -881,21 +1050,50 @@ class Order:
 
     loans = None
     order_id = 0
+    order_ids = None
+    outcomes = None
     lc = None
 
+    journal = None
+    """ The :class:`lendingclub.journal.OrderJournal` that :func:`execute()` records each phase to, or None """
+
+    timings = None
+    """ The timing spans of the last :func:`execute()`, in the order they ended. Each one is a dict with the `phase`,
+    its `start` timestamp and `duration` in seconds, and the `error` if it failed. The phases are:
+    `clear` (clearing the order session), `search` (searching for the loans), `stage` (staging the loans, with
+    the seconds for each loan in `loans`), `add_to_order`, `token` (the place order page), `confirm` (placing
+    the order), and `total` for the whole call."""
+
+    timing_hook = None
+    """ A function that's called with each timing span as it ends. (see :attr:`timings`)"""
+
+    availability_max_age = None
+    """ Seconds. LendingClub requires a search for the loans before they're staged. When every loan in the order was
+    returned by :func:`lendingclub.LendingClub.search()` within this many seconds, staging skips searching for them
+    again. (see :func:`lendingclub.LendingClub.recently_seen()`) This also applies to the search results passed to
+    :func:`execute()`, by their `searched_at` timestamp. None always searches, unless search results are passed in."""
+
+    stage_concurrency = 8
+    """ The maximum number of loans that are staged at the same time """
+
     # These two attributes should [almost] never be used. It assumes that all the loans are already staged
     # and skips clearing and staging and goes straight to investing everything which is staged, either
     # here or on LC.com
     __already_staged = False
     __i_know_what_im_doing = False
 
-    def __init__(self, lc):
+    def __init__(self, lc, journal_file=None):
         """
         Start a new order
         """
         self.lc = lc
         self.loans = {}
         self.order_id = 0
+        self.order_ids = []
+        self.outcomes = {}
+        self.timings = []
+        if journal_file is not None:
+            self.journal = OrderJournal(journal_file)
 
         self.__already_staged = False
         self.__i_know_what_im_doing = False
@@ -1011,34 +1209,251 @@ class Order:
         """
         self.loans = {}
 
-    def execute(self, portfolio_name=None):
+    def execute(self, portfolio_name=None, deadline=None, availability=None):
         """
         Place the order with LendingClub
 
+        Loans that are already staged on the session's order, by :func:`prestage()` or an execute that failed,
+        aren't staged again. Only the difference is sent: loans that are no longer in the order are taken out,
+        and loans that are new or have a different amount are staged (and searched for). So an order can be
+        changed and executed again cheaply. (see :attr:`lendingclub.session.Session.staged_loans`)
+
         Parameters
         ----------
         portfolio_name : string
             The name of the portfolio to add the invested loan notes to.
             This can be a new or existing portfolio name.
+        deadline : float, optional
+            Stop if the order isn't placed by this time (a `time.time()` timestamp),
+            and raise :class:`lendingclub.session.DeadlineExceeded`. The order might have
+            been partially staged, but it's never placed after the deadline.
+        availability : dict or list, optional
+            Fresh results from :func:`lendingclub.LendingClub.search()`, from this account's session. If every loan in
+            the order is in them, and was found within :attr:`availability_max_age` seconds, the loans are staged
+            without searching for them again.
 
         Raises
         ------
         LendingClubError
+        lendingclub.session.SessionError
+            If a request failed, or :class:`lendingclub.session.DeadlineExceeded` if the deadline passed
 
         Returns
         -------
         int
             The completed order ID
         """
-        assert self.order_id == 0, 'This order has already been place. Start a new order.'
+        assert self.order_id == 0 and not self.order_ids, 'This order has already been place. Start a new order.'
         assert len(self.loans) > 0, 'There aren\'t any loans in your order'
 
-        # Place the order
-        self.__stage_order()
-        token = self.__get_strut_token()
-        self.order_id = self.__place_order(token)
+        return self.__execute(portfolio_name, deadline, availability=availability)
+
+    def prestage(self, availability=None):
+        """
+        Stage the loans in the order ahead of time, before deciding to place it. When :func:`execute()` is
+        called later, only what changed since then is staged. Call :func:`abort()`
+        to empty the order on LendingClub if it won't be placed.
+
+        Loans that can't be staged now are left out, and staged again by :func:`execute()`.
+
+        Parameters
+        ----------
+        availability : dict or list, optional
+            Fresh search results, so the loans don't have to be searched for. (see :func:`execute()`)
+
+        Returns
+        -------
+        list
+            The IDs of the loans that were staged
+
+        Examples
+        --------
+
+            >>> order = lc.start_order()
+            >>> order.add_batch(candidates, 25)
+            >>> order.prestage()
+            [1234, 2345, 3456]
+            >>> order.remove(3456)
+            >>> order.execute()       # Only takes 3456 out before placing the order
+            1861880
+        """
+        assert self.order_id == 0 and not self.order_ids, 'This order has already been place. Start a new order.'
+        assert len(self.loans) > 0, 'There aren\'t any loans in your order'
+
+        self.timings = []
+        self.__sync_staged(self.loans, availability=availability, fail_fast=False)
+
+        staged = self.lc.session.staged_loans.keys()
+        self.__log('Prestaged {0} of {1} loans'.format(len(staged), len(self.loans)))
+        return staged
+
+    def abort(self):
+        """
+        Give up on an order that was prestaged with :func:`prestage()`, and empty the order
+        on LendingClub so nothing that was staged is left behind
+        """
+        self.lc.session.clear_session_order()
+
+    def resume(self, portfolio_name=None, deadline=None):
+        """
+        Finish the last order in the :attr:`journal`, after the process stopped while placing it.
+        The loans are loaded from the journal, and the order is picked up where it stopped:
+
+        * If the order was confirmed, or failed before it was submitted, nothing is sent.
+        * If the order was submitted, but no order ID was recorded, your notes are checked for the
+          loans. If there are notes from an order newer than the last one in the journal, the order
+          went through, and its ID is recorded. Otherwise it's placed again.
+        * Otherwise, the order is placed from the start. What's staged on LendingClub can't be trusted
+          after the process stopped, so the loans are staged again, unless this session knows they're staged.
+
+        When :func:`execute_chunked()` was interrupted, the chunk it was placing is finished.
+
+        Parameters
+        ----------
+        portfolio_name : string, optional
+            The name of the portfolio to add the invested loan notes to, if the order is placed now
+        deadline : float, optional
+            Stop if the order isn't placed by this time (see :func:`execute()`)
+
+        Raises
+        ------
+        LendingClubError
+            If your notes couldn't be loaded to check if a submitted order went through
+
+        Returns
+        -------
+        int
+            The order ID, or None if the journal doesn't have an order that was or can be placed
+
+        Examples
+        --------
+
+            >>> order = lc.start_order(journal_file='/var/lib/autoinvest/orders.jsonl')
+            >>> order.resume()      # On startup, finish the order that was interrupted, if any
+            1861880
+        """
+        assert self.journal is not None, 'This order does not have a journal'
+        assert self.order_id == 0 and not self.order_ids, 'This order has already been place. Start a new order.'
 
+        entries = self.journal.last_order()
+        if not entries:
+            return None
+
+        self.loans = {}
+        for loan_id, amount in entries[0]['loans'].iteritems():
+            self.loans[int(loan_id) if loan_id.isdigit() else loan_id] = amount
+
+        phases = [entry['phase'] for entry in entries]
+        self.__log('Resuming order for loans {0} from the {1} phase'.format(self.loans.keys(), phases[-1]))
+
+        if phases[-1] == 'confirmed':
+            self.order_id = entries[-1]['order_id']
+            return self.order_id
+        if phases[-1] == 'failed':
+            return None
+
+        # It might have been placed
+        if 'submitted' in phases:
+            order_id = self.__find_placed_order(entries[0].get('last_order_id') or 0)
+            if order_id is not None:
+                self.__log('Found notes from order #{0}, it was placed before'.format(order_id))
+                self.order_id = order_id
+                self.journal.record('confirmed', True, order_id=order_id, reconciled=True)
+                if portfolio_name:
+                    return self.assign_to_portfolio(portfolio_name)
+                return order_id
+
+        return self.__execute(portfolio_name, deadline)
+
+    def __find_placed_order(self, last_order_id):
+        """
+        Find the ID of the order newer than `last_order_id` with notes in this order's loans, or None.
+        Raises a LendingClubError if the notes can't be loaded, because then it's not known if the order was placed.
+        """
+        notes = self.lc.my_notes(get_all=True)
+        if notes['result'] != 'success':
+            raise LendingClubError('Could not load your notes to check if the order was placed: {0}'.format(notes['result']))
+
+        order_id = None
+        for note in notes['loans']:
+            if note['orderId'] > last_order_id and (note['loanId'] in self.loans or str(note['loanId']) in self.loans):
+                order_id = max(order_id, note['orderId'])
+        return order_id
+
+    def __span(self, phase):
+        """
+        Time a phase of placing the order, inside a `with` block. (see :attr:`timings`)
+        """
+        return self.__span_context(phase)
+
+    @contextmanager
+    def __span_context(self, phase):
+        span = {'phase': phase, 'start': time.time(), 'duration': None, 'error': None}
+        try:
+            yield span
+        except Exception as e:
+            span['error'] = e
+            raise
+        finally:
+            span['duration'] = time.time() - span['start']
+            self.timings.append(span)
+
+            # Instrumentation must never change the outcome of the order
+            try:
+                if self.lc.session.metrics is not None:
+                    self.lc.session.metrics.observe('order_phase_seconds', span['duration'], {'phase': phase})
+                if self.timing_hook is not None:
+                    self.timing_hook(span)
+            except Exception as e:
+                self.__log('Timing hook failed: {0}'.format(str(e)))
+
+    def __record(self, phase, sync=False, **values):
+        """
+        Record an order phase in the journal, if there is one
+        """
+        if self.journal is not None:
+            if phase == 'begin':
+                values['last_order_id'] = self.journal.last_order_id()
+            self.journal.record(phase, sync, **values)
+
+    def __execute(self, portfolio_name, deadline, availability=None):
+        """
+        Place the order, for :func:`execute()` and :func:`resume()`
+
+        Parameters
+        ----------
+        availability : dict or list, optional
+            Search results that the loans can be staged from, without searching again
+        """
+        self.__record('begin', True, loans=self.loans)
+        submitted = False
+        self.timings = []
+
+        # Place the order, ahead of any other requests that are waiting
+        with self.__span('total'), self.lc.session.priority(PRIORITY_HIGH), self.lc.session.deadline(deadline):
+            try:
+                self.__stage_order(availability=availability)
+                self.__record('staged', True)
+                token = self.__get_strut_token()
+                self.__record('token')
+
+                self.__record('submitted', True)
+                submitted = True
+                try:
+                    self.order_id = self.__place_order(token)
+                finally:
+                    self.lc.session.cache.invalidate('/browse/cashBalanceAj.action')
+
+            except Exception as e:
+                # After it's submitted, only the notes can tell if the order went through
+                if not submitted:
+                    self.__record('failed', error=str(e))
+                raise
+
+        self.__record('confirmed', True, order_id=self.order_id)
         self.__log('Order #{0} was successfully submitted'.format(self.order_id))
+        if self.lc.session.metrics is not None:
+            self.lc.session.metrics.inc('orders_placed_total')
 
         # Assign to portfolio
         if portfolio_name:
@@ -1046,6 +1461,162 @@ class Order:
 
         return self.order_id
 
+    def execute_chunked(self, chunk_size=100, portfolio_name=None, deadline=None):
+        """
+        Place a large order as several smaller orders of up to `chunk_size` loans each, so a
+        failure only loses one chunk instead of the whole order.
+
+        The chunks are placed one after another, because LendingClub keeps one order per session.
+        Once a chunk is staged, the loans of the next chunk are searched for while it's being placed.
+        A chunk that fails is skipped, and the rest are still placed. Each chunk is recorded in the
+        :attr:`journal` as its own order, so :func:`resume()` can finish the chunk that was interrupted.
+
+        A chunk that fails after it was submitted might have been placed anyway, so nothing more is
+        placed and the error is raised. Call :func:`resume()` to find out if that chunk went through.
+
+        Parameters
+        ----------
+        chunk_size : int, optional
+            The maximum number of loans in each order
+        portfolio_name : string, optional
+            The name of the portfolio to add the invested loan notes to, after all the chunks are placed
+        deadline : float, optional
+            Stop if the order isn't placed by this time (a `time.time()` timestamp), and raise
+            :class:`lendingclub.session.DeadlineExceeded`. The chunks that were already placed are
+            in :attr:`order_ids`.
+
+        Raises
+        ------
+        LendingClubError
+            If a chunk failed after it was submitted (see above)
+
+        Returns
+        -------
+        list
+            The order ID of each chunk that was placed. The result for each loan is in :attr:`outcomes`,
+            which has the order ID for each loan that was invested in, and the error for each loan that wasn't.
+
+        Examples
+        --------
+
+            >>> order = lc.start_order()
+            >>> order.add_batch(loan_ids, 25)
+            >>> order.execute_chunked(chunk_size=100)
+            [1861880, 1861881, 1861882]
+            >>> failed = [loan_id for loan_id, outcome in order.outcomes.iteritems() if isinstance(outcome, Exception)]
+        """
+        assert self.order_id == 0 and not self.order_ids, 'This order has already been place. Start a new order.'
+        assert len(self.loans) > 0, 'There aren\'t any loans in your order'
+        assert chunk_size > 0, 'chunk_size must be greater than zero'
+
+        loan_ids = self.loans.keys()
+        chunks = [loan_ids[i:i + chunk_size] for i in range(0, len(loan_ids), chunk_size)]
+        self.outcomes = {}
+        self.timings = []
+        placed = []
+
+        with self.__span('total'), self.lc.session.priority(PRIORITY_HIGH), self.lc.session.deadline(deadline):
+            search = self.__start_search(chunks[0], deadline)
+
+            for k, chunk in enumerate(chunks):
+                results = search
+                search = None
+
+                # Each chunk is its own order in the journal
+                loans = dict((loan_id, self.loans[loan_id]) for loan_id in chunk)
+                self.__record('begin', True, loans=loans)
+                submitted = False
+
+                try:
+                    try:
+                        self.__stage_order(loans, self.__finish_search(results))
+                    finally:
+                        # Staging depends on the last search, so the next chunk is only searched for once this one is staged
+                        if k + 1 < len(chunks):
+                            search = self.__start_search(chunks[k + 1], deadline)
+
+                    self.__record('staged', True)
+
+                    token = self.__get_strut_token()
+                    self.__record('token')
+
+                    self.__record('submitted', True)
+                    submitted = True
+                    try:
+                        order_id = self.__place_order(token)
+                    finally:
+                        self.lc.session.cache.invalidate('/browse/cashBalanceAj.action')
+
+                except DeadlineExceeded as e:
+                    if not submitted:
+                        self.__record('failed', error=str(e))
+                    for loan_id in loan_ids:
+                        self.outcomes.setdefault(loan_id, e)
+                    raise
+                except (LendingClubError, SessionError, FilterValidationError) as e:
+                    # It's not known if the chunk went through, so leave it for resume() to check
+                    if submitted:
+                        self.__log('Chunk {0} of {1} failed after it was submitted: {2}'.format(k + 1, len(chunks), str(e)))
+                        for loan_id in loan_ids:
+                            self.outcomes.setdefault(loan_id, e)
+                        raise
+
+                    self.__record('failed', error=str(e))
+                    self.__log('Chunk {0} of {1} could not be placed: {2}'.format(k + 1, len(chunks), str(e)))
+                    for loan_id in chunk:
+                        self.outcomes[loan_id] = e
+                    continue
+
+                self.__record('confirmed', True, order_id=order_id)
+                self.__log('Order #{0} was successfully submitted for chunk {1} of {2}'.format(order_id, k + 1, len(chunks)))
+                if self.lc.session.metrics is not None:
+                    self.lc.session.metrics.inc('orders_placed_total')
+
+                self.order_ids.append(order_id)
+                placed.append((order_id, chunk))
+                for loan_id in chunk:
+                    self.outcomes[loan_id] = order_id
+
+        # Assign to portfolio
+        if portfolio_name:
+            for order_id, chunk in placed:
+                self.lc.assign_to_portfolio(portfolio_name, chunk, [order_id] * len(chunk))
+
+        return self.order_ids
+
+    def __start_search(self, loan_ids, deadline):
+        """
+        Search for the loans in the background, for :func:`execute_chunked()`
+        """
+        search = {'loan_ids': loan_ids, 'results': None, 'error': None, 'thread': None}
+
+        # No need to search again (an empty result still counts as searched)
+        if self.__is_available(loan_ids):
+            search['results'] = {}
+            return search
+
+        def run():
+            with self.lc.session.priority(PRIORITY_HIGH), self.lc.session.deadline(deadline):
+                try:
+                    search['results'] = self.__search_loans(loan_ids)
+                except Exception as e:
+                    search['error'] = e
+
+        search['thread'] = threading.Thread(target=run)
+        search['thread'].daemon = True
+        search['thread'].start()
+        return search
+
+    def __finish_search(self, search):
+        """
+        Wait for a search started with __start_search() and return the results
+        """
+        if search['thread'] is not None:
+            search['thread'].join()
+        if search['error'] is not None:
+            raise search['error']
+        return search['results']
+
     def assign_to_portfolio(self, portfolio_name=None):
         """
         Assign all the notes in this order to a portfolio
@@ -1073,47 +1644,60 @@ class Order:
 
         return self.lc.assign_to_portfolio(portfolio_name, loan_ids, order_ids)
 
-    def __stage_order(self):
+    def __search_loans(self, loan_ids, partial=False):
+        """
+        Search for the loans, which LendingClub requires before they can be staged.
+        Raises a LendingClubError if any of them weren't found, unless `partial` is True.
+        """
+        f = FilterByLoanID(loan_ids)
+        with self.__span('search'):
+            results = self.lc.search(f, limit=len(loan_ids))
+        if results is False:
+            raise LendingClubError('Could not search for the loans to stage them')
+        if partial:
+            return results
+        if len(results['loans']) == 0 or results['totalRecords'] != len(loan_ids):
+            raise LendingClubError('Could not stage the loans. The number of loans in your batch does not match totalRecords. {0} != {1}'.format(len(loan_ids), results['totalRecords']), results)
+        return results
+
+    def __is_available(self, loan_ids, availability=None):
+        """
+        Check if the loans are known to be available, from search results or a recent search,
+        so they don't have to be searched for before staging
+        """
+        if availability is not None:
+            loans = availability['loans'] if type(availability) is dict else availability
+            oldest = None if self.availability_max_age is None else time.time() - self.availability_max_age
+            found = set(str(loan['loan_id']) for loan in loans if oldest is None or loan.get('searched_at', 0) >= oldest)
+            if all(str(loan_id) in found for loan_id in loan_ids):
+                return True
+
+        if self.availability_max_age is not None:
+            return self.lc.recently_seen(loan_ids, self.availability_max_age)
+        return False
+
+    def __stage_order(self, loans=None, search_results=None, availability=None):
         """
         Add all the loans to the LC order session
+
+        Parameters
+        ----------
+        loans : dict, optional
+            The amount to invest in each loan ID. Defaults to all the loans in the order.
+        search_results : dict, optional
+            The results of searching for the loans, if that has already been done
+        availability : dict or list, optional
+            Search results that the loans can be staged from, without searching again
         """
+        if loans is None:
+            loans = self.loans
 
         # Skip staging...probably not a good idea...you've been warned
         if self.__already_staged is True and self.__i_know_what_im_doing is True:
             self.__log('Not staging the order...I hope you know what you\'re doing...'.format(len(self.loans)))
             return
 
-        self.__log('Staging order for {0} loan notes...'.format(len(self.loans)))
-
-        # Create a fresh order session
-        self.lc.session.clear_session_order()
-
-        #
-        # Stage all the loans to the order
-        #
-        loan_ids = self.loans.keys()
-        self.__log('Staging loans {0}'.format(loan_ids))
-
-        # LendingClub requires you to search for the loans before you can stage them
-        f = FilterByLoanID(loan_ids)
-        results = self.lc.search(f, limit=len(self.loans))
-        if len(results['loans']) == 0 or results['totalRecords'] != len(self.loans):
-            raise LendingClubError('Could not stage the loans. The number of loans in your batch does not match totalRecords. {0} != {1}'.format(len(self.loans), results['totalRecords']), results)
-
-        # Stage each loan
-        for loan_id, amount in self.loans.iteritems():
-            payload = {
-                'method': 'addToPortfolio',
-                'loan_id': loan_id,
-                'loan_amount': amount,
-                'remove': 'false'
-            }
-            response = self.lc.session.get('/data/portfolio', query=payload)
-            json_response = response.json()
-
-            # Ensure it was successful before moving on
-            if not self.lc.session.json_success(json_response):
-                raise LendingClubError('Could not stage loan {0} on the order: {1}'.format(loan_id, response.text), response)
+        self.__sync_staged(loans, search_results, availability)
 
         #
         # Add all staged loans to the order
@@ -1121,8 +1705,9 @@ class Order:
         payload = {
             'method': 'addToPortfolioNew'
         }
-        response = self.lc.session.get('/data/portfolio', query=payload)
-        json_response = response.json()
+        with self.__span('add_to_order'):
+            response = self.lc.session.get('/data/portfolio', query=payload, idempotent=False)
+        json_response = self.lc.session.json(response)
 
         if self.lc.session.json_success(json_response):
             self.__log(json_response['message'])
@@ -1131,6 +1716,122 @@ class Order:
             raise self.__log('Could not add loans to the order: {0}'.format(response.text))
             raise LendingClubError('Could not add loans to the order', response.text)
 
+    def __sync_staged(self, loans, search_results=None, availability=None, fail_fast=True):
+        """
+        Make the loans staged on the LC order session match `loans`. Only the difference from what's
+        already staged is sent: loans that shouldn't be there are taken out, and loans that are missing
+        or have a different amount are staged. When it's not known what's staged, the order is cleared first.
+
+        Parameters
+        ----------
+        loans : dict
+            The amount to invest in each loan ID
+        search_results : dict, optional
+            The results of searching for the loans, if that has already been done
+        availability : dict or list, optional
+            Search results that the loans can be staged from, without searching again
+        fail_fast : boolean, optional
+            Raise a StagingError at the first loan that can't be staged. Otherwise the loans that
+            can't be staged, or weren't found by the search, are left out.
+        """
+        if self.lc.session.staged_loans is None:
+            self.__log('Staging order for {0} loan notes...'.format(len(loans)))
+
+            # Create a fresh order session
+            with self.__span('clear'):
+                self.lc.session.clear_session_order()
+
+        staged = self.lc.session.staged_loans
+        removed = dict((loan_id, amount) for loan_id, amount in staged.items() if loan_id not in loans)
+        changed = dict((loan_id, amount) for loan_id, amount in loans.items() if staged.get(loan_id) != amount)
+        self.__log('{0} loans are already staged, removing {1} and staging {2}'.format(len(loans) - len(changed), len(removed), len(changed)))
+
+        self.__stage_loans(removed, remove=True, fail_fast=fail_fast)
+
+        #
+        # Stage all the loans to the order
+        #
+        loan_ids = changed.keys()
+        if not loan_ids:
+            return
+        self.__log('Staging loans {0}'.format(loan_ids))
+
+        # LendingClub requires you to search for the loans before you can stage them
+        if search_results is None:
+            if self.__is_available(loan_ids, availability):
+                self.__log('The loans were found by a recent search, not searching again')
+            elif fail_fast:
+                self.__search_loans(loan_ids)
+            else:
+                found = set(str(loan['loan_id']) for loan in self.__search_loans(loan_ids, partial=True)['loans'])
+                missing = [loan_id for loan_id in loan_ids if str(loan_id) not in found]
+                if missing:
+                    self.__log('Loans {0} were not found by the search, leaving them out'.format(missing))
+                    changed = dict((loan_id, amount) for loan_id, amount in changed.items() if loan_id not in missing)
+
+        # Stage the loans at the same time
+        self.__stage_loans(changed, fail_fast=fail_fast)
+
+    def __stage_loans(self, loans, remove=False, fail_fast=True):
+        """
+        Stage loans on the LC order session at the same time (or take them out of it), and
+        keep track of what's staged in the session's staged_loans
+
+        Parameters
+        ----------
+        loans : dict
+            The amount to invest in each loan ID
+        remove : boolean, optional
+            Take the loans out of the order
+        fail_fast : boolean, optional
+            Stop at the first loan that fails and raise a StagingError. Otherwise the loans that
+            failed are just left out.
+        """
+        if not loans:
+            return
+        loan_ids = loans.keys()
+
+        specs = []
+        for loan_id in loan_ids:
+            payload = {
+                'method': 'addToPortfolio',
+                'loan_id': loan_id,
+                'loan_amount': loans[loan_id],
+                'remove': 'true' if remove else 'false'
+            }
+            specs.append({'path': '/data/portfolio', 'query': payload, 'idempotent': False})
+
+        def check(response):
+            if not self.lc.session.json_success(self.lc.session.json(response)):
+                raise LendingClubError('Could not stage loan: {0}'.format(response.text), response)
+
+        with self.__span('unstage' if remove else 'stage') as span:
+            results = self.lc.session.batch(specs, self.stage_concurrency, fail_fast=fail_fast, check=check)
+            span['loans'] = dict((loan_ids[i], elapsed) for i, elapsed in enumerate(results.times) if elapsed is not None)
+
+        staged = self.lc.session.staged_loans
+        count = 0
+        for i, loan_id in enumerate(loan_ids):
+            if results.times[i] is not None and results.errors[i] is None:
+                count += 1
+                if remove:
+                    staged.pop(loan_id, None)
+                else:
+                    staged[loan_id] = loans[loan_id]
+
+        # Only the loans that were actually staged, not the ones that already were
+        if not remove and self.lc.session.metrics is not None:
+            self.lc.session.metrics.inc('loans_staged_total', count)
+
+        if results.failed():
+            failed = dict((loan_ids[i], results.errors[i]) for i in results.failed())
+            skipped = [loan_ids[i] for i in results.skipped()]
+            self.__log('Could not stage loans {0}, skipped {1}'.format(failed.keys(), skipped))
+            if fail_fast:
+                raise StagingError('Could not stage loans {0} on the order'.format(sorted(failed.keys())), failed, skipped)
+        else:
+            self.__log('Staged {0} loans in {1:.3f} seconds'.format(len(loan_ids), results.elapsed))
+
     def __get_strut_token(self):
         """
         Move the staged loan notes to the order stage and get the struts token
@@ -1146,9 +1847,8 @@ class Order:
         try:
             # Move to the place order page and get the struts token
 
-            response = self.lc.session.get('/portfolio/placeOrder.action')
-            soup = BeautifulSoup(response.text, "html5lib")
-
+            with self.__span('token'):
+                response = self.lc.session.get('/portfolio/placeOrder.action', idempotent=False)
 
             # Example HTML with the stuts token:
             """
@@ -1157,27 +1857,22 @@ class Order:
             """
             # 'struts.token.name' defines the field name with the token value
 
-            strut_tag = None
-            strut_token_name = soup.find('input', {'name': 'struts.token.name'})
-            if strut_token_name and strut_token_name['value'].strip():
-
-                # Get form around the strut.token.name element
-                form = soup.form # assumed
-                for parent in strut_token_name.parents:
-                    if parent and parent.name == 'form':
-                        form = parent
-                        break
+            strut_token_name = self.lc.session.find_html(response, 'input', {'name': 'struts.token.name'})
+            if strut_token_name and strut_token_name['attrs'].get('value', '').strip():
 
                 # Get strut token value
-                strut_token_name = strut_token_name['value']
-                strut_tag = soup.find('input', {'name': strut_token_name})
-                if strut_tag and strut_tag['value'].strip():
-                    return {'name': strut_token_name, 'value': strut_tag['value'].strip()}
+                strut_token_name = strut_token_name['attrs']['value']
+                strut_tag = self.lc.session.find_html(response, 'input', {'name': strut_token_name})
+                if strut_tag and strut_tag['attrs'].get('value', '').strip():
+                    return {'name': strut_token_name, 'value': strut_tag['attrs']['value'].strip()}
 
             # No strut token found
             self.__log('No struts token! HTML: {0}'.format(response.text))
             raise LendingClubError('No struts token. Please report this error.', response)
 
+        except SessionError:
+            # Network errors and deadlines are raised as they are
+            raise
         except Exception as e:
             self.__log('Could not get struts token. Error message: {0}'.format(str(e)))
             raise LendingClubError('Could not get struts token. Error message: {0}'.format(str(e)))
@@ -1209,25 +1904,30 @@ class Order:
             if token:
                 payload['struts.token.name'] = token['name']
                 payload[token['name']] = token['value']
-            response = self.lc.session.post('/portfolio/orderConfirmed.action', data=payload)
+            with self.__span('confirm'):
+                response = self.lc.session.post('/portfolio/orderConfirmed.action', data=payload)
 
             # Process HTML for the order ID
-            html = response.text
-            soup = BeautifulSoup(html, 'html5lib')
-
-            # Order num
-            order_field = soup.find(id='order_id')
+            order_field = self.lc.session.find_html(response, attrs={'id': 'order_id'})
             if order_field:
-                order_id = int(order_field['value'])
+                order_id = int(order_field['attrs']['value'])
 
             # Did not find an ID
             if order_id == 0:
                 self.__log('An investment order was submitted, but a confirmation ID could not be determined')
                 raise LendingClubError('No order ID was found when placing the order.', response)
             else:
+                # Everything that was staged is in the order now
+                self.lc.session.staged_loans = {}
                 return order_id
 
         except Exception as e:
+            # It's not known what's still staged
+            self.lc.session.staged_loans = None
+
+            # Network errors and deadlines are raised as they are
+            if isinstance(e, SessionError):
+                raise
             raise LendingClubError('Could not place the order: {0}'.format(str(e)), response)
 
 
@@ -1251,3 +1951,25 @@ class LendingClubError(Exception):
 
     def __str__(self):
         return repr(self.value)
+
+
+class StagingError(LendingClubError):
+    """
+    One or more loans could not be staged on an order, so it was not placed.
+
+    Parameters
+    ----------
+    value : string
+        The error message
+    failed_loans : dict
+        The error for each loan ID that failed to stage
+    skipped_loans : list
+        The loan IDs that were not staged, because staging stopped at the first failure
+    """
+    failed_loans = None
+    skipped_loans = None
+
+    def __init__(self, value, failed_loans=None, skipped_loans=None):
+        LendingClubError.__init__(self, value)
+        self.failed_loans = failed_loans or {}
+        self.skipped_loans = skipped_loans or []
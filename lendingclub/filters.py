@@ -68,8 +68,13 @@ THE SOFTWARE.
 import os
 import re
 import json
+import threading
 from pybars import Compiler
 
+# Compiled search templates, by file. The pybars compiler can't be used from two threads at once.
+_templates = {}
+_templates_lock = threading.Lock()
+
 
 class Filter(dict):
     """
@@ -350,11 +355,15 @@ class Filter(dict):
         self.__normalize()
 
         # Get the template
-        tmpl_source = unicode(open(self.tmpl_file).read())
+        with _templates_lock:
+            template = _templates.get(self.tmpl_file)
+            if template is None:
+                tmpl_source = unicode(open(self.tmpl_file).read())
+                compiler = Compiler()
+                template = compiler.compile(tmpl_source)
+                _templates[self.tmpl_file] = template
 
         # Process template
-        compiler = Compiler()
-        template = compiler.compile(tmpl_source)
         out = template(self)
         if not out:
             return False
@@ -393,6 +402,8 @@ class SavedFilter(Filter):
         An instance of the LendingClub class that will be used to communicate with the site
     filter_id : int
         The ID of the filter to load
+    response : requests.Response, optional
+        The filter's response from the server, if it has already been downloaded
 
     Examples
     --------
@@ -445,19 +456,23 @@ class SavedFilter(Filter):
 
         filters = []
         response = lc.session.get('/browse/getSavedFiltersAj.action')
-        json_response = response.json()
+        json_response = lc.session.json(response)
 
-        # Load all filters
+        # Load all filters at the same time
         if lc.session.json_success(json_response):
-            for saved in json_response['filters']:
-                filters.append(SavedFilter(lc, saved['id']))
+            ids = [saved['id'] for saved in json_response['filters']]
+            results = lc.session.batch([{'path': '/browse/getSavedFilterAj.action', 'query': {'id': filter_id}} for filter_id in ids])
+            results.raise_for_errors()
+
+            for filter_id, response in zip(ids, results.responses):
+                filters.append(SavedFilter(lc, filter_id, response))
 
         return filters
 
-    def __init__(self, lc, filter_id):
+    def __init__(self, lc, filter_id, response=None):
         self.id = filter_id
         self.lc = lc
-        self.load()
+        self.load(response)
 
     def reload(self):
         """
@@ -465,18 +480,24 @@ class SavedFilter(Filter):
         """
         self.load()
 
-    def load(self):
+    def load(self, response=None):
         """
         Load the filter from the server
+
+        Parameters
+        ----------
+        response : requests.Response, optional
+            The filter's getSavedFilterAj.action response, if it has already been downloaded
         """
 
         # Attempt to load the saved filter
-        payload = {
-            'id': self.id
-        }
-        response = self.lc.session.get('/browse/getSavedFilterAj.action', query=payload)
+        if response is None:
+            payload = {
+                'id': self.id
+            }
+            response = self.lc.session.get('/browse/getSavedFilterAj.action', query=payload)
         self.response = response
-        json_response = response.json()
+        json_response = self.lc.session.json(response)
 
         if self.lc.session.json_success(json_response) and json_response['filterName'] != 'No filters':
             self.name = json_response['filterName']
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+"""
+A crash-safe journal of the orders being placed, so an order that was interrupted can be
+resumed without investing twice. (see :func:`lendingclub.Order.resume()`)
+"""
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2013 Jeremy Gillick
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import json
+import time
+import threading
+
+
+class OrderJournal:
+    """
+    An append-only file that records each phase of placing an order, one JSON object per line.
+
+    The phases are, in order:
+
+    * ``begin`` -- The order was started, with the amount for each loan, and the newest order ID
+      known to the journal before it (`last_order_id`), so notes from older orders aren't mistaken for this one
+    * ``staged`` -- The loans were staged on LendingClub
+    * ``token`` -- The struts token for placing the order was received
+    * ``submitted`` -- The order was sent to LendingClub
+    * ``confirmed`` -- LendingClub returned the order ID
+    * ``failed`` -- The order failed before it was submitted
+
+    The entries up to submitting the order, and the confirmation, are synced to disk before moving on,
+    so the journal is never behind what LendingClub has.
+
+    Parameters
+    ----------
+    file_path : string
+        The journal file. It's created if it doesn't exist, and appended to if it does.
+    """
+
+    file_path = None
+    __lock = None
+    __last_order_id = None
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.__lock = threading.Lock()
+
+    def record(self, phase, sync=False, **values):
+        """
+        Append an entry to the journal
+
+        Parameters
+        ----------
+        phase : string
+            The order phase
+        sync : boolean, optional
+            Wait until the entry is written to disk
+        **values
+            Other values to save with the entry
+        """
+        entry = dict(values, phase=phase, time=time.time())
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+
+        with self.__lock:
+            with open(self.file_path, 'a+b') as f:
+
+                # Start a new line after a line that was only partly written
+                f.seek(0, os.SEEK_END)
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != '\n':
+                        line = '\n' + line
+
+                f.write(line)
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+
+            if self.__last_order_id is not None:
+                self.__last_order_id = max(self.__last_order_id, self.__order_id(entry))
+
+    def entries(self):
+        """
+        Read all the entries in the journal. A line that was only partly written,
+        because the process stopped, is ignored.
+
+        Returns
+        -------
+        list
+            A list of entry dicts, oldest first
+        """
+        entries = []
+        if not os.path.exists(self.file_path):
+            return entries
+
+        with self.__lock:
+            with open(self.file_path, 'rb') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        pass
+        return entries
+
+    def last_order_id(self):
+        """
+        Get the newest order ID known to the journal: the newest order that was confirmed, or the
+        `last_order_id` of an order that was started after it. That way the ID is carried forward
+        when an order that was interrupted is placed again.
+
+        Returns
+        -------
+        int
+            The order ID, or 0 if no order was confirmed
+        """
+        if self.__last_order_id is None:
+            self.__last_order_id = max([0] + [self.__order_id(entry) for entry in self.entries()])
+        return self.__last_order_id
+
+    def __order_id(self, entry):
+        """
+        The order ID an entry knows about, or 0
+        """
+        if entry['phase'] == 'confirmed':
+            return entry.get('order_id') or 0
+        if entry['phase'] == 'begin':
+            return entry.get('last_order_id') or 0
+        return 0
+
+    def last_order(self):
+        """
+        Get the entries of the last order that was started
+
+        Returns
+        -------
+        list
+            The entries from the last ``begin`` entry on, or an empty list
+        """
+        entries = self.entries()
+        for i in range(len(entries) - 1, -1, -1):
+            if entries[i]['phase'] == 'begin':
+                return entries[i:]
+        return []
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+
+"""
+Collect request and order metrics from the LendingClub API and export them
+in the `Prometheus <http://prometheus.io/>`_ text format.
+"""
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2013 Jeremy Gillick
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import os
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+class MetricsRegistry:
+    """
+    A thread-safe registry of counters and histograms.
+
+    Attach it to a session with :func:`lendingclub.session.Session.set_metrics()` to collect
+    request counts, errors and latencies per endpoint, along with the number of loans staged
+    and orders placed.
+
+    Parameters
+    ----------
+    prefix : string, optional
+        The prefix added to every metric name
+    buckets : list, optional
+        The upper bounds, in seconds, of the latency histogram buckets
+
+    Examples
+    --------
+
+        >>> from lendingclub import LendingClub
+        >>> from lendingclub.metrics import MetricsRegistry
+        >>> lc = LendingClub(email='test@test.com', password='secret123')
+        >>> metrics = MetricsRegistry()
+        >>> lc.session.set_metrics(metrics)
+        >>> lc.authenticate()
+        True
+        >>> metrics.serve(9100)                     # Scrape from http://127.0.0.1:9100/metrics
+        >>> metrics.write('/tmp/lendingclub.prom')  # Or write to a file for the node exporter
+    """
+
+    prefix = 'lendingclub'
+
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    """ The default latency histogram buckets, in seconds """
+
+    __counters = None
+    __histograms = None
+    __help = None
+    __lock = None
+    __server = None
+
+    def __init__(self, prefix='lendingclub', buckets=None):
+        self.prefix = prefix
+        if buckets is not None:
+            self.buckets = tuple(sorted(buckets))
+
+        self.__counters = {}
+        self.__histograms = {}
+        self.__help = {}
+        self.__lock = threading.Lock()
+
+        self.describe('requests_total', 'HTTP requests sent to LendingClub, by endpoint and status code')
+        self.describe('request_errors_total', 'Failed HTTP requests (network and server errors), by endpoint')
+        self.describe('request_duration_seconds', 'HTTP request latency, by endpoint')
+        self.describe('response_parse_seconds', 'Time spent parsing responses, by endpoint')
+        self.describe('request_queue_wait_seconds', 'Time requests waited for a free slot in the session scheduler, by priority')
+        self.describe('order_phase_seconds', 'Time spent in each phase of placing an order')
+        self.describe('response_wire_bytes_total', 'Response bytes received from LendingClub before decompressing, by endpoint')
+        self.describe('response_body_bytes_total', 'Response bytes after decompressing, by endpoint')
+        self.describe('loans_staged_total', 'Loans staged for investment orders')
+        self.describe('orders_placed_total', 'Investment orders placed')
+
+    def __key(self, name, labels):
+        """
+        Get the registry key for a metric name and labels
+        """
+        if self.prefix:
+            name = '{0}_{1}'.format(self.prefix, name)
+        if labels:
+            labels = tuple(sorted(labels.items()))
+        else:
+            labels = ()
+        return (name, labels)
+
+    def describe(self, name, help_text):
+        """
+        Set the help text for a metric
+
+        Parameters
+        ----------
+        name : string
+            The metric name, without the prefix
+        help_text : string
+            The description of the metric
+        """
+        self.__help[self.__key(name, None)[0]] = help_text
+
+    def inc(self, name, value=1, labels=None):
+        """
+        Increment a counter
+
+        Parameters
+        ----------
+        name : string
+            The metric name, without the prefix
+        value : int, optional
+            How much to increment the counter by
+        labels : dict, optional
+            The labels for this series
+        """
+        key = self.__key(name, labels)
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        """
+        Add an observation to a histogram
+
+        Parameters
+        ----------
+        name : string
+            The metric name, without the prefix
+        value : float
+            The observed value
+        labels : dict, optional
+            The labels for this series
+        """
+        key = self.__key(name, labels)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+                self.__histograms[key] = histogram
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def value(self, name, labels=None):
+        """
+        Get the current value of a counter, or the observation count of a histogram
+
+        Parameters
+        ----------
+        name : string
+            The metric name, without the prefix
+        labels : dict, optional
+            The labels for this series
+
+        Returns
+        -------
+        number
+        """
+        key = self.__key(name, labels)
+        with self.__lock:
+            if key in self.__histograms:
+                return self.__histograms[key]['count']
+            return self.__counters.get(key, 0)
+
+    def reset(self):
+        """
+        Remove all recorded values
+        """
+        with self.__lock:
+            self.__counters = {}
+            self.__histograms = {}
+
+    def timing_hook(self, timing):
+        """
+        A :func:`lendingclub.session.Session.add_timing_hook()` hook that records request metrics.
+        This is registered for you by :func:`lendingclub.session.Session.set_metrics()`.
+        """
+        labels = {'method': timing['method'], 'path': timing['path'].split('?')[0]}
+
+        # The parse stage only adds the parse time
+        if timing['stage'] == 'parse':
+            self.observe('response_parse_seconds', timing['parse'], labels)
+            return
+
+        if timing['error'] is not None or timing['status'] >= 500:
+            self.inc('request_errors_total', 1, labels)
+
+        if timing['status'] is not None:
+            self.inc('requests_total', 1, dict(labels, status=str(timing['status'])))
+            self.observe('request_duration_seconds', timing['total'], labels)
+
+        if timing.get('wait') is not None:
+            self.observe('request_queue_wait_seconds', timing['wait'], {'priority': timing['priority']})
+
+        if timing.get('wire_bytes') is not None:
+            self.inc('response_wire_bytes_total', timing['wire_bytes'], labels)
+            self.inc('response_body_bytes_total', timing['body_bytes'], labels)
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text exposition format
+
+        Returns
+        -------
+        string
+        """
+        with self.__lock:
+            counters = sorted(self.__counters.items())
+            histograms = sorted((key, dict(h, buckets=list(h['buckets']))) for key, h in self.__histograms.items())
+
+        lines = []
+        last_name = None
+        for (name, labels), value in counters:
+            if name != last_name:
+                self.__header(lines, name, 'counter')
+                last_name = name
+            lines.append('{0}{1} {2}'.format(name, self.__labels(labels), self.__number(value)))
+
+        for (name, labels), histogram in histograms:
+            if name != last_name:
+                self.__header(lines, name, 'histogram')
+                last_name = name
+
+            for i, bound in enumerate(self.buckets):
+                bucket_labels = labels + (('le', self.__number(bound)),)
+                lines.append('{0}_bucket{1} {2}'.format(name, self.__labels(bucket_labels), histogram['buckets'][i]))
+            lines.append('{0}_bucket{1} {2}'.format(name, self.__labels(labels + (('le', '+Inf'),)), histogram['count']))
+            lines.append('{0}_sum{1} {2}'.format(name, self.__labels(labels), self.__number(histogram['sum'])))
+            lines.append('{0}_count{1} {2}'.format(name, self.__labels(labels), histogram['count']))
+
+        if not lines:
+            return ''
+        return '\n'.join(lines) + '\n'
+
+    def __header(self, lines, name, metric_type):
+        """
+        Add the HELP and TYPE lines for a metric
+        """
+        if name in self.__help:
+            help_text = self.__help[name].replace('\\', '\\\\').replace('\n', '\\n')
+            lines.append('# HELP {0} {1}'.format(name, help_text))
+        lines.append('# TYPE {0} {1}'.format(name, metric_type))
+
+    def __labels(self, labels):
+        """
+        Format label pairs as {name="value",...}
+        """
+        if not labels:
+            return ''
+        pairs = []
+        for name, value in labels:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append('{0}="{1}"'.format(name, value))
+        return '{' + ','.join(pairs) + '}'
+
+    def __number(self, value):
+        """
+        Format a number without unnecessary decimals
+        """
+        if type(value) is float and value.is_integer():
+            value = int(value)
+        return repr(value)
+
+    def write(self, file_path):
+        """
+        Write the metrics to a file. The file is replaced in one step, so a scraper
+        never reads a partially written file.
+
+        Parameters
+        ----------
+        file_path : string
+            The file to write to
+        """
+        temp_path = '{0}.tmp'.format(file_path)
+        with open(temp_path, 'w') as f:
+            f.write(self.render())
+        os.rename(temp_path, file_path)
+
+    def serve(self, port=9100, host='127.0.0.1'):
+        """
+        Serve the metrics over HTTP from a background thread, at any path.
+
+        Parameters
+        ----------
+        port : int, optional
+            The port to listen on. Pass 0 to pick any free port.
+        host : string, optional
+            The address to listen on.
+
+        Returns
+        -------
+        int
+            The port the server is listening on
+        """
+        if self.__server is not None:
+            return self.__server.server_address[1]
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                output = registry.render()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(output)))
+                self.end_headers()
+                self.wfile.write(output)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.__server = HTTPServer((host, port), MetricsHandler)
+        thread = threading.Thread(target=self.__server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return self.__server.server_address[1]
+
+    def stop(self):
+        """
+        Stop the HTTP server started with :func:`serve()`
+        """
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
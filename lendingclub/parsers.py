@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+
+"""
+Parsers for the HTML pages and JSON responses returned from LendingClub.
+
+The library only needs to find a few elements in each HTML page (the login errors,
+the struts token and the order ID), so the default HTML parser stops reading the page
+at the first match, instead of building a full document tree.
+
+JSON responses are decoded with the fastest JSON library that's installed, or
+parsed incrementally as they're downloaded, for large lists of loans.
+"""
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2013 Jeremy Gillick
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import re
+import json
+import codecs
+from bs4 import BeautifulSoup
+from HTMLParser import HTMLParser, HTMLParseError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+VOID_ELEMENTS = frozenset(['area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+                           'keygen', 'link', 'meta', 'param', 'source', 'track', 'wbr'])
+
+# Attributes that BeautifulSoup splits into a list of values
+MULTI_VALUED_ATTRIBUTES = frozenset(['class', 'rel', 'rev', 'accept-charset', 'headers', 'accesskey', 'dropzone'])
+
+
+def normalize_newlines(text):
+    """
+    Convert CRLF and CR newlines to LF, like an HTML5 parser does
+    """
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def json_decoders():
+    """
+    Get all the JSON decoders that are installed, fastest first
+
+    Returns
+    -------
+    list
+        A list of (name, function) tuples. Each function takes a JSON string and returns the decoded value.
+    """
+    decoders = []
+    if orjson is not None:
+        decoders.append(('orjson', orjson.loads))
+    if ujson is not None:
+        decoders.append(('ujson', ujson.loads))
+    decoders.append(('json', json.loads))
+    return decoders
+
+
+def json_decoder(name=None):
+    """
+    Get a JSON decoder function
+
+    Parameters
+    ----------
+    name : {orjson, ujson, json}, optional
+        The name of the JSON library to use. If not set, the fastest one that's installed is used.
+
+    Returns
+    -------
+    function
+        A function that takes a JSON string and returns the decoded value
+    """
+    decoders = json_decoders()
+    if name is None:
+        return decoders[0][1]
+
+    for decoder_name, decoder in decoders:
+        if decoder_name == name:
+            return decoder
+    raise ValueError('The JSON library {0} is not installed'.format(name))
+
+
+def iter_json_array(chunks, key):
+    """
+    Incrementally parse the items of a JSON array out of a stream of chunks, without
+    loading the whole document. Each item is yielded as soon as it has been downloaded.
+
+    Only the first array named `key` is parsed, wherever it is in the document. The rest
+    of the document is skipped.
+
+    Parameters
+    ----------
+    chunks : iterable
+        The JSON document, as an iterable of UTF-8 byte strings (or unicode strings)
+    key : string
+        The name of the array, i.e. `loans` for `{"searchresult": {"loans": [...]}}`
+
+    Returns
+    -------
+    generator
+        The decoded array items. Nothing is yielded if the document doesn't have the array.
+
+    Raises
+    ------
+    ValueError
+        If the document ends in the middle of the array or an item is not valid JSON
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    start = re.compile(r'"{0}"\s*:\s*\['.format(re.escape(key)))
+
+    def read():
+        for chunk in chunks:
+            if type(chunk) is not unicode:
+                chunk = utf8.decode(chunk)
+            if chunk:
+                return chunk
+        return None
+
+    # Find the start of the array, keeping enough of the last chunk to match a key split between chunks
+    buf = u''
+    while True:
+        chunk = read()
+        if chunk is None:
+            return
+        buf += chunk
+        match = start.search(buf)
+        if match is not None:
+            buf = buf[match.end():]
+            break
+        buf = buf[-(len(key) + 64):]
+
+    pos = 0
+    done = False
+    while True:
+        while pos < len(buf) and buf[pos] in u' \t\r\n,':
+            pos += 1
+
+        if pos < len(buf):
+            if buf[pos] == u']':
+                return
+
+            # An item that runs to the end of the buffer might be cut off (i.e. a number), so wait for more
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                if end < len(buf) or done:
+                    yield item
+                    pos = end
+                    continue
+            except ValueError:
+                if done:
+                    raise
+
+        if done:
+            raise ValueError('The JSON document ended before the end of the "{0}" array'.format(key))
+
+        # Read more, dropping the items that have already been parsed
+        chunk = read()
+        if chunk is None:
+            done = True
+        else:
+            buf = buf[pos:] + chunk
+            pos = 0
+
+
+class SoupParser:
+    """
+    Parses the whole page with BeautifulSoup and html5lib. This is the slowest parser,
+    but it handles broken HTML the same way a browser would.
+    """
+
+    def parse(self, markup):
+        """
+        Parse an HTML page into a document that can be passed to :func:`find()`
+
+        Parameters
+        ----------
+        markup : string
+            The HTML page
+
+        Returns
+        -------
+        object
+            The parsed document
+        """
+        return BeautifulSoup(markup, 'html5lib')
+
+    def find(self, document, name=None, attrs=None, text=False):
+        """
+        Find the first element in the document that matches the tag name and attributes
+
+        Parameters
+        ----------
+        document : object
+            A document returned from :func:`parse()`
+        name : string, optional
+            The tag name to match
+        attrs : dict, optional
+            Attribute values to match
+        text : boolean, optional
+            Include the text content of the element
+
+        Returns
+        -------
+        dict
+            A dict with the tag `name`, `attrs` and `text` of the element, or None if nothing matched
+        """
+        tag = document.find(name, attrs or {})
+        if tag is None:
+            return None
+
+        element_attrs = {}
+        for key, value in tag.attrs.items():
+            if type(value) is list:
+                value = ' '.join(value)
+            element_attrs[key] = value
+
+        return {
+            'name': tag.name,
+            'attrs': element_attrs,
+            'text': tag.text if text else None
+        }
+
+
+class FastParser:
+    """
+    Streams through the page with the standard library HTMLParser and stops at the
+    first matching element. If the page can't be parsed, it falls back to :class:`SoupParser`.
+    """
+
+    fallback = None
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback or SoupParser()
+
+    def parse(self, markup):
+        """
+        The page is parsed on each call to :func:`find()`, so this returns the markup as-is.
+        """
+        return markup
+
+    def find(self, document, name=None, attrs=None, text=False):
+        """
+        Find the first element in the page that matches the tag name and attributes.
+        See :func:`SoupParser.find()`
+        """
+        finder = _ElementFinder(name, attrs or {}, text)
+        try:
+            finder.feed(document)
+            finder.close()
+        except _Found:
+            pass
+        except HTMLParseError:
+            return self.fallback.find(self.fallback.parse(document), name, attrs, text)
+
+        return finder.element
+
+
+class _Found(Exception):
+    """
+    Raised by _ElementFinder to stop parsing
+    """
+    pass
+
+
+class _ElementFinder(HTMLParser):
+    """
+    Finds the first element matching a tag name and attributes
+    """
+
+    def __init__(self, name, attrs, text):
+        HTMLParser.__init__(self)
+        self.match_name = name
+        self.match_attrs = attrs
+        self.match_text = text
+
+        self.element = None
+        self.depth = 0
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.element is not None:
+            if tag not in VOID_ELEMENTS:
+                self.depth += 1
+            return
+
+        if self.match_name is not None and tag != self.match_name:
+            return
+
+        attrs = dict((key, normalize_newlines(value) if value is not None else '') for key, value in attrs)
+        for key, value in self.match_attrs.items():
+            if attrs.get(key) != value:
+                return
+
+        # Match the whitespace BeautifulSoup leaves in multi-valued attributes
+        for key in MULTI_VALUED_ATTRIBUTES.intersection(attrs):
+            attrs[key] = ' '.join(attrs[key].split())
+
+        self.element = {'name': tag, 'attrs': attrs, 'text': None}
+        if not self.match_text or tag in VOID_ELEMENTS:
+            self.finish()
+        self.depth = 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if self.element is not None and tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.element is None:
+            return
+
+        self.depth -= 1
+        if self.depth <= 0:
+            self.finish()
+
+    def handle_data(self, data):
+        if self.element is not None:
+            self.text.append(data)
+
+    def handle_entityref(self, name):
+        self.handle_data(self.unescape('&{0};'.format(name)))
+
+    def handle_charref(self, name):
+        self.handle_data(self.unescape('&#{0};'.format(name)))
+
+    def close(self):
+        HTMLParser.close(self)
+
+        # The page ended before the element was closed
+        if self.element is not None:
+            self.finish()
+
+    def finish(self):
+        """
+        Stop parsing, the element has been found
+        """
+        if self.match_text:
+            self.element['text'] = normalize_newlines(u''.join(self.text))
+        raise _Found()
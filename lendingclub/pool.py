@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+
+"""
+Manage many LendingClub accounts at once. Each account has its own login and cookies,
+but they share one connection pool and one rate limit.
+"""
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2013 Jeremy Gillick
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from lendingclub import LendingClub, LendingClubError
+from lendingclub.session import CircuitBreaker, RequestScheduler, SessionError
+
+
+class RateLimiter:
+    """
+    A thread-safe token bucket that limits how many requests are sent per second.
+    Set it as the :attr:`lendingclub.session.Session.rate_limiter` of one or more sessions.
+
+    Parameters
+    ----------
+    rate : float
+        The number of requests allowed per second, on average
+    burst : int, optional
+        The number of requests that can be sent at once, after being idle
+    """
+
+    rate = None
+    burst = None
+    __tokens = None
+    __updated = None
+    __lock = None
+
+    def __init__(self, rate, burst=1):
+        assert rate > 0, 'rate must be greater than zero'
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self.__tokens = float(self.burst)
+        self.__updated = time.time()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Wait until a request can be sent
+
+        Returns
+        -------
+        float
+            The number of seconds spent waiting
+        """
+        waited = 0
+        while True:
+            with self.__lock:
+                now = time.time()
+                self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+                self.__updated = now
+
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return waited
+                wait = (1 - self.__tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+
+class SessionPool:
+    """
+    A pool of authenticated LendingClub accounts.
+
+    Every account keeps its own session and cookies, but they all send requests through
+    one shared connection pool (:attr:`adapter`), :attr:`scheduler` and :class:`RateLimiter`. Logins are
+    staggered so the accounts don't all log in at the same moment.
+
+    Calls that don't depend on the account, like :func:`search()`, are sent from any healthy
+    account, and move on to the next account if one fails. For account-specific calls, get the
+    account's :class:`lendingclub.LendingClub` object with :func:`account()`.
+
+    Parameters
+    ----------
+    rate : float, optional
+        The maximum number of requests per second across all accounts. No limit by default.
+    burst : int, optional
+        The number of requests that can be sent at once, when the pool has been idle
+    pool_maxsize : int, optional
+        The maximum number of connections kept open to LendingClub, shared by all accounts
+    login_interval : float, optional
+        Seconds between the start of each account's login
+    logger : `Logger <http://docs.python.org/2/library/logging.html>`_, optional
+        A python logger used to get debugging output
+
+    Examples
+    --------
+
+        >>> from lendingclub.pool import SessionPool
+        >>> pool = SessionPool(rate=5)
+        >>> pool.add_account('one@test.com', 'secret123')
+        >>> pool.add_account('two@test.com', 'secret456')
+        >>> pool.authenticate()
+        {'one@test.com': None, 'two@test.com': None}
+        >>> loans = pool.search()                                  # From any account
+        >>> cash = pool.account('two@test.com').get_cash_balance()  # From this account
+    """
+
+    adapter = None
+    """ The `requests` adapter that holds the shared connection pool """
+
+    rate_limiter = None
+    """ The :class:`RateLimiter` shared by all accounts, or None """
+
+    scheduler = None
+    """ The :class:`lendingclub.session.RequestScheduler` shared by all accounts, so high priority
+    requests from any account are sent first """
+
+    login_interval = 1
+    """ Seconds between the start of each account's login """
+
+    __accounts = None
+    __errors = None
+    __lock = None
+    __logger = None
+    __next = 0
+
+    def __init__(self, rate=None, burst=1, pool_maxsize=10, login_interval=1, logger=None):
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.scheduler = RequestScheduler(pool_maxsize)
+        if rate is not None:
+            self.rate_limiter = RateLimiter(rate, burst)
+        self.login_interval = login_interval
+
+        self.__accounts = OrderedDict()
+        self.__errors = {}
+        self.__lock = threading.Lock()
+        self.__logger = logger
+
+    def __log(self, message):
+        """
+        Log a debugging message
+        """
+        if self.__logger:
+            self.__logger.debug(message)
+
+    def add_account(self, email, password=None, session_file=None, transport=None):
+        """
+        Add an account to the pool. It's not logged in until :func:`authenticate()` is called.
+
+        Parameters
+        ----------
+        email : string
+            The account's email address
+        password : string, optional
+            The account's password
+        session_file : string, optional
+            The file to save the account's session to. (see :class:`lendingclub.session.Session`)
+        transport : :class:`lendingclub.transport.Transport`, optional
+            How the account's requests are sent
+
+        Returns
+        -------
+        :class:`lendingclub.LendingClub`
+            The account
+        """
+        lc = LendingClub(email, password, self.__logger, session_file, transport)
+        lc.session.http_adapter = self.adapter
+        lc.session.rate_limiter = self.rate_limiter
+        lc.session.scheduler = self.scheduler
+
+        with self.__lock:
+            self.__accounts[email] = lc
+            self.__errors[email] = SessionError('{0} has not logged in yet'.format(email))
+        return lc
+
+    def account(self, email):
+        """
+        Get an account, for calls that are specific to it (cash balance, orders, notes, etc)
+
+        Parameters
+        ----------
+        email : string
+            The account's email address
+
+        Returns
+        -------
+        :class:`lendingclub.LendingClub`
+        """
+        if email not in self.__accounts:
+            raise LendingClubError('{0} is not in the session pool'.format(email))
+        return self.__accounts[email]
+
+    def accounts(self):
+        """
+        Get the email addresses of every account in the pool, in the order they were added
+        """
+        return self.__accounts.keys()
+
+    def authenticate(self, emails=None):
+        """
+        Log in to all the accounts (or just some of them). Each login starts :attr:`login_interval`
+        seconds after the previous one, and they run in parallel.
+
+        Parameters
+        ----------
+        emails : list, optional
+            The accounts to log in to. All of them by default.
+
+        Returns
+        -------
+        dict
+            The error raised while logging in to each account, or None if the login worked
+        """
+        if emails is None:
+            emails = self.accounts()
+        results = {}
+
+        def login(email, delay):
+            time.sleep(delay)
+            try:
+                self.account(email).authenticate()
+                results[email] = None
+            except Exception as e:
+                self.__log('Could not log in to {0}: {1}'.format(email, str(e)))
+                results[email] = e
+
+            with self.__lock:
+                self.__errors[email] = results[email]
+
+        threads = []
+        for i, email in enumerate(emails):
+            thread = threading.Thread(target=login, args=(email, i * self.login_interval))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def is_healthy(self, email, path='/browse/browseNotesAj.action'):
+        """
+        Check if an account is logged in, and the circuit breaker for an endpoint isn't open
+
+        Parameters
+        ----------
+        email : string
+            The account's email address
+        path : string, optional
+            The endpoint that will be called
+
+        Returns
+        -------
+        boolean
+        """
+        if self.__errors.get(email) is not None:
+            return False
+        return self.account(email).session.circuit_breaker(path).state != CircuitBreaker.OPEN
+
+    def healthy(self, path='/browse/browseNotesAj.action'):
+        """
+        Get the accounts that can send requests to an endpoint right now. (see :func:`is_healthy()`)
+
+        Returns
+        -------
+        list
+            A list of :class:`lendingclub.LendingClub` accounts
+        """
+        return [self.__accounts[email] for email in self.accounts() if self.is_healthy(email, path)]
+
+    def any_account(self, path='/browse/browseNotesAj.action'):
+        """
+        Get the next healthy account, taking turns between them
+
+        Parameters
+        ----------
+        path : string, optional
+            The endpoint that will be called
+
+        Returns
+        -------
+        :class:`lendingclub.LendingClub`
+
+        Raises
+        ------
+        LendingClubError
+            If no account is healthy
+        """
+        accounts = self.__in_turn(path)
+        if not accounts:
+            raise LendingClubError('None of the accounts in the session pool are available')
+        return accounts[0]
+
+    def __in_turn(self, path):
+        """
+        Get the healthy accounts, starting with the one whose turn it is
+        """
+        accounts = self.healthy(path)
+        if not accounts:
+            return accounts
+
+        with self.__lock:
+            start = self.__next % len(accounts)
+            self.__next += 1
+        return accounts[start:] + accounts[:start]
+
+    def search(self, filters=None, start_index=0, limit=100):
+        """
+        Search for notes from any healthy account. If the request fails, it's tried from the
+        next healthy account. (see :func:`lendingclub.LendingClub.search()`)
+
+        Raises
+        ------
+        LendingClubError
+            If no account is healthy
+        lendingclub.session.NetworkError
+            If the search failed from every account
+        """
+        accounts = self.__in_turn('/browse/browseNotesAj.action')
+        if not accounts:
+            raise LendingClubError('None of the accounts in the session pool are available')
+
+        error = None
+        for lc in accounts:
+            try:
+                return lc.search(filters, start_index, limit)
+            except SessionError as e:
+                self.__log('Search failed from {0}, trying the next account: {1}'.format(lc.session.email, str(e)))
+                error = e
+        raise error
@@ -30,13 +30,45 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
+import os
 import re
+import json
+import base64
+import hashlib
 import requests
 import getpass
+import threading
 import time as time
-from bs4 import BeautifulSoup
+import heapq
+import itertools
+from contextlib import contextmanager
+from collections import OrderedDict
+from lendingclub.parsers import FastParser, json_decoder, iter_json_array
+from lendingclub.transport import RequestsTransport
+from requests.cookies import create_cookie
 from requests.exceptions import *
 
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+    InvalidToken = ValueError
+
+# Responses can only be brotli compressed if urllib3 can decompress them
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# Request priorities, most urgent first (see Session.request)
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: 'high', PRIORITY_NORMAL: 'normal', PRIORITY_BULK: 'bulk'}
+
 
 class Session:
 
@@ -56,12 +88,122 @@ class Session:
     last_request_time = 0
     """ The timestamp of the last HTTP request """
 
-    __session = None
+    circuit_breaker_threshold = 5
+    """ The number of consecutive failures before an endpoint's circuit breaker opens.
+    While open, requests to that endpoint fail immediately with a :class:`NetworkError`."""
+
+    circuit_breaker_latency = None
+    """ Seconds. Responses slower than this are counted as failures by the circuit breaker.
+    Set to None to only count network errors and server errors."""
+
+    circuit_breaker_timeout = 30
+    """ Seconds an open circuit breaker waits before letting a probe request through """
+
+    session_file = None
+    """ Path to a file where the authenticated session is saved, encrypted with the account password.
+    When set, :func:`authenticate()` will resume the saved session instead of logging in again, as long
+    as it's still valid. Requires the `cryptography <https://cryptography.io/>`_ package; without it, a warning
+    is logged and the session isn't saved."""
+
+    metrics = None
+    """ The :class:`lendingclub.metrics.MetricsRegistry` that requests are recorded to (see :func:`set_metrics()`)"""
+
+    cache = None
+    """ The :class:`ResponseCache` for GET requests. Nothing is cached until endpoints are
+    added with :func:`ResponseCache.cache_endpoint()` or :func:`enable_cache()`."""
+
+    coalesce_requests = True
+    """ Share the response of identical idempotent requests that are sent at the same time
+    from different threads. (see :func:`request()`)"""
+
+    coalesced_hits = 0
+    """ The number of requests that were answered by another identical request that was in progress """
+
+    html_parser = None
+    """ The parser used to find elements in HTML pages, :class:`lendingclub.parsers.FastParser` by default.
+    Set to :class:`lendingclub.parsers.SoupParser` to parse every page with BeautifulSoup and html5lib."""
+
+    json_decoder = None
+    """ The function used to decode JSON responses in :func:`json()`. Defaults to the fastest
+    JSON library that's installed (orjson, ujson or the standard library).
+    See :func:`lendingclub.parsers.json_decoder()`"""
+
+    transport = None
+    """ Sends the HTTP requests, :class:`lendingclub.transport.RequestsTransport` by default.
+    (see :func:`set_transport()`)"""
 
-    def __init__(self, email=None, password=None, logger=None):
+    timeout = (10, 60)
+    """ The default (connect, read) timeouts of each request, in seconds. (see :func:`set_endpoint_timeout()`)"""
+
+    http_adapter = None
+    """ A `requests` transport adapter mounted on the HTTP session, so several sessions can share
+    one connection pool. (see :class:`lendingclub.pool.SessionPool`) Takes effect on the next :func:`authenticate()`."""
+
+    scheduler = None
+    """ The :class:`RequestScheduler` that limits how many requests are sent at once, and decides
+    which waiting request goes next, by priority. (see :func:`request()`)"""
+
+    rate_limiter = None
+    """ An object with an `acquire()` method that's called before each request is sent, and blocks
+    until the request is allowed. (see :class:`lendingclub.pool.RateLimiter`)"""
+
+    accept_encoding = None
+    """ The compression formats to ask for in the Accept-Encoding header: gzip and deflate, plus brotli when
+    the brotli package is installed. Set to 'identity' to turn off compression. Takes effect on the
+    next :func:`authenticate()`."""
+
+    stream_chunk_size = 8192
+    """ The number of bytes read at a time from streamed responses (see :func:`iter_json()`)"""
+
+    keepalive_margin = 1
+    """ Minutes before :attr:`session_timeout` that the keepalive thread refreshes the session
+    (see :func:`start_keepalive()`)"""
+
+    prewarm_connections = 4
+    """ The number of connections :func:`prewarm()` opens by default """
+
+    prewarm_lead = 5
+    """ Seconds before a burst window starts that its connections are opened (see :func:`add_burst_window()`)"""
+
+    staged_loans = None
+    """ The amount of each loan that's staged on this session's order, as far as :class:`lendingclub.Order` knows,
+    so only the difference is staged when an order changes. Emptied by :func:`clear_session_order()` and when an
+    order is placed. None when it's not known, like after logging in, and the order is cleared before staging."""
+
+    __session = None
+    __breakers = None
+    __auth_lock = None
+    __keepalive_stop = None
+    __timing_hooks = None
+    __flights = None
+    __flights_lock = None
+    __priority = None
+    __deadline = None
+    __timeouts = None
+    __burst_timers = None
+    __warned_persist = False
+
+    def __init__(self, email=None, password=None, logger=None, session_file=None, transport=None):
         self.email = email
         self.__pass = password
         self.__logger = logger
+        self.__breakers = {}
+        self.__auth_lock = threading.RLock()
+        self.__timing_hooks = []
+        self.__flights = {}
+        self.__flights_lock = threading.Lock()
+        self.__priority = threading.local()
+        self.__deadline = threading.local()
+        self.__timeouts = {}
+        self.__burst_timers = []
+        self.scheduler = RequestScheduler()
+        self.coalesced_hits = 0
+        self.cache = ResponseCache()
+        self.html_parser = FastParser()
+        self.json_decoder = json_decoder()
+        self.set_transport(transport)
+        self.accept_encoding = 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
+        self.session_file = session_file
 
     def __log(self, message):
         """
@@ -76,13 +218,23 @@ class Session:
         session timeout limit. If it's been too long since the last request
         attempt to authenticate again.
         """
+        if not self.__timed_out():
+            return
+
+        # Check again once we have the lock, another thread might have already authenticated
+        with self.__auth_lock:
+            if self.__timed_out():
+                self.__log('Session timed out, attempting to authenticate')
+                self.authenticate()
+
+    def __timed_out(self):
+        """
+        Returns True if it's been longer than the session timeout since the last request
+        """
         now = time.time()
         diff = abs(now - self.last_request_time)
         timeout_sec = self.session_timeout * 60  # convert minutes to seconds
-
-        if diff >= timeout_sec:
-            self.__log('Session timed out, attempting to authenticate')
-            self.authenticate()
+        return diff >= timeout_sec
 
     def set_logger(self, logger):
         """
@@ -96,6 +248,109 @@ class Session:
         """
         self.__logger = logger
 
+    def add_timing_hook(self, hook):
+        """
+        Register a function that will be called with the timing breakdown of every request.
+
+        The hook is passed a dict with the `method` and `path` of the request, its `priority` ('high',
+        'normal' or 'bulk'), the `status` code (or the `error` that was raised) and these timings, in seconds:
+
+        * `queue` -- Time spent before the request was sent (checking the session, circuit breaker, etc)
+        * `wait` -- The part of the queue time spent waiting for a free :attr:`scheduler` slot
+        * `connect` -- Time to connect to the server, when available (otherwise None)
+        * `ttfb` -- Time from sending the request to receiving the response headers
+        * `download` -- Time to download the response body
+        * `parse` -- Time to parse the response
+        * `total` -- Total time of the request
+
+        Along with the size of the response body, which is None for streamed responses:
+
+        * `encoding` -- The Content-Encoding of the response (i.e. gzip), or None if it wasn't compressed
+        * `wire_bytes` -- Bytes received from the server, before decompressing
+        * `body_bytes` -- Bytes in the body, after decompressing
+
+        Hooks are called once with `stage` set to 'request' when the response has been downloaded,
+        and again with a copy that has `stage` set to 'parse' (and `parse` filled in) each time the
+        response is parsed with :func:`json()`. The request timing is also available on the response
+        as `response.timing`.
+
+        Parameters
+        ----------
+        hook : function
+            A function that takes the timing dict as its only argument.
+        """
+        self.__timing_hooks.append(hook)
+
+    def remove_timing_hook(self, hook):
+        """
+        Remove a hook added with :func:`add_timing_hook()`
+        """
+        if hook in self.__timing_hooks:
+            self.__timing_hooks.remove(hook)
+
+    def set_transport(self, transport):
+        """
+        Set the transport that sends the HTTP requests. Use a :class:`lendingclub.transport.RecordingTransport`
+        or :class:`lendingclub.transport.ReplayTransport` to record requests to a file or replay them without
+        a network connection, or an :class:`lendingclub.transport.InMemoryTransport` to run against a fake server.
+
+        Parameters
+        ----------
+        transport : :class:`lendingclub.transport.Transport`
+            The transport to use. Set to None to send requests over HTTP.
+        """
+        if transport is None:
+            transport = RequestsTransport()
+        assert callable(getattr(transport, 'send', None)), 'transport must implement lendingclub.transport.Transport'
+        self.transport = transport
+
+    def set_metrics(self, metrics):
+        """
+        Record request counts, errors and latencies to a metrics registry.
+        Set to None to stop recording.
+
+        Parameters
+        ----------
+        metrics : :class:`lendingclub.metrics.MetricsRegistry`
+            The registry to record to
+        """
+        if self.metrics is not None:
+            self.remove_timing_hook(self.metrics.timing_hook)
+
+        self.metrics = metrics
+        if metrics is not None:
+            self.add_timing_hook(metrics.timing_hook)
+
+    def enable_cache(self, cash_ttl=10, portfolios_ttl=300, filters_ttl=300):
+        """
+        Cache the responses of the read-only endpoints that are called most often.
+        The cached values are invalidated when they're changed through this API (for example,
+        placing an order invalidates the cash balance), but not when they change on the site.
+
+        Parameters
+        ----------
+        cash_ttl : int, optional
+            Seconds to cache the cash balance
+        portfolios_ttl : int, optional
+            Seconds to cache the portfolio list
+        filters_ttl : int, optional
+            Seconds to cache the saved filters
+        """
+        self.cache.cache_endpoint('/browse/cashBalanceAj.action', cash_ttl, 1)
+        self.cache.cache_endpoint('/data/portfolioManagement', portfolios_ttl, 1)
+        self.cache.cache_endpoint('/browse/getSavedFiltersAj.action', filters_ttl, 1)
+        self.cache.cache_endpoint('/browse/getSavedFilterAj.action', filters_ttl, 32)
+
+    def __send_timing(self, timing):
+        """
+        Pass the timing dict to all the hooks
+        """
+        for hook in list(self.__timing_hooks):
+            try:
+                hook(timing)
+            except Exception as e:
+                self.__log('Timing hook failed: {0}'.format(str(e)))
+
     def build_url(self, path):
         """
         Build a LendingClub URL from a URL path (without the domain).
@@ -109,6 +364,27 @@ class Session:
         url = re.sub('([^:])//', '\\1/', url)  # Remove double slashes
         return url
 
+    def circuit_breaker(self, path):
+        """
+        Get the circuit breaker for an endpoint. Each endpoint path (without the query string)
+        has its own breaker, which is created the first time it's requested.
+
+        Parameters
+        ----------
+        path : string
+            The path part of the URL after the domain.
+
+        Returns
+        -------
+        :class:`CircuitBreaker`
+        """
+        key = '/' + path.split('?')[0].strip('/')
+        breaker = self.__breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(self.circuit_breaker_threshold, self.circuit_breaker_latency, self.circuit_breaker_timeout)
+            breaker = self.__breakers.setdefault(key, breaker)
+        return breaker
+
     def authenticate(self, email=None, password=None):
         """
         Authenticate with LendingClub and preserve the user session for future requests.
@@ -156,14 +432,24 @@ class Session:
             password = getpass.getpass()
             self.__pass = password
 
+        with self.__auth_lock:
+            return self.__authenticate(email, password)
+
+    def __authenticate(self, email, password):
+        """
+        Authenticate with LendingClub. Call this from :func:`authenticate()`, which holds the auth lock.
+        """
+        self.staged_loans = None
+
+        # Pick up where the last process left off
+        if self.__persist_session() and self.resume_session():
+            return True
+
         self.__log('Attempting to authenticate: {0}'.format(self.email))
 
         # Start session
-        self.__session = requests.Session()
-        self.__session.headers = {
-            'Referer': 'https://www.lendingclub.com/',
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8_3) AppleWebKit/537.31 (KHTML, like Gecko) Chrome/26.0.1410.65 Safari/537.31'
-        }
+        self.__start_http_session()
+        self.cache.invalidate()
 
         # Set last request time to now
         self.last_request_time = time.time()
@@ -193,10 +479,9 @@ class Session:
             self.__log('Data: {0}'.format(response.headers['x-echo-data']))
 
         # Parse any errors from the HTML
-        soup = BeautifulSoup(response.text, "html5lib")
-        errors = soup.find(id='master_error-list')
+        errors = self.find_html(response, attrs={'id': 'master_error-list'}, text=True)
         if errors:
-            errors = errors.text.strip()
+            errors = errors['text'].strip()
 
             # Remove extra spaces and newlines from error message
             errors = re.sub('\t+', '', errors)
@@ -213,6 +498,225 @@ class Session:
         if endpoint == 'login.action':
             raise AuthenticationError('Unknown! Redirected back to the login page without an error message')
 
+        if self.__persist_session():
+            self.save_session()
+
+        return True
+
+    def keepalive(self):
+        """
+        Refresh the session on the server with a cheap request, and authenticate again in
+        case the server has ended it anyways.
+        """
+        response = self.get('/account/summary.action', redirects=False)
+
+        # Redirected to the login page
+        if response.status_code != 200:
+            self.__log('Keepalive found the session has ended, attempting to authenticate')
+            self.authenticate()
+        else:
+            self.__log('Keepalive refreshed the session')
+
+        if self.__persist_session():
+            self.save_session()
+
+    def start_keepalive(self, interval=30):
+        """
+        Start a background thread which keeps the session alive by calling :func:`keepalive()`
+        shortly before :attr:`session_timeout` is reached. This way, time-critical requests never
+        have to wait on authentication after the session has been idle.
+
+        Parameters
+        ----------
+        interval : int, optional
+            The maximum number of seconds between checks, and how long to wait before trying
+            again if the keepalive request fails.
+        """
+        if self.__keepalive_stop is not None:
+            return
+
+        stop = threading.Event()
+        thread = threading.Thread(target=self.__keepalive_loop, args=(stop, interval))
+        thread.daemon = True
+
+        self.__keepalive_stop = stop
+        thread.start()
+
+    def stop_keepalive(self):
+        """
+        Stop the keepalive thread started with :func:`start_keepalive()`
+        """
+        if self.__keepalive_stop is not None:
+            self.__keepalive_stop.set()
+            self.__keepalive_stop = None
+
+    def __keepalive_loop(self, stop, interval):
+        """
+        Run by the keepalive thread until it's stopped
+        """
+        while not stop.is_set():
+            refresh_at = self.last_request_time + (self.session_timeout - self.keepalive_margin) * 60
+            wait = refresh_at - time.time()
+
+            if wait > 0:
+                stop.wait(min(wait, interval))
+                continue
+
+            try:
+                self.keepalive()
+            except SessionError as e:
+                self.__log('Keepalive failed: {0}'.format(str(e)))
+                stop.wait(interval)
+
+    def __start_http_session(self):
+        """
+        Start a new HTTP session, without any cookies
+        """
+        self.__session = requests.Session()
+        self.__session.headers = {
+            'Accept': '*/*',
+            'Accept-Encoding': self.accept_encoding,
+            'Referer': 'https://www.lendingclub.com/',
+            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8_3) AppleWebKit/537.31 (KHTML, like Gecko) Chrome/26.0.1410.65 Safari/537.31'
+        }
+
+        # Share connections with other sessions
+        if self.http_adapter is not None:
+            self.__session.mount('https://', self.http_adapter)
+            self.__session.mount('http://', self.http_adapter)
+
+    def __persist_session(self):
+        """
+        Returns True if the session is saved to and resumed from :attr:`session_file`. Without the
+        cryptography package it can't be, so a warning is logged (once) and the session isn't persisted.
+        """
+        if self.session_file is None:
+            return False
+
+        if Fernet is None:
+            if not self.__warned_persist and self.__logger:
+                self.__logger.warning('The cryptography package is required to save and resume sessions, not using {0}'.format(self.session_file))
+            self.__warned_persist = True
+            return False
+
+        return True
+
+    def __session_cipher(self, salt):
+        """
+        Get the cipher used to encrypt the session file, with a key derived from the user's password
+        """
+        if Fernet is None:
+            raise SessionError('The cryptography package is required to save and resume sessions')
+
+        password = self.__pass
+        if type(password) is unicode:
+            password = password.encode('utf-8')
+
+        key = hashlib.pbkdf2_hmac('sha256', password, salt, 100000)
+        return Fernet(base64.urlsafe_b64encode(key))
+
+    def save_session(self, file_path=None):
+        """
+        Save the session cookies and the last request time to an encrypted file, so another
+        process can resume the session without logging in. This is called automatically after
+        authenticating when :attr:`session_file` is set, but you should also call it before your
+        program exits so the saved request time is current.
+
+        Parameters
+        ----------
+        file_path : string, optional
+            Where to save the session. Defaults to :attr:`session_file`.
+        """
+        file_path = file_path or self.session_file
+        assert file_path is not None, 'No session file was set'
+        assert self.__session is not None, 'There is no session to save, you need to authenticate first'
+
+        cookies = []
+        for cookie in self.__session.cookies:
+            cookies.append({
+                'name': cookie.name,
+                'value': cookie.value,
+                'domain': cookie.domain,
+                'path': cookie.path,
+                'expires': cookie.expires,
+                'secure': cookie.secure
+            })
+        state = json.dumps({
+            'email': self.email,
+            'last_request_time': self.last_request_time,
+            'cookies': cookies
+        })
+
+        salt = os.urandom(16)
+        token = self.__session_cipher(salt).encrypt(state.encode('utf-8'))
+        contents = json.dumps({
+            'salt': base64.b64encode(salt),
+            'session': token
+        })
+
+        # Only readable by the current user
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(contents)
+
+        self.__log('Saved session to {0}'.format(file_path))
+
+    def resume_session(self, file_path=None):
+        """
+        Restore a session saved with :func:`save_session()` and make sure it's still valid
+        with one request to the server.
+
+        Parameters
+        ----------
+        file_path : string, optional
+            The saved session file. Defaults to :attr:`session_file`.
+
+        Returns
+        -------
+        boolean
+            True if the session was resumed, False if you'll need to authenticate again.
+        """
+        file_path = file_path or self.session_file
+        if file_path is None or not os.path.exists(file_path):
+            return False
+        if Fernet is None:
+            self.__log('Cannot resume the saved session in {0} without the cryptography package'.format(file_path))
+            return False
+
+        # Decrypt
+        try:
+            with open(file_path) as f:
+                contents = json.loads(f.read())
+            salt = base64.b64decode(contents['salt'])
+            state = self.__session_cipher(salt).decrypt(contents['session'].encode('ascii'))
+            state = json.loads(state.decode('utf-8'))
+        except (ValueError, KeyError, TypeError, InvalidToken) as e:
+            self.__log('Could not read the saved session in {0}: {1}'.format(file_path, repr(e)))
+            return False
+
+        if state['email'] != self.email:
+            self.__log('The saved session is for a different user')
+            return False
+
+        # Too old, don't bother checking it with the server
+        if time.time() - state['last_request_time'] >= self.session_timeout * 60:
+            self.__log('The saved session has expired')
+            return False
+
+        self.__start_http_session()
+        for cookie in state['cookies']:
+            self.__session.cookies.set_cookie(create_cookie(**cookie))
+        self.last_request_time = state['last_request_time']
+
+        # LendingClub redirects to the login page if the session is no longer valid
+        response = self.get('/account/summary.action', redirects=False)
+        if response.status_code != 200:
+            self.__log('The saved session is no longer valid')
+            self.__start_http_session()
+            self.last_request_time = 0
+            return False
+
+        self.__log('Resumed session for {0}'.format(self.email))
         return True
 
     def is_site_available(self):
@@ -220,22 +724,240 @@ class Session:
         Returns true if we can access LendingClub.com
         This is also a simple test to see if there's a network connection
 
+        This check has its own circuit breaker, so it returns False immediately while the
+        site is known to be down. When the site is reachable again, all open endpoint
+        breakers are moved to half-open so they can probe without waiting out their timeout.
+
         Returns
         -------
         boolean
             True or False
         """
+        breaker = self.circuit_breaker('/')
+        if not breaker.allow():
+            return False
+
         try:
-            response = requests.head(self.base_url)
+            start = time.time()
+            response = self.__head()
+            response.content  # Put the connection back in the pool
             status = response.status_code
-            return 200 <= status < 400  # Returns true if the status code is greater than 200 and less than 400
+            available = 200 <= status < 400  # Returns true if the status code is greater than 200 and less than 400
         except Exception:
-            return False
+            available = False
 
-    def request(self, method, path, query=None, data=None, redirects=True):
+        if available:
+            breaker.record_success(time.time() - start)
+            for other in self.__breakers.values():
+                other.half_open()
+        else:
+            breaker.record_failure()
+
+        return available
+
+    def __head(self):
+        """
+        Send a HEAD request for :attr:`base_url` through the session's connection pool, without
+        authenticating or reading the response
+        """
+        if self.__session is None:
+            self.__start_http_session()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        return self.transport.send(self.__session, 'HEAD', self.base_url, allow_redirects=False, timeout=self.timeout)
+
+    def prewarm(self, connections=None):
+        """
+        Open keep-alive connections to :attr:`base_url` ahead of time, so the next requests don't
+        have to wait for DNS, TCP and TLS setup.
+
+        A HEAD request is sent on each connection at the same time, and every response is held until all
+        of them have arrived, so each one needs its own connection. The connections then stay open in the
+        session's connection pool, which is shared with other sessions through :attr:`http_adapter`.
+
+        Parameters
+        ----------
+        connections : int, optional
+            The number of connections to open, :attr:`prewarm_connections` by default.
+            Connections beyond the pool's maximum size are closed again.
+
+        Returns
+        -------
+        int
+            The number of connections that are open and ready
+        """
+        if connections is None:
+            connections = self.prewarm_connections
+        responses = []
+
+        def head():
+            try:
+                responses.append(self.__head())
+            except Exception as e:
+                self.__log('Prewarm request failed: {0}'.format(str(e)))
+
+        start = time.time()
+        threads = []
+        for i in range(connections):
+            thread = threading.Thread(target=head)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        # Reading the responses puts their connections back in the pool
+        ready = 0
+        for response in responses:
+            response.content
+            if response.status_code < 500:
+                ready += 1
+
+        self.__log('Prewarmed {0} of {1} connections in {2:.3f} seconds'.format(ready, connections, time.time() - start))
+        return ready
+
+    def add_burst_window(self, start, connections=None):
+        """
+        Call :func:`prewarm()` in the background :attr:`prewarm_lead` seconds before a burst of
+        time-critical requests is expected, like when new loans are listed. If that's already
+        passed, the connections are opened right away.
+
+        Parameters
+        ----------
+        start : float
+            When the burst window starts, as a `time.time()` timestamp
+        connections : int, optional
+            The number of connections to open, :attr:`prewarm_connections` by default
+
+        Examples
+        --------
+
+            >>> import time
+            >>> lc.session.add_burst_window(time.time() + 3600)  # Opens the connections in 59:55
+        """
+        delay = max(0, start - self.prewarm_lead - time.time())
+        timer = threading.Timer(delay, self.prewarm, args=(connections,))
+        timer.daemon = True
+        self.__burst_timers = [t for t in self.__burst_timers if t.is_alive()] + [timer]
+        timer.start()
+
+    def clear_burst_windows(self):
+        """
+        Cancel the prewarming scheduled with :func:`add_burst_window()` that hasn't started yet
+        """
+        for timer in self.__burst_timers:
+            timer.cancel()
+        self.__burst_timers = []
+
+    def priority(self, priority):
+        """
+        Set the default priority of the requests sent from the current thread, inside a `with` block
+
+        Parameters
+        ----------
+        priority : {PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK}
+            The priority
+
+        Examples
+        --------
+
+            >>> from lendingclub.session import PRIORITY_BULK
+            >>> with lc.session.priority(PRIORITY_BULK):
+            ...     notes = lc.my_notes(get_all=True)
+        """
+        return self.__priority_context(priority)
+
+    @contextmanager
+    def __priority_context(self, priority):
+        previous = getattr(self.__priority, 'value', None)
+        self.__priority.value = priority
+        try:
+            yield
+        finally:
+            self.__priority.value = previous
+
+    def set_endpoint_timeout(self, path, connect=None, read=None):
+        """
+        Set the timeouts for one endpoint, instead of the default :attr:`timeout`
+
+        Parameters
+        ----------
+        path : string
+            The endpoint path
+        connect : float, optional
+            Seconds to wait for a connection to the server. Defaults to the :attr:`timeout` value.
+        read : float, optional
+            Seconds to wait for the server to send data. Defaults to the :attr:`timeout` value.
+        """
+        key = '/' + path.split('?')[0].strip('/')
+        if connect is None and read is None:
+            self.__timeouts.pop(key, None)
+        else:
+            self.__timeouts[key] = (connect, read)
+
+    def endpoint_timeout(self, path):
+        """
+        Get the (connect, read) timeouts for an endpoint. (see :func:`set_endpoint_timeout()`)
+        """
+        connect, read = self.__timeouts.get('/' + path.split('?')[0].strip('/'), (None, None))
+        return (self.timeout[0] if connect is None else connect, self.timeout[1] if read is None else read)
+
+    def deadline(self, deadline):
+        """
+        Set a deadline for all the requests sent from the current thread, inside a `with` block.
+
+        Each request's timeouts are cut down to the time left before the deadline, and once it
+        has passed, requests raise :class:`DeadlineExceeded` instead of being sent. A deadline
+        inside another one can only make it sooner.
+
+        Parameters
+        ----------
+        deadline : float
+            The time to stop at, as a `time.time()` timestamp. None keeps the current deadline.
+
+        Examples
+        --------
+
+            >>> import time
+            >>> with lc.session.deadline(time.time() + 5):
+            ...     cash = lc.get_cash_balance()
+        """
+        return self.__deadline_context(deadline)
+
+    @contextmanager
+    def __deadline_context(self, deadline):
+        previous = getattr(self.__deadline, 'value', None)
+        if deadline is None or (previous is not None and previous < deadline):
+            deadline = previous
+        self.__deadline.value = deadline
+        try:
+            yield
+        finally:
+            self.__deadline.value = previous
+
+    def __time_left(self, method, path):
+        """
+        Get the seconds left before the current deadline, or None if there isn't one.
+        Raises DeadlineExceeded if it has already passed.
+        """
+        deadline = getattr(self.__deadline, 'value', None)
+        if deadline is None:
+            return None
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise DeadlineExceeded('The deadline passed before the {0} request to {1} was sent'.format(method.upper(), path))
+        return remaining
+
+    def request(self, method, path, query=None, data=None, redirects=True, idempotent=None, stream=False, priority=None):
         """
         Sends HTTP request to LendingClub.
 
+        If an identical idempotent request (same method, path, query and data) is already
+        in progress from another thread, this waits for that response and returns it,
+        instead of sending the same request again.
+
         Parameters
         ----------
         method : {GET, POST, HEAD, DELETE}
@@ -248,58 +970,226 @@ class Session:
             A dictionary of POST data values
         redirects : boolean
             True to follow redirects, False to return the original response from the server.
+        idempotent : boolean, optional
+            True if the request doesn't change anything on the server, so identical requests
+            can share the same response. By default, only GET and HEAD requests are idempotent.
+        stream : boolean, optional
+            True to return as soon as the headers are received, without downloading the body.
+            Read the body with :func:`iter_json()` or the response's `iter_content()` method.
+            Streamed responses are never cached or shared with other requests.
+        priority : {PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK}, optional
+            When more requests are waiting than :attr:`scheduler` allows at once, higher priority requests
+            are sent first. Defaults to the priority set with :func:`priority()`, or PRIORITY_NORMAL.
 
         Returns
         -------
         requests.Response
             A `requests.Response <http://docs.python-requests.org/en/latest/api/#requests.Response>`_ object
+
+        Raises
+        ------
+        session.NetworkError
+            If the request failed or the endpoint's circuit breaker is open
+        session.DeadlineExceeded
+            If the deadline set with :func:`deadline()` passed before the response was received
         """
 
-        # Check session time
-        self.__continue_session()
+        if priority is None:
+            priority = getattr(self.__priority, 'value', None)
+            if priority is None:
+                priority = PRIORITY_NORMAL
+
+        # The body of a streamed response can only be read once
+        if stream:
+            return self.__send(method, path, query, data, redirects, None, priority, True)
+
+        # Serve from the cache
+        cache_key = None
+        if method.upper() == 'GET' and self.cache.is_cached(path):
+            cache_key = (path, tuple(sorted(query.items())) if query else ())
+            cached = self.cache.get(path, cache_key)
+            if self.metrics is not None:
+                self.metrics.inc('cache_hits_total' if cached is not None else 'cache_misses_total', 1, {'path': self.cache.endpoint(path)})
+            if cached is not None:
+                self.__log('GET request to {0} served from the cache'.format(path))
+                self.last_response = cached
+                return cached
+
+        if idempotent is None:
+            idempotent = method.upper() in ('GET', 'HEAD')
+        if not idempotent or not self.coalesce_requests:
+            return self.__send(method, path, query, data, redirects, cache_key, priority)
+
+        # Wait for an identical request that's already in progress
+        flight_key = repr((method.upper(), path, sorted(query.items()) if query else None, sorted(data.items()) if data else None, redirects))
+        with self.__flights_lock:
+            flight = self.__flights.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = {'done': threading.Event(), 'response': None, 'error': None}
+                self.__flights[flight_key] = flight
+
+        if not leader:
+            if not flight['done'].wait(self.__time_left(method, path)):
+                raise DeadlineExceeded('The deadline passed while waiting for the {0} request to {1}'.format(method.upper(), path))
+            with self.__flights_lock:
+                self.coalesced_hits += 1
+            if self.metrics is not None:
+                self.metrics.inc('coalesced_requests_total', 1, {'path': path.split('?')[0]})
+            if flight['error'] is not None:
+                raise flight['error']
+            return flight['response']
 
         try:
-            url = self.build_url(path)
-            method = method.upper()
-
-            self.__log('{0} request to: {1}'.format(method, url))
-
-            if method == 'POST':
-                request = self.__session.post(url, params=query, data=data, allow_redirects=redirects)
-            elif method == 'GET':
-                request = self.__session.get(url, params=query, data=data, allow_redirects=redirects)
-            elif method == 'HEAD':
-                request = self.__session.head(url, params=query, data=data, allow_redirects=redirects)
-            elif method == 'DELETE':
-                request = self.__session.delete(url, params=query, data=data, allow_redirects=redirects)
-            else:
-                raise SessionError('{0} is not a supported HTTP method'.format(method))
-
-            self.last_response = request
-
-            self.__log('Status code: {0}'.format(request.status_code))
-
-            # Update session time
-            self.last_request_time = time.time()
+            flight['response'] = self.__send(method, path, query, data, redirects, cache_key, priority)
+            return flight['response']
+        except Exception as e:
+            flight['error'] = e
+            raise
+        finally:
+            with self.__flights_lock:
+                del self.__flights[flight_key]
+            flight['done'].set()
+
+    def __send(self, method, path, query, data, redirects, cache_key, priority, stream=False):
+        """
+        Send the request from :func:`request()`
+        """
+        timing = None
+        if self.__timing_hooks:
+            timing = {'method': method.upper(), 'path': path, 'stage': 'request', 'status': None, 'error': None,
+                      'queue': None, 'connect': None, 'ttfb': None, 'download': None, 'parse': None, 'total': None,
+                      'encoding': None, 'wire_bytes': None, 'body_bytes': None,
+                      'priority': PRIORITY_NAMES.get(priority, str(priority)), 'wait': None}
+            entered = time.time()
+
+        # Stop if the deadline has already passed
+        try:
+            self.__time_left(method, path)
+        except DeadlineExceeded as error:
+            if timing is not None:
+                timing['error'] = error
+                self.__send_timing(timing)
+            raise
 
-        except (RequestException, ConnectionError, TooManyRedirects, HTTPError) as e:
-            raise NetworkError('{0} failed to: {1}'.format(method, url), e)
-        except Timeout:
-            raise NetworkError('{0} request timed out: {1}'.format(method, url), e)
+        # Check session time
+        self.__continue_session()
 
-        return request
+        # Fail fast if this endpoint has been failing
+        breaker = self.circuit_breaker(path)
+        if not breaker.allow():
+            error = NetworkError('Circuit breaker is open for {0}, not sending {1} request'.format(path, method.upper()))
+            if timing is not None:
+                timing['error'] = error
+                self.__send_timing(timing)
+            raise error
 
-    def post(self, path, query=None, data=None, redirects=True):
+        settled = False
+        try:
+            try:
+                url = self.build_url(path)
+                method = method.upper()
+                start = time.time()
+
+                self.__log('{0} request to: {1}'.format(method, url))
+
+                if method not in ('POST', 'GET', 'HEAD', 'DELETE'):
+                    raise SessionError('{0} is not a supported HTTP method'.format(method))
+
+                # Waiting for a free slot and the rate limiter counts as queue time
+                wait = self.scheduler.acquire(priority, self.__time_left(method, path))
+                if wait is None:
+                    raise DeadlineExceeded('The deadline passed while the {0} request to {1} was waiting to be sent'.format(method, path))
+                try:
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.acquire()
+
+                    # The request can't take longer than the time left before the deadline
+                    timeout = self.endpoint_timeout(path)
+                    remaining = self.__time_left(method, path)
+                    if remaining is not None:
+                        timeout = tuple(remaining if t is None else min(t, remaining) for t in timeout)
+                    start = time.time()
+
+                    # The response is streamed, so the time to first byte and download time can be measured separately
+                    request = self.transport.send(self.__session, method, url, query, data, redirects, timeout)
+
+                    first_byte = time.time()
+                    if not stream:
+                        request.content  # Download the body
+                finally:
+                    self.scheduler.release()
+
+                self.last_response = request
+
+                self.__log('Status code: {0}'.format(request.status_code))
+
+                # Update session time
+                self.last_request_time = time.time()
+
+            except DeadlineExceeded as error:
+                if timing is not None:
+                    timing['error'] = error
+                    timing['total'] = time.time() - entered
+                    self.__send_timing(timing)
+                raise
+            except (RequestException, ConnectionError, TooManyRedirects, HTTPError) as e:
+                breaker.record_failure()
+                settled = True
+                deadline = getattr(self.__deadline, 'value', None)
+                if isinstance(e, Timeout) and deadline is not None and time.time() >= deadline:
+                    error = DeadlineExceeded('{0} request ran past the deadline: {1}'.format(method, url), e)
+                elif isinstance(e, Timeout):
+                    error = NetworkError('{0} request timed out: {1}'.format(method, url), e)
+                else:
+                    error = NetworkError('{0} failed to: {1}'.format(method, url), e)
+                if timing is not None:
+                    timing['error'] = error
+                    timing['total'] = time.time() - entered
+                    self.__send_timing(timing)
+                raise error
+
+            # Server errors count against the endpoint
+            if request.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success(self.last_request_time - start)
+            settled = True
+
+            if cache_key is not None and 200 <= request.status_code < 300:
+                self.cache.set(path, cache_key, request)
+
+            if timing is not None:
+                timing['status'] = request.status_code
+                timing['queue'] = start - entered
+                timing['wait'] = wait
+                timing['ttfb'] = first_byte - start
+                timing['download'] = None if stream else self.last_request_time - first_byte
+                timing['total'] = self.last_request_time - entered
+                timing['encoding'] = request.headers.get('Content-Encoding')
+                if not stream:
+                    timing['body_bytes'] = len(request.content)
+                    timing['wire_bytes'] = request.raw.tell() if hasattr(request.raw, 'tell') else timing['body_bytes']
+                request.timing = timing
+                self.__send_timing(timing)
+
+            return request
+        finally:
+            # Anything else that went wrong says nothing about the endpoint, but a probe must not be left in flight
+            if not settled:
+                breaker.release()
+
+    def post(self, path, query=None, data=None, redirects=True, idempotent=None, stream=False, priority=None):
         """
         POST request wrapper for :func:`request()`
         """
-        return self.request('POST', path, query, data, redirects)
+        return self.request('POST', path, query, data, redirects, idempotent, stream, priority)
 
-    def get(self, path, query=None, redirects=True):
+    def get(self, path, query=None, redirects=True, idempotent=None, stream=False, priority=None):
         """
         GET request wrapper for :func:`request()`
         """
-        return self.request('GET', path, query, None, redirects)
+        return self.request('GET', path, query, None, redirects, idempotent, stream, priority)
 
     def head(self, path, query=None, data=None, redirects=True):
         """
@@ -307,11 +1197,187 @@ class Session:
         """
         return self.request('HEAD', path, query, None, redirects)
 
+    def batch(self, specs, max_workers=4, fail_fast=False, check=None):
+        """
+        Send several independent requests at the same time, through the session's connection pool.
+
+        Each request is sent with :func:`request()`, so it goes through the cache, circuit breakers and
+        :attr:`scheduler` like any other request. The priority and deadline of the current thread
+        (see :func:`priority()` and :func:`deadline()`) apply to all of them.
+
+        Parameters
+        ----------
+        specs : list
+            The requests to send. Each one is a dict of :func:`request()` arguments, with the
+            method defaulting to GET. i.e. {'path': '/browse/getSavedFilterAj.action', 'query': {'id': 1}}
+        max_workers : int, optional
+            The maximum number of requests sent at once
+        fail_fast : boolean, optional
+            Stop sending requests once one has failed. The requests that are already being sent
+            are finished, and the rest are skipped. (see :func:`BatchResult.skipped()`)
+        check : function, optional
+            Called with each response, and raises an exception if the response is a failure,
+            i.e. the JSON result is not successful
+
+        Returns
+        -------
+        :class:`BatchResult`
+            The responses and errors, in the same order as the requests
+
+        Examples
+        --------
+
+            >>> results = lc.session.batch([
+            ...     {'path': '/browse/cashBalanceAj.action'},
+            ...     {'method': 'POST', 'path': '/browse/browseNotesAj.action', 'data': {'method': 'search'}}
+            ... ])
+            >>> results.raise_for_errors()
+            >>> cash = lc.session.json(results.responses[0])
+        """
+        specs = list(specs)
+        result = BatchResult(len(specs))
+        priority = getattr(self.__priority, 'value', None)
+        deadline = getattr(self.__deadline, 'value', None)
+        pending = range(len(specs) - 1, -1, -1)
+        lock = threading.Lock()
+
+        def work():
+            with self.priority(priority), self.deadline(deadline):
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        i = pending.pop()
+
+                    spec = dict(specs[i])
+                    method = spec.pop('method', 'GET')
+                    path = spec.pop('path')
+
+                    start = time.time()
+                    try:
+                        result.responses[i] = self.request(method, path, **spec)
+                        if check is not None:
+                            check(result.responses[i])
+                    except Exception as e:
+                        self.__log('Batch request {0} to {1} failed: {2}'.format(i, path, str(e)))
+                        result.errors[i] = e
+                        if fail_fast:
+                            with lock:
+                                del pending[:]
+                    result.times[i] = time.time() - start
+
+        start = time.time()
+        workers = min(max_workers, len(specs))
+        if workers <= 1:
+            work()
+        else:
+            threads = []
+            for i in range(workers):
+                thread = threading.Thread(target=work)
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+
+            for thread in threads:
+                thread.join()
+
+        result.elapsed = time.time() - start
+        self.__log('Sent {0} batch requests in {1:.3f} seconds, {2} failed, {3} skipped'.format(len(specs), result.elapsed, len(result.failed()), len(result.skipped())))
+        return result
+
     def clear_session_order(self):
         """
         Clears any existing order in the LendingClub.com user session.
         """
-        self.get('/portfolio/confirmStartNewPortfolio.action')
+        self.get('/portfolio/confirmStartNewPortfolio.action', idempotent=False)
+        self.staged_loans = {}
+
+    def json(self, response):
+        """
+        Parse the JSON body of a response returned from :func:`request()`, with :attr:`json_decoder`
+
+        Parameters
+        ----------
+        response : requests.Response
+            The response to parse
+
+        Returns
+        -------
+        dict
+            The parsed JSON object
+        """
+        timing = getattr(response, 'timing', None)
+        if timing is None:
+            return self.json_decoder(response.content)
+
+        start = time.time()
+        json_response = self.json_decoder(response.content)
+        parse = time.time() - start
+        self.__send_timing(dict(timing, stage='parse', parse=parse, total=timing['total'] + parse))
+
+        return json_response
+
+    def iter_json(self, response, key):
+        """
+        Incrementally parse a JSON array from a response sent with `stream=True`, yielding
+        each item as soon as it's downloaded. The response is closed when the generator finishes
+        or is closed. (see :func:`lendingclub.parsers.iter_json_array()`)
+
+        Parameters
+        ----------
+        response : requests.Response
+            The streamed response
+        key : string
+            The name of the array in the JSON document
+
+        Returns
+        -------
+        generator
+            The items of the array
+        """
+        try:
+            for item in iter_json_array(response.iter_content(self.stream_chunk_size), key):
+                yield item
+        finally:
+            response.close()
+
+    def find_html(self, response, name=None, attrs=None, text=False):
+        """
+        Find the first element in the HTML of a response, using :attr:`html_parser`
+
+        Parameters
+        ----------
+        response : requests.Response
+            The response with the HTML page
+        name : string, optional
+            The tag name to match
+        attrs : dict, optional
+            Attribute values to match
+        text : boolean, optional
+            Include the text content of the element
+
+        Returns
+        -------
+        dict
+            A dict with the tag `name`, `attrs` and `text` of the element, or None if nothing matched
+        """
+        start = time.time()
+
+        # Parse each response once per parser
+        parser = self.html_parser
+        document = getattr(response, 'html_document', None)
+        if document is None or document[0] is not parser:
+            document = (parser, parser.parse(response.text))
+            response.html_document = document
+
+        element = parser.find(document[1], name, attrs, text)
+
+        timing = getattr(response, 'timing', None)
+        if timing is not None:
+            parse = time.time() - start
+            self.__send_timing(dict(timing, stage='parse', parse=parse, total=timing['total'] + parse))
+
+        return element
 
     def json_success(self, json):
         """
@@ -327,6 +1393,378 @@ class Session:
         return False
 
 
+class BatchResult:
+    """
+    The results of :func:`Session.batch()`, in the same order as the requests
+    """
+
+    responses = None
+    """ The response of each request, or None if it failed """
+
+    errors = None
+    """ The error raised by each request, or None if it worked or was skipped """
+
+    times = None
+    """ The seconds each request took, including the time waiting to be sent, or None if it was skipped """
+
+    elapsed = 0
+    """ The seconds the whole batch took """
+
+    def __init__(self, size=0):
+        self.responses = [None] * size
+        self.errors = [None] * size
+        self.times = [None] * size
+        self.elapsed = 0
+
+    def __len__(self):
+        return len(self.responses)
+
+    def failed(self):
+        """
+        Get the indexes of the requests that failed
+        """
+        return [i for i, error in enumerate(self.errors) if error is not None]
+
+    def skipped(self):
+        """
+        Get the indexes of the requests that were never sent, because an earlier one failed
+        """
+        return [i for i, elapsed in enumerate(self.times) if elapsed is None]
+
+    def raise_for_errors(self):
+        """
+        Raise the error of the first request that failed, if any did
+        """
+        for error in self.errors:
+            if error is not None:
+                raise error
+
+
+class RequestScheduler:
+    """
+    Limits how many requests are sent at once. When all the slots are taken, waiting requests
+    get the next free slot in priority order (PRIORITY_HIGH first), and in the order they arrived
+    within the same priority.
+
+    Parameters
+    ----------
+    max_concurrent : int, optional
+        The number of requests that can be sent at the same time. This should not be more than
+        the size of the connection pool.
+    """
+
+    max_concurrent = 10
+    active = 0
+    __waiting = None
+    __counter = None
+    __lock = None
+
+    def __init__(self, max_concurrent=10):
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.__waiting = []
+        self.__counter = itertools.count()
+        self.__lock = threading.Lock()
+
+    def acquire(self, priority=PRIORITY_NORMAL, timeout=None):
+        """
+        Wait for a free slot. Call :func:`release()` when the request is done.
+
+        Parameters
+        ----------
+        priority : int, optional
+            The request priority. Lower numbers go first.
+        timeout : float, optional
+            The maximum number of seconds to wait. None waits as long as it takes.
+
+        Returns
+        -------
+        float
+            The number of seconds spent waiting, or None if no slot was free before the timeout
+        """
+        with self.__lock:
+            if self.active < self.max_concurrent and not self.__waiting:
+                self.active += 1
+                return 0
+
+            start = time.time()
+            ready = threading.Event()
+            waiter = (priority, next(self.__counter), ready)
+            heapq.heappush(self.__waiting, waiter)
+
+        if ready.wait(timeout):
+            return time.time() - start
+
+        with self.__lock:
+            # The slot was handed over just as the wait timed out
+            if ready.is_set():
+                return time.time() - start
+
+            self.__waiting.remove(waiter)
+            heapq.heapify(self.__waiting)
+        return None
+
+    def release(self):
+        """
+        Free a slot, or hand it straight to the next waiting request
+        """
+        with self.__lock:
+            if self.__waiting:
+                heapq.heappop(self.__waiting)[2].set()
+            else:
+                self.active -= 1
+
+    def waiting(self):
+        """
+        The number of requests waiting for a slot
+        """
+        with self.__lock:
+            return len(self.__waiting)
+
+
+class ResponseCache:
+    """
+    Caches responses for a limited time, with a separate time-to-live and size limit for each endpoint.
+    When an endpoint's cache is full, the least recently used response is removed.
+
+    Endpoints are identified by their path without the query string, so all the query string
+    variations of an endpoint share the same settings, but are cached separately.
+
+    Examples
+    --------
+
+        >>> lc.session.cache.cache_endpoint('/browse/cashBalanceAj.action', ttl=5)
+        >>> lc.get_cash_balance()       # From lendingclub.com
+        216.02
+        >>> lc.get_cash_balance()       # From the cache
+        216.02
+        >>> lc.session.cache.invalidate('/browse/cashBalanceAj.action')
+    """
+
+    hits = 0
+    misses = 0
+
+    __rules = None
+    __entries = None
+    __lock = None
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.__rules = {}
+        self.__entries = {}
+        self.__lock = threading.Lock()
+
+    def endpoint(self, path):
+        """
+        Get the endpoint that a path belongs to, which is the path without the query string
+        """
+        return '/' + path.split('?')[0].strip('/')
+
+    def cache_endpoint(self, path, ttl, max_size=16):
+        """
+        Start caching the responses from an endpoint
+
+        Parameters
+        ----------
+        path : string
+            The endpoint path
+        ttl : float
+            How many seconds to keep a response. Set to 0 to stop caching this endpoint.
+        max_size : int, optional
+            The maximum number of responses to keep for this endpoint
+        """
+        assert max_size > 0, 'max_size must be at least 1'
+
+        endpoint = self.endpoint(path)
+        with self.__lock:
+            self.__entries.pop(endpoint, None)
+            if ttl > 0:
+                self.__rules[endpoint] = (ttl, max_size)
+            else:
+                self.__rules.pop(endpoint, None)
+
+    def is_cached(self, path):
+        """
+        Returns True if responses from this path's endpoint are cached
+        """
+        return self.endpoint(path) in self.__rules
+
+    def get(self, path, key):
+        """
+        Get a response from the cache
+
+        Parameters
+        ----------
+        path : string
+            The request path
+        key : hashable
+            The cache key for this request
+
+        Returns
+        -------
+        requests.Response
+            The cached response or None if there isn't one, or it has expired
+        """
+        endpoint = self.endpoint(path)
+        with self.__lock:
+            entries = self.__entries.get(endpoint)
+            if entries and key in entries:
+                expires, response = entries.pop(key)
+                if expires > time.time():
+                    entries[key] = (expires, response)  # Most recently used
+                    self.hits += 1
+                    return response
+            self.misses += 1
+            return None
+
+    def set(self, path, key, response):
+        """
+        Add a response to the cache
+
+        Parameters
+        ----------
+        path : string
+            The request path
+        key : hashable
+            The cache key for this request
+        response : requests.Response
+            The response to cache
+        """
+        endpoint = self.endpoint(path)
+        with self.__lock:
+            if endpoint not in self.__rules:
+                return
+            ttl, max_size = self.__rules[endpoint]
+
+            entries = self.__entries.setdefault(endpoint, OrderedDict())
+            entries.pop(key, None)
+            entries[key] = (time.time() + ttl, response)
+            while len(entries) > max_size:
+                entries.popitem(last=False)
+
+    def invalidate(self, path=None):
+        """
+        Remove cached responses
+
+        Parameters
+        ----------
+        path : string, optional
+            Only remove the responses for this path's endpoint. If not set, everything is removed.
+        """
+        with self.__lock:
+            if path is None:
+                self.__entries = {}
+            else:
+                self.__entries.pop(self.endpoint(path), None)
+
+
+class CircuitBreaker:
+    """
+    Tracks the health of a single endpoint. After `failure_threshold` consecutive failures the
+    breaker opens and :func:`allow()` returns False until `reset_timeout` seconds have passed.
+    Then it goes half-open and lets a single probe request through: if that succeeds the breaker
+    closes, otherwise it opens again.
+
+    Parameters
+    ----------
+    failure_threshold : int
+        The number of consecutive failures before the breaker opens.
+    latency_threshold : float, optional
+        Seconds. Successful requests slower than this are counted as failures.
+    reset_timeout : float
+        Seconds the breaker stays open before allowing a probe request.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    state = CLOSED
+    failures = 0
+    opened_at = 0
+
+    def __init__(self, failure_threshold=5, latency_threshold=None, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.__probing = False
+        self.__probe_started = 0
+        self.__lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns True if a request can be sent to this endpoint
+        """
+        with self.__lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return True
+
+            if self.state == CircuitBreaker.OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = CircuitBreaker.HALF_OPEN
+                self.__probing = False
+
+            # Half-open: only one probe at a time
+            if self.__probing:
+                return False
+            self.__probing = True
+            self.__probe_started = time.time()
+            return True
+
+    def record_success(self, elapsed=None):
+        """
+        Record a successful request, which closes the breaker.
+
+        Parameters
+        ----------
+        elapsed : float, optional
+            How long the request took, in seconds.
+        """
+        if self.latency_threshold is not None and elapsed is not None and elapsed >= self.latency_threshold:
+            return self.record_failure()
+
+        with self.__lock:
+            self.state = CircuitBreaker.CLOSED
+            self.failures = 0
+            self.__probing = False
+
+    def record_failure(self):
+        """
+        Record a failed request, which might open the breaker.
+        """
+        with self.__lock:
+            self.failures += 1
+            self.__probing = False
+            if self.state == CircuitBreaker.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = CircuitBreaker.OPEN
+                self.opened_at = time.time()
+
+    def release(self):
+        """
+        Free the probe that :func:`allow()` let through, without recording a success or failure.
+        For requests that were never sent, or failed for a reason that has nothing to do with the endpoint.
+        """
+        with self.__lock:
+            self.__probing = False
+
+    def half_open(self):
+        """
+        Let an open breaker send a probe request right away, instead of waiting for `reset_timeout`.
+        A half-open breaker whose probe has been in flight for longer than `reset_timeout` lets another one through.
+        """
+        with self.__lock:
+            stale = self.__probing and time.time() - self.__probe_started >= self.reset_timeout
+            if self.state == CircuitBreaker.OPEN or (self.state == CircuitBreaker.HALF_OPEN and stale):
+                self.state = CircuitBreaker.HALF_OPEN
+                self.__probing = False
+
+
 class SessionError(Exception):
     """
     Base exception class for :mod:`lendingclub.session`
@@ -364,3 +1802,10 @@ class NetworkError(SessionError):
     An error occurred while making an HTTP request
     """
     pass
+
+
+class DeadlineExceeded(NetworkError):
+    """
+    A request could not be finished before the deadline (see :func:`Session.deadline()`)
+    """
+    pass
@@ -301,6 +301,7 @@ class TestSavedFilters(unittest.TestCase):
 
         self.assertEqual(len(filters), 2)
         self.assertEqual(filters[0].name, 'Filter 1')
+        self.assertEqual([saved.id for saved in filters], [1, 2])
 
     def test_get_saved_filters(self):
         saved = SavedFilter(self.lc, 1)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+"""
+Time a whole flow (log in, build a portfolio and place an order) with the test server
+handlers in-process, and over HTTP for comparison.
+
+    python flow_benchmark.py [repeat]
+"""
+
+import sys
+import timeit
+from logger import TestLogger
+from server import ServerThread, handle_request
+from transport_test import create_lc, run_flow
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '../')
+sys.path.insert(0, '../../')
+
+from lendingclub.transport import InMemoryTransport
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    logger = TestLogger()
+
+    http = ServerThread()
+    http.start()
+
+    transports = [
+        ('in-memory', lambda: InMemoryTransport(handle_request), 'http://127.0.0.1:1/'),
+        ('http', lambda: None, 'http://127.0.0.1:8000/')
+    ]
+
+    for name, transport, base_url in transports:
+        seconds = timeit.repeat(lambda: run_flow(create_lc(logger, transport(), base_url)), number=1, repeat=repeat)
+        print '{0:<10} {1:8.1f} ms per flow (best {2:.1f} ms)'.format(name, sum(seconds) / len(seconds) * 1000, min(seconds) * 1000)
+
+    http.stop()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"""
+Compare the speed of the installed JSON decoders on the test assets, scaled up 1000x.
+
+    python json_benchmark.py [scale] [repeat]
+"""
+
+import os
+import sys
+import json
+import timeit
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '../')
+sys.path.insert(0, '../../')
+
+from lendingclub.parsers import json_decoders
+
+
+def read_asset(file_name):
+    this_dir = os.path.dirname(os.path.realpath(__file__))
+    return open(os.path.join(this_dir, 'assets', file_name)).read()
+
+
+def scale_up(file_name, key_path, scale):
+    """
+    Repeat the list of records at key_path in the asset file, scale times
+    """
+    data = json.loads(read_asset(file_name))
+    parent = data
+    for key in key_path[:-1]:
+        parent = parent[key]
+    parent[key_path[-1]] = parent[key_path[-1]] * scale
+    return json.dumps(data)
+
+
+if __name__ == '__main__':
+    scale = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    payloads = [
+        ('browseNotesAj', scale_up('browseNotesAj_1.json', ['searchresult', 'loans'], scale)),
+        ('getPortfolio', scale_up('portfolio_getPortfolio.json', ['loanFractions'], scale)),
+        ('lendingMatchOptionsV2', scale_up('lendingMatchOptionsV2.json', ['lmOptions'], scale))
+    ]
+
+    for name, payload in payloads:
+        print '{0} ({1:.1f} MB)'.format(name, len(payload) / 1024.0 / 1024.0)
+
+        baseline = None
+        for decoder_name, decoder in reversed(json_decoders()):
+            seconds = min(timeit.repeat(lambda: decoder(payload), number=1, repeat=repeat))
+            if baseline is None:
+                baseline = seconds
+            print '  {0:<8} {1:8.1f} ms  {2:5.1f}x'.format(decoder_name, seconds * 1000, baseline / seconds)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import sys
+import time
 import unittest
 from logger import TestLogger
 from server import ServerThread
@@ -10,6 +11,7 @@ sys.path.insert(0, '../')
 sys.path.insert(0, '../../')
 
 from lendingclub import LendingClub
+from lendingclub.session import DeadlineExceeded
 
 
 class TestLendingClub(unittest.TestCase):
@@ -41,6 +43,25 @@ class TestLendingClub(unittest.TestCase):
         self.assertEquals(len(portfolios), 2)
         self.assertEquals(portfolios[0]['portfolioName'], 'Existing Portfolio')
 
+    def test_portfolios_cache(self):
+        """ test_portfolios_cache
+        Assigning to a portfolio invalidates the cached portfolio list
+        """
+        self.lc.session.enable_cache()
+        self.lc.get_portfolio_list()
+        self.assertEqual(self.lc.session.cache.misses, 1)
+
+        self.lc.get_portfolio_list()
+        self.assertEqual(self.lc.session.cache.hits, 1)
+
+        # Checks the (cached) portfolio list before assigning
+        self.lc.assign_to_portfolio('New Portfolio', 123, 456)
+        self.assertEqual(self.lc.session.cache.hits, 2)
+
+        self.lc.get_portfolio_list()
+        self.assertEqual(self.lc.session.cache.hits, 2)
+        self.assertEqual(self.lc.session.cache.misses, 2)
+
     def test_build_portfolio(self):
         portfolio = self.lc.build_portfolio(200, 25, 15, 16)
 
@@ -75,6 +96,58 @@ class TestLendingClub(unittest.TestCase):
         self.assertTrue('loans' in results)
         self.assertTrue(len(results['loans']) > 0)
 
+    def test_recently_seen(self):
+        """ test_recently_seen
+        Searches remember when each loan was last seen
+        """
+        results = self.lc.search()
+        loan_ids = [loan['loan_id'] for loan in results['loans']]
+
+        self.assertTrue(self.lc.recently_seen(loan_ids, 5))
+        self.assertTrue(self.lc.recently_seen([str(loan_ids[0])], 5))
+        self.assertFalse(self.lc.recently_seen(loan_ids + [1], 5))
+
+        time.sleep(0.1)
+        self.assertFalse(self.lc.recently_seen(loan_ids, 0.05))
+
+    def test_search_deadline(self):
+        self.assertRaises(DeadlineExceeded, lambda: self.lc.search(deadline=time.time() - 1))
+        self.assertTrue(self.lc.search(deadline=time.time() + 10) is not False)
+
+    def test_build_portfolio_deadline(self):
+        self.assertRaises(DeadlineExceeded, lambda: self.lc.build_portfolio(200, 25, 15, 16, deadline=time.time() - 1))
+
+    def test_iter_search(self):
+        """ test_iter_search
+        Streamed search results match the regular search
+        """
+        self.lc.session.stream_chunk_size = 100
+        loans = list(self.lc.iter_search())
+        results = self.lc.search()['loans']
+
+        # Each search has its own timestamp
+        for loan in loans + results:
+            self.assertTrue(loan.pop('searched_at') <= time.time())
+        self.assertEqual(loans, results)
+
+    def test_my_notes(self):
+        notes = self.lc.my_notes(limit=2, get_all=True)
+        self.assertEqual(notes['total'], 5)
+        self.assertEqual([n['noteId'] for n in notes['loans']], [2000, 2001, 2002, 2003, 2004])
+
+        notes = self.lc.my_notes(limit=2)
+        self.assertEqual(len(notes['loans']), 2)
+
+    def test_iter_notes(self):
+        """ test_iter_notes
+        Streamed notes are loaded one page at a time
+        """
+        notes = list(self.lc.iter_notes(limit=2, get_all=True))
+        self.assertEqual(notes, self.lc.my_notes(get_all=True)['loans'])
+
+        notes = list(self.lc.iter_notes(start_index=1, limit=2))
+        self.assertEqual([n['noteId'] for n in notes], [2001, 2002])
+
 
 if __name__ == '__main__':
     # Start the web-server in a background thread
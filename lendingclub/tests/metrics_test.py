@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import urllib2
+from logger import TestLogger
+from server import ServerThread
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '../')
+sys.path.insert(0, '../../')
+
+from lendingclub import LendingClub
+from lendingclub.metrics import MetricsRegistry
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    metrics = None
+
+    def setUp(self):
+        self.metrics = MetricsRegistry(buckets=[0.1, 1])
+
+    def tearDown(self):
+        self.metrics.stop()
+
+    def test_counter(self):
+        self.metrics.inc('foo_total')
+        self.metrics.inc('foo_total', 2)
+        self.metrics.inc('foo_total', labels={'path': '/bar'})
+
+        self.assertEqual(self.metrics.value('foo_total'), 3)
+        self.assertEqual(self.metrics.value('foo_total', {'path': '/bar'}), 1)
+        self.assertEqual(self.metrics.value('foo_total', {'path': '/baz'}), 0)
+
+    def test_render(self):
+        """ test_render
+        Counters and histograms render in the Prometheus text format
+        """
+        self.metrics.describe('foo_total', 'All the foos')
+        self.metrics.inc('foo_total', labels={'path': '/bar "baz"'})
+        self.metrics.observe('latency_seconds', 0.05)
+        self.metrics.observe('latency_seconds', 0.5)
+        self.metrics.observe('latency_seconds', 5)
+
+        lines = self.metrics.render().split('\n')
+        self.assertEqual(lines, [
+            '# HELP lendingclub_foo_total All the foos',
+            '# TYPE lendingclub_foo_total counter',
+            'lendingclub_foo_total{path="/bar \\"baz\\""} 1',
+            '# TYPE lendingclub_latency_seconds histogram',
+            'lendingclub_latency_seconds_bucket{le="0.1"} 1',
+            'lendingclub_latency_seconds_bucket{le="1"} 2',
+            'lendingclub_latency_seconds_bucket{le="+Inf"} 3',
+            'lendingclub_latency_seconds_sum 5.55',
+            'lendingclub_latency_seconds_count 3',
+            ''
+        ])
+
+    def test_write(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(temp_dir, 'lendingclub.prom')
+            self.metrics.inc('foo_total')
+            self.metrics.write(file_path)
+            self.assertEqual(open(file_path).read(), self.metrics.render())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_serve(self):
+        self.metrics.inc('foo_total')
+        port = self.metrics.serve(0)
+        response = urllib2.urlopen('http://127.0.0.1:{0}/metrics'.format(port))
+        self.assertEqual(response.read(), self.metrics.render())
+
+
+class TestSessionMetrics(unittest.TestCase):
+    lc = None
+    metrics = None
+    logger = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.metrics = MetricsRegistry()
+
+        self.lc = LendingClub(logger=self.logger)
+        self.lc.session.base_url = 'http://127.0.0.1:8000/'
+        self.lc.session.set_logger(None)
+        self.lc.session.set_metrics(self.metrics)
+
+        self.lc.authenticate('test@test.com', 'supersecret')
+
+    def tearDown(self):
+        pass
+
+    def test_requests(self):
+        """ test_requests
+        Requests are counted per endpoint
+        """
+        self.lc.get_cash_balance()
+        self.lc.get_cash_balance()
+
+        labels = {'method': 'GET', 'path': '/browse/cashBalanceAj.action'}
+        self.assertEqual(self.metrics.value('requests_total', dict(labels, status='200')), 2)
+        self.assertEqual(self.metrics.value('request_duration_seconds', labels), 2)
+        self.assertEqual(self.metrics.value('response_parse_seconds', labels), 2)
+        self.assertEqual(self.metrics.value('request_errors_total', labels), 0)
+
+        # Query strings are not part of the endpoint
+        self.lc.get_portfolio_list()
+        labels = {'method': 'GET', 'path': '/data/portfolioManagement', 'status': '200'}
+        self.assertEqual(self.metrics.value('requests_total', labels), 1)
+
+    def test_bytes(self):
+        """ test_bytes
+        Compressed and decompressed response sizes are counted per endpoint
+        """
+        self.lc.search()
+        labels = {'method': 'POST', 'path': '/browse/browseNotesAj.action'}
+        wire = self.metrics.value('response_wire_bytes_total', labels)
+        body = self.metrics.value('response_body_bytes_total', labels)
+        self.assertTrue(0 < wire < body)
+
+    def test_errors(self):
+        self.lc.session.base_url = 'http://127.0.0.1:1/'
+        self.assertRaises(Exception, lambda: self.lc.get_cash_balance())
+
+        labels = {'method': 'GET', 'path': '/browse/cashBalanceAj.action'}
+        self.assertEqual(self.metrics.value('request_errors_total', labels), 1)
+        self.assertEqual(self.metrics.value('request_duration_seconds', labels), 0)
+
+    def test_unset(self):
+        self.lc.session.set_metrics(None)
+        self.metrics.reset()
+        self.lc.get_cash_balance()
+        self.assertEqual(self.metrics.render(), '')
+
+
+if __name__ == '__main__':
+    # Start the web-server in a background thread
+    http = ServerThread()
+    http.start()
+
+    # Run tests
+    unittest.main()
+
+    # Stop threads
+    http.stop()
@@ -1,7 +1,11 @@
 #!/usr/bin/env python
 
+import os
 import json
 import sys
+import time
+import shutil
+import tempfile
 import unittest
 from logger import TestLogger
 from server import ServerThread
@@ -10,8 +14,11 @@ sys.path.insert(0, '.')
 sys.path.insert(0, '../')
 sys.path.insert(0, '../../')
 
-from lendingclub import LendingClub
+from lendingclub import LendingClub, LendingClubError, StagingError
 from lendingclub.filters import FilterValidationError
+from lendingclub.session import DeadlineExceeded
+from lendingclub.journal import OrderJournal
+from lendingclub.metrics import MetricsRegistry
 
 
 class TestOrder(unittest.TestCase):
@@ -243,6 +250,327 @@ class TestBatchOrder(unittest.TestCase):
         http_session = request.json()
         self.assertEqual(http_session['existing_portfolio'], portfolio)
 
+    def test_execute_deadline(self):
+        """ test_execute_deadline
+        The order is not placed after the deadline
+        """
+        self.order.add_batch([123, 234], 25)
+        self.assertRaises(DeadlineExceeded, lambda: self.order.execute(deadline=time.time() - 1))
+        self.assertEqual(self.order.order_id, 0)
+
+        order_id = self.order.execute(deadline=time.time() + 10)
+        self.assertNotEqual(order_id, 0)
+
+    def test_execute_deadline_partway(self):
+        """ test_execute_deadline_partway
+        A deadline that passes while the order is being placed raises DeadlineExceeded
+        """
+        self.lc.session.post('/session', data={'place_order_delay': '1'})
+        self.order.add_batch([123, 234], 25)
+        self.assertRaises(DeadlineExceeded, lambda: self.order.execute(deadline=time.time() + 0.3))
+        self.assertEqual(self.order.order_id, 0)
+
+    def test_execute_concurrent_staging(self):
+        """ test_execute_concurrent_staging
+        Loans are staged at the same time
+        """
+        self.lc.session.post('/session', data={'stage_delay': '0.3'})
+        self.order.add_batch([123, 234], 25)
+
+        start = time.time()
+        order_id = self.order.execute()
+        self.assertNotEqual(order_id, 0)
+        self.assertTrue(time.time() - start < 0.55, time.time() - start)
+
+    def test_execute_staging_error(self):
+        """ test_execute_staging_error
+        The order is not placed if a loan can't be staged, and the error says which one
+        """
+        self.lc.session.post('/session', data={'stage_fail': '234'})
+        self.order.add_batch([123, 234], 25)
+
+        try:
+            self.order.execute()
+            self.fail('A StagingError was not raised')
+        except StagingError as e:
+            self.assertEqual(e.failed_loans.keys(), [234])
+        self.assertEqual(self.order.order_id, 0)
+        self.assertEqual(self.lc.session.staged_loans, {123: 25})
+
+        # Skip the rest after the first failure
+        self.lc.session.clear_session_order()
+        self.lc.session.post('/session', data={'stage_fail': '123,234'})
+        self.order.stage_concurrency = 1
+        try:
+            self.order.execute()
+            self.fail('A StagingError was not raised')
+        except StagingError as e:
+            self.assertEqual(len(e.failed_loans), 1)
+            self.assertEqual(len(e.skipped_loans), 1)
+
+    def test_execute_timings(self):
+        """ test_execute_timings
+        Each phase of placing the order is timed
+        """
+        metrics = MetricsRegistry()
+        self.lc.session.set_metrics(metrics)
+        spans = []
+        self.order.timing_hook = spans.append
+
+        self.order.add_batch([123, 234], 25)
+        self.order.execute()
+
+        phases = [span['phase'] for span in self.order.timings]
+        self.assertEqual(phases, ['clear', 'search', 'stage', 'add_to_order', 'token', 'confirm', 'total'])
+        self.assertEqual(spans, self.order.timings)
+
+        total = self.order.timings[-1]
+        for span in self.order.timings:
+            self.assertEqual(span['error'], None)
+            self.assertTrue(total['start'] <= span['start'])
+            self.assertTrue(span['duration'] <= total['duration'])
+        self.assertEqual(sorted(self.order.timings[2]['loans'].keys()), [123, 234])
+        self.assertEqual(metrics.value('order_phase_seconds', {'phase': 'stage'}), 1)
+
+    def test_execute_timing_hook_error(self):
+        """ test_execute_timing_hook_error
+        A timing hook that raises doesn't stop the order from being placed
+        """
+        def hook(span):
+            raise Exception('Broken hook')
+        self.order.timing_hook = hook
+
+        self.order.add_batch([123, 234], 25)
+        self.assertNotEqual(self.order.execute(), 0)
+        self.assertEqual(self.order.timings[-1]['phase'], 'total')
+
+    def test_execute_timings_error(self):
+        self.lc.session.post('/session', data={'stage_fail': '234'})
+        self.order.add_batch([123, 234], 25)
+        self.assertRaises(StagingError, lambda: self.order.execute())
+
+        self.assertEqual([span['phase'] for span in self.order.timings], ['clear', 'search', 'stage', 'total'])
+        self.assertEqual(self.order.timings[2]['error'], None)
+        self.assertTrue(isinstance(self.order.timings[-1]['error'], StagingError))
+
+    def test_execute_recently_searched(self):
+        """ test_execute_recently_searched
+        Loans found by a recent search are staged without searching again
+        """
+        self.lc.search()
+        self.order.availability_max_age = 5
+        self.order.add_batch([123, 234], 25)
+
+        self.assertNotEqual(self.order.execute(), 0)
+        self.assertEqual([span['phase'] for span in self.order.timings], ['clear', 'stage', 'add_to_order', 'token', 'confirm', 'total'])
+
+    def test_execute_stale_search(self):
+        self.lc.search()
+        self.order.availability_max_age = 0
+        self.order.add_batch([123, 234], 25)
+
+        self.assertNotEqual(self.order.execute(), 0)
+        self.assertTrue('search' in [span['phase'] for span in self.order.timings])
+
+    def test_execute_availability(self):
+        """ test_execute_availability
+        Search results can be passed in, but only skip the search if they have every loan
+        """
+        results = self.lc.search()
+        self.order.add_batch([123, 234], 25)
+        self.assertNotEqual(self.order.execute(availability=results), 0)
+        self.assertFalse('search' in [span['phase'] for span in self.order.timings])
+
+        order = self.lc.start_order()
+        order.add_batch([123, 234], 25)
+        order.execute(availability=results['loans'][:1])
+        self.assertTrue('search' in [span['phase'] for span in order.timings])
+
+    def test_execute_stale_availability(self):
+        """ test_execute_stale_availability
+        Search results that are older than availability_max_age don't skip the search
+        """
+        results = self.lc.search()
+        time.sleep(0.3)
+        self.order.availability_max_age = 0.2
+        self.order.add_batch([123, 234], 25)
+
+        self.assertNotEqual(self.order.execute(availability=results), 0)
+        self.assertTrue('search' in [span['phase'] for span in self.order.timings])
+
+    def test_execute_chunked(self):
+        """ test_execute_chunked
+        A large order is placed as several smaller orders
+        """
+        self.lc.session.post('/session', data={'browseNotesAj': 'by_id'})
+        self.order.add_batch(range(101, 106), 25)
+
+        order_ids = self.order.execute_chunked(chunk_size=2)
+        self.assertEqual(len(order_ids), 3)
+        self.assertEqual(self.order.order_ids, order_ids)
+        self.assertEqual(sorted(self.order.outcomes.keys()), range(101, 106))
+        for outcome in self.order.outcomes.values():
+            self.assertTrue(outcome in order_ids)
+
+        # Can't place it again
+        self.assertRaises(AssertionError, lambda: self.order.execute())
+
+    def test_execute_chunked_search_order(self):
+        """ test_execute_chunked_search_order
+        The next chunk isn't searched for until the current chunk is staged
+        """
+        paths = []
+        self.lc.session.add_timing_hook(lambda timing: paths.append(timing['path']) if timing['stage'] == 'request' else None)
+        self.lc.session.post('/session', data={'browseNotesAj': 'by_id'})
+        self.order.add_batch(range(101, 105), 25)
+        self.order.execute_chunked(chunk_size=2)
+
+        searches = [i for i, path in enumerate(paths) if path == '/browse/browseNotesAj.action']
+        self.assertEqual(len(searches), 2)
+        self.assertTrue('/data/portfolio' in paths[searches[0]:searches[1]])
+
+    def test_execute_chunked_failure(self):
+        """ test_execute_chunked_failure
+        A chunk that fails doesn't stop the other chunks from being placed
+        """
+        self.lc.session.post('/session', data={'browseNotesAj': 'by_id', 'stage_fail': '103'})
+        self.order.add_batch(range(101, 106), 25)
+
+        order_ids = self.order.execute_chunked(chunk_size=2)
+        self.assertEqual(len(order_ids), 2)
+        self.assertTrue(isinstance(self.order.outcomes[103], StagingError))
+
+        failed = [loan_id for loan_id, outcome in self.order.outcomes.items() if isinstance(outcome, Exception)]
+        self.assertTrue(len(failed) in (1, 2), failed)
+        self.assertEqual(len(self.order.outcomes), 5)
+
+    def get_cart(self):
+        return self.lc.session.get('/session').json().get('cart')
+
+    def test_prestage(self):
+        """ test_prestage
+        A prestaged order only stages what changed when it's executed
+        """
+        self.lc.session.post('/session', data={'browseNotesAj': 'by_id'})
+        self.order.add_batch([101, 102], 25)
+        self.assertEqual(sorted(self.order.prestage()), [101, 102])
+        self.assertEqual(self.get_cart(), {'101': 25, '102': 25})
+        self.assertEqual(self.lc.session.staged_loans, {101: 25, 102: 25})
+
+        self.order.remove(102)
+        self.order.update(101, 50)
+        self.assertNotEqual(self.order.execute(), 0)
+
+        session = self.lc.session.get('/session').json()
+        self.assertEqual(session['stage_requests'], 4)
+        self.assertEqual(session['cart'], {})
+        self.assertEqual([span['phase'] for span in self.order.timings], ['unstage', 'search', 'stage', 'add_to_order', 'token', 'confirm', 'total'])
+        self.assertEqual(self.lc.session.staged_loans, {})
+
+    def test_prestage_metrics(self):
+        """ test_prestage_metrics
+        Only the loans that are actually staged are counted
+        """
+        metrics = MetricsRegistry()
+        self.lc.session.set_metrics(metrics)
+        self.lc.session.post('/session', data={'browseNotesAj': 'by_id'})
+        self.order.add_batch([101, 102, 103], 25)
+        self.order.prestage()
+        self.assertEqual(metrics.value('loans_staged_total'), 3)
+
+        self.order.remove(103)
+        self.order.update(101, 50)
+        self.assertNotEqual(self.order.execute(), 0)
+        self.assertEqual(metrics.value('loans_staged_total'), 4)
+
+    def test_prestage_new_loan(self):
+        """ test_prestage_new_loan
+        Only loans added after prestaging are searched for
+        """
+        self.lc.session.post('/session', data={'browseNotesAj': 'by_id'})
+        self.order.add_batch([101, 102], 25)
+        self.order.prestage()
+
+        self.order.remove(102)
+        self.order.add(103, 25)
+        self.assertNotEqual(self.order.execute(), 0)
+
+        stage = [span for span in self.order.timings if span['phase'] == 'stage'][0]
+        self.assertEqual(stage['loans'].keys(), [103])
+        self.assertTrue('search' in [span['phase'] for span in self.order.timings])
+
+    def test_prestage_failure(self):
+        """ test_prestage_failure
+        Loans that couldn't be prestaged are staged again when the order is executed
+        """
+        self.lc.session.post('/session', data={'browseNotesAj': 'by_id', 'stage_fail': '102'})
+        self.order.add_batch([101, 102], 25)
+        self.assertEqual(self.order.prestage(), [101])
+
+        self.lc.session.post('/session', data={'stage_fail': 'none'})
+        self.assertNotEqual(self.order.execute(), 0)
+        stage = [span for span in self.order.timings if span['phase'] == 'stage'][0]
+        self.assertEqual(stage['loans'].keys(), [102])
+
+    def test_prestage_missing(self):
+        """ test_prestage_missing
+        Loans the search doesn't find are left out, and the rest are still prestaged
+        """
+        self.lc.session.post('/session', data={'browseNotesAj': 'by_id', 'search_missing': '102'})
+        self.order.add_batch([101, 102, 103], 25)
+        self.assertEqual(sorted(self.order.prestage()), [101, 103])
+        self.assertEqual(self.get_cart(), {'101': 25, '103': 25})
+
+        # Executing still needs all of them
+        self.assertRaises(LendingClubError, lambda: self.order.execute())
+
+    def test_execute_again(self):
+        """ test_execute_again
+        When an order fails and is changed, only the difference is staged when it's executed again
+        """
+        self.lc.session.post('/session', data={'browseNotesAj': 'by_id', 'stage_fail': '103'})
+        self.order.add_batch([101, 102, 103], 25)
+        self.assertRaises(StagingError, lambda: self.order.execute())
+        self.assertEqual(self.lc.session.get('/session').json()['stage_requests'], 3)
+
+        # Swap the loan that failed for another one and change an amount
+        self.order.remove(103)
+        self.order.add(104, 25)
+        self.order.update(102, 50)
+        self.assertNotEqual(self.order.execute(), 0)
+
+        self.assertEqual(self.lc.session.get('/session').json()['stage_requests'], 5)
+        phases = [span['phase'] for span in self.order.timings]
+        self.assertEqual(phases, ['search', 'stage', 'add_to_order', 'token', 'confirm', 'total'])
+        self.assertEqual(sorted(self.order.timings[1]['loans'].keys()), [102, 104])
+
+    def test_staged_unknown(self):
+        """ test_staged_unknown
+        The order is cleared before staging when it's not known what's staged
+        """
+        self.order.add_batch([123, 234], 25)
+        self.lc.authenticate()
+        self.assertEqual(self.lc.session.staged_loans, None)
+
+        self.assertNotEqual(self.order.execute(), 0)
+        self.assertEqual(self.order.timings[0]['phase'], 'clear')
+
+    def test_abort(self):
+        """ test_abort
+        Aborting a prestaged order empties it on LendingClub
+        """
+        self.order.add_batch([123, 234], 25)
+        self.order.prestage()
+        self.order.abort()
+
+        self.assertEqual(self.get_cart(), {})
+        self.assertEqual(self.lc.session.staged_loans, {})
+
+        # Executing it later stages everything again
+        self.assertNotEqual(self.order.execute(), 0)
+        stage = [span for span in self.order.timings if span['phase'] == 'stage'][0]
+        self.assertEqual(sorted(stage['loans'].keys()), [123, 234])
+
     def test_double_execute(self):
         """ test_double_execute
         An order can only be executed once
@@ -266,6 +594,171 @@ class TestBatchOrder(unittest.TestCase):
         )
 
 
+class TestOrderJournal(unittest.TestCase):
+    lc = None
+    logger = None
+    temp_dir = None
+    journal_file = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.temp_dir = tempfile.mkdtemp()
+        self.journal_file = os.path.join(self.temp_dir, 'orders.jsonl')
+
+        self.lc = LendingClub(logger=self.logger)
+        self.lc.session.base_url = 'http://127.0.0.1:8000/'
+        self.lc.session.set_logger(None)
+        self.lc.authenticate('test@test.com', 'supersecret')
+
+        self.lc.session.post('/session/enabled')
+        self.lc.session.request('delete', '/session')
+        self.lc.session.post('/session', data={'browseNotesAj': '3'})
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def phases(self):
+        return [entry['phase'] for entry in OrderJournal(self.journal_file).entries()]
+
+    def crash_after(self, phase, loans, last_order_id=None):
+        """
+        Write the journal of an order that stopped after a phase
+        """
+        journal = OrderJournal(self.journal_file)
+        journal.record('begin', loans=loans, last_order_id=last_order_id)
+        phases = ['begin', 'staged', 'token', 'submitted']
+        for name in phases[1:phases.index(phase) + 1]:
+            journal.record(name)
+
+        # And half of the next line
+        with open(self.journal_file, 'ab') as f:
+            f.write('{"phase":"con')
+
+    def test_journal(self):
+        order = self.lc.start_order(journal_file=self.journal_file)
+        order.add_batch([123, 234], 25)
+        order_id = order.execute()
+
+        self.assertEqual(self.phases(), ['begin', 'staged', 'token', 'submitted', 'confirmed'])
+        entries = OrderJournal(self.journal_file).last_order()
+        self.assertEqual(entries[0]['loans'], {'123': 25, '234': 25})
+        self.assertEqual(entries[-1]['order_id'], order_id)
+
+        # Nothing is sent again
+        self.lc.session.post('/session/disabled')
+        resumed = self.lc.start_order(journal_file=self.journal_file)
+        self.assertEqual(resumed.resume(), order_id)
+        self.assertEqual(resumed.loans, {123: 25, 234: 25})
+
+    def test_journal_failed(self):
+        order = self.lc.start_order(journal_file=self.journal_file)
+        order.add_batch([123, 234], 25)
+        self.assertRaises(DeadlineExceeded, lambda: order.execute(deadline=time.time() - 1))
+
+        self.assertEqual(self.phases(), ['begin', 'failed'])
+        self.assertEqual(self.lc.start_order(journal_file=self.journal_file).resume(), None)
+
+    def test_resume_empty(self):
+        self.assertEqual(self.lc.start_order(journal_file=self.journal_file).resume(), None)
+
+    def test_resume_staged(self):
+        """ test_resume_staged
+        An order that was staged, but not submitted, is staged again, since the cart can't be trusted after a restart
+        """
+        self.crash_after('staged', {'123': 25, '234': 25})
+
+        order = self.lc.start_order(journal_file=self.journal_file)
+        order_id = order.resume()
+        self.assertNotEqual(order_id, 0)
+        self.assertEqual(self.phases()[-6:], ['staged', 'begin', 'staged', 'token', 'submitted', 'confirmed'])
+        self.assertEqual(self.lc.session.get('/session').json()['stage_requests'], 2)
+
+    def test_resume_begin(self):
+        """ test_resume_begin
+        An order that was never staged is placed from the start
+        """
+        self.crash_after('begin', {'123': 25, '234': 25})
+
+        order = self.lc.start_order(journal_file=self.journal_file)
+        self.assertNotEqual(order.resume(), 0)
+        self.assertEqual(self.phases()[-5:], ['begin', 'staged', 'token', 'submitted', 'confirmed'])
+
+    def test_resume_submitted(self):
+        """ test_resume_submitted
+        An order that was submitted, and has notes, is not placed again
+        """
+        self.crash_after('submitted', {'1002': 25, '1003': 25})
+
+        order = self.lc.start_order(journal_file=self.journal_file)
+        self.assertEqual(order.resume(), 3001)
+        self.assertEqual(self.phases()[-2:], ['submitted', 'confirmed'])
+
+    def test_resume_older_notes(self):
+        """ test_resume_older_notes
+        Notes from orders before the one that was submitted don't count as it being placed
+        """
+        self.crash_after('submitted', {'1002': 25, '1003': 25}, last_order_id=3001)
+        self.lc.session.post('/session', data={'browseNotesAj': 'by_id'})
+
+        order = self.lc.start_order(journal_file=self.journal_file)
+        self.assertEqual(order.resume(), 123)
+        self.assertEqual(self.phases()[-5:], ['begin', 'staged', 'token', 'submitted', 'confirmed'])
+
+        # Placing it again keeps checking against the order it was interrupted after
+        entries = OrderJournal(self.journal_file).last_order()
+        self.assertEqual(entries[0]['last_order_id'], 3001)
+        self.assertEqual(OrderJournal(self.journal_file).last_order_id(), 3001)
+
+    def test_resume_notes_failed(self):
+        """ test_resume_notes_failed
+        When the notes can't be loaded, it's not known if the order was placed, so it isn't placed again
+        """
+        self.crash_after('submitted', {'1002': 25, '1003': 25})
+        self.lc.session.post('/session', data={'notes_fail': '1'})
+
+        order = self.lc.start_order(journal_file=self.journal_file)
+        self.assertRaises(LendingClubError, lambda: order.resume())
+        self.assertEqual(self.phases()[-1], 'submitted')
+        self.assertFalse('stage_requests' in self.lc.session.get('/session').json())
+
+    def test_journal_chunked(self):
+        """ test_journal_chunked
+        Each chunk of a chunked order is journaled as its own order
+        """
+        self.lc.session.post('/session', data={'browseNotesAj': 'by_id'})
+        order = self.lc.start_order(journal_file=self.journal_file)
+        order.add_batch(range(101, 105), 25)
+        order_ids = order.execute_chunked(chunk_size=2)
+
+        self.assertEqual(self.phases(), ['begin', 'staged', 'token', 'submitted', 'confirmed'] * 2)
+        entries = OrderJournal(self.journal_file).entries()
+        self.assertEqual(len(entries[0]['loans']), 2)
+        self.assertEqual([entry['order_id'] for entry in entries if entry['phase'] == 'confirmed'], order_ids)
+
+    def test_journal_chunked_submitted(self):
+        """ test_journal_chunked_submitted
+        A chunk that fails after it was submitted stops the order, so resume() can check it
+        """
+        self.lc.session.post('/session', data={'browseNotesAj': 'by_id', 'confirm_fail': '1'})
+        order = self.lc.start_order(journal_file=self.journal_file)
+        order.add_batch(range(101, 105), 25)
+
+        self.assertRaises(LendingClubError, lambda: order.execute_chunked(chunk_size=2))
+        self.assertEqual(self.phases(), ['begin', 'staged', 'token', 'submitted'])
+        self.assertEqual(order.order_ids, [])
+        self.assertEqual(len(order.outcomes), 4)
+
+    def test_resume_not_submitted(self):
+        """ test_resume_not_submitted
+        An order that was submitted, but has no notes, is placed again
+        """
+        self.crash_after('submitted', {'123': 25, '234': 25})
+
+        order = self.lc.start_order(journal_file=self.journal_file)
+        self.assertNotEqual(order.resume(), 0)
+        self.assertEqual(self.phases()[-5:], ['begin', 'staged', 'token', 'submitted', 'confirmed'])
+
+
 if __name__ == '__main__':
     # Start the web-server in a background thread
     http = ServerThread()
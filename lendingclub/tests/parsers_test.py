@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '../')
+sys.path.insert(0, '../../')
+
+from lendingclub.parsers import FastParser, SoupParser, json_decoder, json_decoders, iter_json_array
+
+
+def read_asset(file_name):
+    this_dir = os.path.dirname(os.path.realpath(__file__))
+    return open(os.path.join(this_dir, 'assets', file_name)).read()
+
+
+class TestParserParity(unittest.TestCase):
+    """
+    The fast parser should find the same elements as BeautifulSoup
+    """
+    fast = None
+    soup = None
+
+    def setUp(self):
+        self.fast = FastParser()
+        self.soup = SoupParser()
+
+    def tearDown(self):
+        pass
+
+    def find_both(self, markup, name=None, attrs=None, text=False):
+        fast = self.fast.find(self.fast.parse(markup), name, attrs, text)
+        soup = self.soup.find(self.soup.parse(markup), name, attrs, text)
+        self.assertEqual(fast, soup)
+        return fast
+
+    def test_login_errors(self):
+        element = self.find_both(read_asset('login_fail.html'), attrs={'id': 'master_error-list'}, text=True)
+        self.assertEqual(element['name'], 'div')
+        self.assertEqual(element['text'].strip(), 'Password must have 8 or more characters, with at least 1 number and 1 letter')
+
+    def test_struts_token(self):
+        html = read_asset('placeOrder.html')
+        element = self.find_both(html, 'input', {'name': 'struts.token.name'})
+        self.assertEqual(element['attrs']['value'], 'struts.token')
+
+        element = self.find_both(html, 'input', {'name': element['attrs']['value']})
+        self.assertEqual(element['attrs']['value'], 'abc123')
+
+    def test_order_id(self):
+        element = self.find_both(read_asset('orderConfirmed.html'), attrs={'id': 'order_id'})
+        self.assertEqual(element['attrs']['value'], '123')
+
+    def test_not_found(self):
+        self.assertEqual(self.find_both(read_asset('orderConfirmed.html'), attrs={'id': 'master_error-list'}, text=True), None)
+        self.assertEqual(self.find_both(read_asset('placeOrder.html'), 'div', {'name': 'struts.token.name'}), None)
+
+    def test_nested_text(self):
+        html = '<div id="outer">Hello <b>big &amp; <i>bold</i></b> world<br>!</div><p>after</p>'
+        element = self.find_both(html, 'div', text=True)
+        self.assertEqual(element['text'], u'Hello big & bold world!')
+
+    def test_stops_early(self):
+        """ test_stops_early
+        The fast parser doesn't read past the matching element
+        """
+        html = '<input id="order_id" value="123" /><div>' + ('<span>x</span>' * 100000)
+        element = self.fast.find(html, attrs={'id': 'order_id'})
+        self.assertEqual(element['attrs']['value'], '123')
+
+
+class TestJSONDecoders(unittest.TestCase):
+
+    def test_default(self):
+        """ test_default
+        The fastest installed decoder is the default and the standard library is always available
+        """
+        decoders = json_decoders()
+        self.assertEqual(decoders[-1][0], 'json')
+        self.assertTrue(json_decoder() is decoders[0][1])
+        self.assertTrue(json_decoder('json') is decoders[-1][1])
+
+    def test_not_installed(self):
+        self.assertRaises(ValueError, lambda: json_decoder('notjson'))
+
+    def test_parity(self):
+        """ test_parity
+        All decoders return the same values for the test assets
+        """
+        for asset in ('browseNotesAj_1.json', 'portfolio_getPortfolio.json', 'getSavedFilterAj_1.json'):
+            text = read_asset(asset)
+            expected = json_decoder('json')(text)
+            for name, decoder in json_decoders():
+                self.assertEqual(decoder(text), expected, '{0} decoded {1} differently'.format(name, asset))
+
+
+class TestIterJSONArray(unittest.TestCase):
+
+    def chunks(self, text, size):
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def test_parity(self):
+        """ test_parity
+        The streamed items match the fully decoded array, no matter where the chunks are split
+        """
+        text = read_asset('browseNotesAj_1.json')
+        expected = json_decoder('json')(text)['searchresult']['loans']
+        for size in (1, 7, 64, 1000, len(text)):
+            loans = list(iter_json_array(self.chunks(text, size), 'loans'))
+            self.assertEqual(loans, expected, 'Different loans with {0} byte chunks'.format(size))
+
+    def test_split_values(self):
+        """ test_split_values
+        Numbers and multi-byte characters split between chunks are not cut off
+        """
+        text = u'{"loans": [12, 345, "caf\u00e9", 6]}'.encode('utf-8')
+        for size in (1, 2, 3, 5):
+            self.assertEqual(list(iter_json_array(self.chunks(text, size), 'loans')), [12, 345, u'caf\u00e9', 6])
+
+    def test_missing(self):
+        self.assertEqual(list(iter_json_array(['{"result": "fail"}'], 'loans')), [])
+        self.assertEqual(list(iter_json_array(['{"loans": []}'], 'loans')), [])
+
+    def test_truncated(self):
+        """ test_truncated
+        The items before the cut are yielded, then an error is raised
+        """
+        items = iter_json_array(['{"loans": [{"a": 1}, {"a"'], 'loans')
+        self.assertEqual(items.next(), {'a': 1})
+        self.assertRaises(ValueError, lambda: items.next())
+
+
+if __name__ == '__main__':
+    unittest.main()
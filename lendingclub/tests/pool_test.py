@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+import sys
+import time
+import unittest
+from logger import TestLogger
+from server import ServerThread, handle_request
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '../')
+sys.path.insert(0, '../../')
+
+from lendingclub import LendingClubError
+from lendingclub.pool import SessionPool, RateLimiter
+from lendingclub.session import AuthenticationError, CircuitBreaker
+from lendingclub.transport import InMemoryTransport
+from requests.exceptions import ConnectionError
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_rate(self):
+        """ test_rate
+        After the burst, requests are spaced out to the rate
+        """
+        limiter = RateLimiter(20, burst=2)
+        start = time.time()
+        waits = [limiter.acquire() for i in range(6)]
+        elapsed = time.time() - start
+
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertTrue(elapsed >= 0.19, elapsed)
+        self.assertTrue(elapsed < 1, elapsed)
+
+
+class TestSessionPool(unittest.TestCase):
+    pool = None
+    logger = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.pool = SessionPool(rate=100, burst=10, login_interval=0.1)
+
+        for email, password in (('test@test.com', 'supersecret'), ('wrong@test.com', 'wrongsecret')):
+            lc = self.pool.add_account(email, password)
+            lc.session.base_url = 'http://127.0.0.1:8000/'
+
+    def tearDown(self):
+        pass
+
+    def test_shared(self):
+        """ test_shared
+        Every account shares the connection pool and rate limiter
+        """
+        for email in self.pool.accounts():
+            session = self.pool.account(email).session
+            self.assertTrue(session.http_adapter is self.pool.adapter)
+            self.assertTrue(session.rate_limiter is self.pool.rate_limiter)
+
+        self.pool.authenticate()
+        lc = self.pool.account('test@test.com')
+        lc.get_cash_balance()
+        self.assertTrue(lc.session._Session__session.get_adapter(lc.session.base_url) is self.pool.adapter)
+
+    def test_authenticate(self):
+        """ test_authenticate
+        Logins are staggered, and failed logins are reported per account
+        """
+        self.assertEqual(self.pool.healthy(), [])
+
+        start = time.time()
+        results = self.pool.authenticate()
+        self.assertTrue(time.time() - start >= 0.1)
+
+        self.assertEqual(results['test@test.com'], None)
+        self.assertTrue(isinstance(results['wrong@test.com'], AuthenticationError))
+        self.assertEqual(self.pool.healthy(), [self.pool.account('test@test.com')])
+
+    def test_routing(self):
+        """ test_routing
+        Searches are sent from healthy accounts only
+        """
+        self.assertRaises(LendingClubError, lambda: self.pool.any_account())
+        self.pool.authenticate()
+
+        good = self.pool.account('test@test.com')
+        for i in range(3):
+            self.assertTrue(self.pool.any_account() is good)
+
+        results = self.pool.search()
+        self.assertTrue(len(results['loans']) > 0)
+        self.assertTrue(good.session.last_response.url.endswith('/browse/browseNotesAj.action'))
+
+        # Until the account's circuit breaker opens
+        good.session.circuit_breaker('/browse/browseNotesAj.action').state = CircuitBreaker.OPEN
+        self.assertRaises(LendingClubError, lambda: self.pool.search())
+
+    def test_failover(self):
+        """ test_failover
+        A search that fails from one account is sent from the next one
+        """
+        def login(method, path, query, data):
+            return (302, {'location': '/account/summary.action'}, '')
+
+        def down(method, path, query, data):
+            raise ConnectionError('Connection refused')
+
+        pool = SessionPool(login_interval=0)
+        for email in ('one@test.com', 'two@test.com'):
+            transport = InMemoryTransport(handle_request)
+            transport.route('/account/login.action', login)
+            if email == 'one@test.com':
+                transport.route('/browse/browseNotesAj.action', down)
+            pool.add_account(email, 'secret', transport=transport)
+        pool.authenticate()
+
+        for i in range(4):
+            results = pool.search()
+            self.assertTrue(len(results['loans']) > 0)
+
+    def test_account(self):
+        self.assertEqual(self.pool.account('wrong@test.com').session.email, 'wrong@test.com')
+        self.assertRaises(LendingClubError, lambda: self.pool.account('nobody@test.com'))
+
+
+if __name__ == '__main__':
+    # Start the web-server in a background thread
+    http = ServerThread()
+    http.start()
+
+    # Run tests
+    unittest.main()
+
+    # Stop threads
+    http.stop()
@@ -30,10 +30,15 @@ THE SOFTWARE.
 
 import os
 import json
+import time
+import urllib
 import urlparse
 import cgi
+import mimetools
+import gzip
 import SocketServer
-from threading import Thread
+from threading import Thread, Event
+from StringIO import StringIO
 from BaseHTTPServer import BaseHTTPRequestHandler
 
 logging = None
@@ -131,9 +136,18 @@ class TestServerHandler(BaseHTTPRequestHandler):
 
     def output_file(self, file_name):
         """
-        Read a file from the assets directory and write it to response stream
+        Read a file from the assets directory and write it to response stream,
+        gzipped if the client accepts it
         """
-        self.write(self.read_asset_file(file_name))
+        output = self.read_asset_file(file_name)
+        if self.headers_sent is False and 'gzip' in (self.headers.getheader('accept-encoding') or ''):
+            buf = StringIO()
+            gz = gzip.GzipFile(fileobj=buf, mode='wb')
+            gz.write(output)
+            gz.close()
+            self.send_headers(headers={'Content-Encoding': 'gzip'})
+            output = buf.getvalue()
+        self.write(output)
 
     def output_error_json(self, message):
         """
@@ -201,6 +215,7 @@ class TestServerHandler(BaseHTTPRequestHandler):
 
         # Place order and strut token
         elif '/portfolio/placeOrder.action' == path:
+            time.sleep(float(http_session.get('place_order_delay', 0)))
             self.output_file('placeOrder.html')
 
         # Select portfolio option and save to session
@@ -212,6 +227,7 @@ class TestServerHandler(BaseHTTPRequestHandler):
         elif '/portfolio/confirmStartNewPortfolio.action' == path:
             if 'lending_match_point' in http_session:
                 del http_session['lending_match_point']
+            self.add_session('cart', {})
             self.send_headers(302, {'location': '/portfolio/viewOrder.action'})
 
         # Get list of loan fractions (must have lending_match_point set in the session)
@@ -236,7 +252,20 @@ class TestServerHandler(BaseHTTPRequestHandler):
 
         # Stage an order 2
         elif '/data/portfolio' == path and 'addToPortfolio' == query['method']:
-            self.output_file('portfolio_addToPortfolio.json')
+            time.sleep(float(http_session.get('stage_delay', 0)))
+            self.add_session('stage_requests', http_session.get('stage_requests', 0) + 1)
+            if query['loan_id'] in http_session.get('stage_fail', '').split(','):
+                self.write('{"result": "failure", "message": "The loan is no longer available"}')
+            else:
+                # Keep track of what's staged
+                cart = http_session.get('cart', {})
+                if query.get('remove') == 'true':
+                    cart.pop(query['loan_id'], None)
+                else:
+                    cart[query['loan_id']] = int(query['loan_amount'])
+                self.add_session('cart', cart)
+
+                self.output_file('portfolio_addToPortfolio.json')
 
         # Loan list for validation
         elif '/filter_validation' == path and 'id' in query and query['id'] in ['1', '2', '3']:
@@ -246,6 +275,11 @@ class TestServerHandler(BaseHTTPRequestHandler):
         elif '/session' == path:
             self.write(json.dumps(http_session))
 
+        # Slow response
+        elif '/sleep' == path:
+            time.sleep(float(query.get('seconds', 0.5)))
+            self.write('{"result": "success"}')
+
         # Nothing here yet
         elif '/portfolio/autoInvest.action' == path:
             self.write('/portfolio/autoInvest.action')
@@ -287,7 +321,34 @@ class TestServerHandler(BaseHTTPRequestHandler):
             ver = '1'
             if 'browseNotesAj' in http_session:
                 ver = http_session['browseNotesAj']
-            self.output_file('browseNotesAj_{0}.json'.format(ver))
+
+            # Find any loan IDs that are searched for
+            if ver == 'by_id':
+                results = json.loads(self.read_asset_file('browseNotesAj_3.json'))
+                loan_ids = []
+                for f in json.loads(data['filter']):
+                    if f['m_id'] == 43 and f['m_value']:
+                        loan_ids = f['m_value'][0]['value'].split(',')
+                missing = http_session.get('search_missing', '').split(',')
+                loan_ids = [loan_id for loan_id in loan_ids if loan_id not in missing]
+                template = results['searchresult']['loans'][0]
+                results['searchresult']['loans'] = [dict(template, loanGUID=loan_id) for loan_id in loan_ids]
+                results['searchresult']['totalRecords'] = len(loan_ids)
+                self.write(json.dumps(results))
+            else:
+                self.output_file('browseNotesAj_{0}.json'.format(ver))
+
+        # Your notes, one page at a time
+        elif '/account/loansAj.action' == path:
+            if http_session.get('notes_fail'):
+                self.output_error_json('Your session has expired')
+                return
+
+            notes = json.loads(self.read_asset_file('loansAj.json'))
+            start = int(data.get('startindex', 0))
+            size = int(data.get('pagesize', 100))
+            notes['searchresult']['loans'] = notes['searchresult']['loans'][start:start + size]
+            self.write(json.dumps(notes))
 
         # Investment option search
         elif '/portfolio/lendingMatchOptionsV2.action' == path:
@@ -302,7 +363,11 @@ class TestServerHandler(BaseHTTPRequestHandler):
 
         # Order confirmation
         elif '/portfolio/orderConfirmed.action' == path:
-            if 'struts.token' in data and data['struts.token'].strip() != '':
+            if http_session.get('confirm_fail'):
+                self.add_session('cart', {})
+                self.write('The order could not be confirmed')
+            elif 'struts.token' in data and data['struts.token'].strip() != '':
+                self.add_session('cart', {})
                 self.output_file('orderConfirmed.html')
             else:
                 print "No struts token passed"
@@ -327,6 +392,11 @@ class TestServerHandler(BaseHTTPRequestHandler):
             else:
                 self.write('{"error": "No method passed"}')
 
+        # Slow response
+        elif '/sleep' == path:
+            time.sleep(float(query.get('seconds', 0.5)))
+            self.write('{"result": "success"}')
+
         # Select a loan note
         elif '/browse/updateLSRAj.action' == path:
             self.output_file('updateLSRAj.json')
@@ -376,8 +446,56 @@ class TestServerHandler(BaseHTTPRequestHandler):
             self.write('Unknown delete action: {0}'.format(self.path))
 
 
-class ReusableServer(SocketServer.TCPServer):
+class InProcessHandler(TestServerHandler):
+    """
+    Runs a request through the TestServerHandler logic without a socket
+    """
+    status = None
+    response_headers = None
+
+    def __init__(self, method, path, query, data):
+        self.command = method
+        self.path = path
+        if query:
+            self.path += '?' + self.urlencode(query)
+
+        body = self.urlencode(data)
+        self.headers = mimetools.Message(StringIO('Content-Length: {0}\r\n\r\n'.format(len(body))))
+        self.rfile = StringIO(body)
+        self.wfile = StringIO()
+
+        self.status = 200
+        self.response_headers = {}
+
+    def urlencode(self, values):
+        values = values or {}
+        return urllib.urlencode([(k, unicode(v).encode('utf-8')) for k, v in values.iteritems()])
+
+    def send_response(self, code, message=None):
+        self.status = code
+
+    def send_header(self, key, value):
+        self.response_headers[key] = value
+
+    def end_headers(self):
+        pass
+
+    def respond(self):
+        getattr(self, 'do_' + self.command)()
+        return (self.status, self.response_headers, self.wfile.getvalue())
+
+
+def handle_request(method, path, query, data):
+    """
+    The handler for lendingclub.transport.InMemoryTransport, which serves the same
+    responses as this server, in the same process
+    """
+    return InProcessHandler(method, path, query, data).respond()
+
+
+class ReusableServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
     allow_reuse_address = True
+    daemon_threads = True
 
 
 class TestWebServer:
@@ -385,14 +503,16 @@ class TestWebServer:
     Simple class to start/stop the server
     """
     http = None
+    ready = None
 
     def __init__(self):
         #self.http = HTTPServer(('127.0.0.1', 7357), TestServerHandler)
-        pass
+        self.ready = Event()
 
     def start(self):
         print 'Starting server at 127.0.0.1:8000'
         self.http = ReusableServer(('127.0.0.1', 8000), TestServerHandler)
+        self.ready.set()
         self.http.serve_forever()
 
     def stop(self):
@@ -416,6 +536,7 @@ class ServerThread:
 
     def start(self):
         self.thread.start()
+        self.httpd.ready.wait(10)
         print 'Server thread started'
 
     def stop(self):
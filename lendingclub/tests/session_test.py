@@ -2,6 +2,10 @@
 
 import sys
 import os
+import time
+import shutil
+import tempfile
+import threading
 import unittest
 import subprocess
 from logger import TestLogger
@@ -11,7 +15,9 @@ sys.path.insert(0, '.')
 sys.path.insert(0, '../')
 sys.path.insert(0, '../../')
 
-from LendingClub import session
+from lendingclub import session
+from lendingclub.metrics import MetricsRegistry
+from requests.exceptions import Timeout
 
 
 class TestSession(unittest.TestCase):
@@ -51,6 +57,802 @@ class TestSession(unittest.TestCase):
         )
 
 
+@unittest.skipIf(session.Fernet is None, 'The cryptography package is not installed')
+class TestSavedSession(unittest.TestCase):
+    session = None
+    logger = None
+    temp_dir = None
+    session_file = None
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.session_file = os.path.join(self.temp_dir, 'session')
+
+        self.logger = TestLogger()
+        self.session = session.Session(logger=self.logger, session_file=self.session_file)
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        self.session.authenticate('test@test.com', 'supersecret')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def new_session(self, password='supersecret'):
+        logger = TestLogger()
+        new_session = session.Session('test@test.com', password, logger=logger, session_file=self.session_file)
+        new_session.base_url = 'http://127.0.0.1:8000/'
+        return new_session, logger
+
+    def test_saved(self):
+        """ test_saved
+        The session file is written on login and is not plain text
+        """
+        self.assertTrue(os.path.exists(self.session_file))
+        contents = open(self.session_file).read()
+        self.assertFalse('LC_FIRSTNAME' in contents)
+        self.assertFalse('test@test.com' in contents)
+
+    def test_resume(self):
+        """ test_resume
+        A new session picks up the saved cookies without logging in
+        """
+        new_session, logger = self.new_session()
+        self.assertTrue(new_session.authenticate())
+        self.assertTrue('Resumed session for test@test.com' in logger.debugs)
+        self.assertFalse('Attempting to authenticate: test@test.com' in logger.debugs)
+
+        response = new_session.get('/account/summary.action')
+        self.assertEqual(response.request.headers['Cookie'], 'LC_FIRSTNAME=John')
+
+    def test_expired(self):
+        """ test_expired
+        An expired saved session logs in again
+        """
+        self.session.last_request_time = time.time() - (self.session.session_timeout * 60)
+        self.session.save_session()
+
+        new_session, logger = self.new_session()
+        self.assertTrue(new_session.authenticate())
+        self.assertFalse('Resumed session for test@test.com' in logger.debugs)
+        self.assertTrue('Attempting to authenticate: test@test.com' in logger.debugs)
+
+    def test_wrong_password(self):
+        """ test_wrong_password
+        The saved session cannot be decrypted with another password
+        """
+        new_session, logger = self.new_session('wrongsecret')
+        self.assertFalse(new_session.resume_session())
+        self.assertRaises(session.AuthenticationError, lambda: new_session.authenticate())
+
+
+class TestSessionWithoutCryptography(unittest.TestCase):
+    temp_dir = None
+    session_file = None
+    fernet = None
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.session_file = os.path.join(self.temp_dir, 'session')
+
+        self.fernet = session.Fernet
+        session.Fernet = None
+
+    def tearDown(self):
+        session.Fernet = self.fernet
+        shutil.rmtree(self.temp_dir)
+
+    def test_without_cryptography(self):
+        """ test_without_cryptography
+        Without the cryptography package, logging in still works and the session isn't persisted
+        """
+        logger = TestLogger()
+        new_session = session.Session('test@test.com', 'supersecret', logger=logger, session_file=self.session_file)
+        new_session.base_url = 'http://127.0.0.1:8000/'
+
+        self.assertTrue(new_session.authenticate())
+        self.assertTrue('Attempting to authenticate: test@test.com' in logger.debugs)
+        self.assertEqual(len(logger.warnings), 1)
+        self.assertFalse(os.path.exists(self.session_file))
+
+        new_session.keepalive()
+        self.assertEqual(len(logger.warnings), 1)
+
+
+class TestKeepalive(unittest.TestCase):
+    session = None
+    logger = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.session = session.Session(logger=self.logger)
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        self.session.authenticate('test@test.com', 'supersecret')
+
+        # Refresh the session every ~0.5 seconds
+        self.session.session_timeout = 0.02
+        self.session.keepalive_margin = 0.01
+
+    def tearDown(self):
+        self.session.stop_keepalive()
+
+    def test_keepalive(self):
+        """ test_keepalive
+        The session is refreshed in the background before it times out
+        """
+        last_request_time = self.session.last_request_time
+        self.session.start_keepalive()
+        time.sleep(1.5)
+
+        self.assertTrue(self.session.last_request_time > last_request_time)
+        self.assertTrue('Keepalive refreshed the session' in self.logger.debugs)
+        self.assertEqual(self.logger.debugs.count('Attempting to authenticate: test@test.com'), 1)
+
+    def test_stop(self):
+        """ test_stop
+        No requests are sent after the keepalive thread stops
+        """
+        self.session.start_keepalive()
+        self.session.stop_keepalive()
+        time.sleep(1)
+        self.assertFalse('Keepalive refreshed the session' in self.logger.debugs)
+
+
+class TestTimingHooks(unittest.TestCase):
+    session = None
+    logger = None
+    timings = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.session = session.Session(logger=self.logger)
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        self.session.authenticate('test@test.com', 'supersecret')
+
+        self.timings = []
+        self.session.add_timing_hook(self.record)
+
+    def tearDown(self):
+        pass
+
+    def record(self, timing):
+        self.timings.append(dict(timing))
+
+    def test_request(self):
+        """ test_request
+        Hooks receive the timing breakdown of the request, tagged by method and path
+        """
+        response = self.session.get('/browse/cashBalanceAj.action')
+        self.assertEqual(len(self.timings), 1)
+
+        timing = self.timings[0]
+        self.assertEqual(timing['method'], 'GET')
+        self.assertEqual(timing['path'], '/browse/cashBalanceAj.action')
+        self.assertEqual(timing['stage'], 'request')
+        self.assertEqual(timing['status'], 200)
+        self.assertEqual(timing['parse'], None)
+        for key in ('queue', 'ttfb', 'download', 'total'):
+            self.assertTrue(timing[key] >= 0)
+        self.assertTrue(timing['total'] >= timing['ttfb'] + timing['download'])
+
+        # Parsing adds the parse stage
+        self.session.json(response)
+        self.assertEqual(len(self.timings), 2)
+        self.assertEqual(self.timings[1]['stage'], 'parse')
+        self.assertTrue(self.timings[1]['parse'] >= 0)
+
+    def test_error(self):
+        """ test_error
+        Hooks receive failed requests too
+        """
+        self.session.base_url = 'http://127.0.0.1:1/'
+        self.assertRaises(session.NetworkError, lambda: self.session.get('/browse/cashBalanceAj.action'))
+        self.assertEqual(len(self.timings), 1)
+        self.assertTrue(isinstance(self.timings[0]['error'], session.NetworkError))
+        self.assertEqual(self.timings[0]['status'], None)
+
+    def test_remove(self):
+        """ test_remove
+        Removed hooks are no longer called
+        """
+        self.session.remove_timing_hook(self.record)
+        response = self.session.get('/browse/cashBalanceAj.action')
+        self.assertEqual(len(self.timings), 0)
+        self.assertFalse(hasattr(response, 'timing'))
+
+    def test_compression(self):
+        """ test_compression
+        Responses are gzipped, and the compressed and decompressed sizes are both recorded
+        """
+        self.assertTrue('gzip' in self.session.accept_encoding)
+        response = self.session.post('/browse/browseNotesAj.action', data={'method': 'search'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+
+        timing = self.timings[0]
+        self.assertEqual(timing['encoding'], 'gzip')
+        self.assertEqual(timing['body_bytes'], len(response.content))
+        self.assertTrue(0 < timing['wire_bytes'] < timing['body_bytes'])
+
+    def test_no_compression(self):
+        self.session.accept_encoding = 'identity'
+        self.session.authenticate()
+        self.timings = []
+
+        response = self.session.post('/browse/browseNotesAj.action', data={'method': 'search'})
+        self.assertFalse('Content-Encoding' in response.headers)
+        self.assertEqual(self.timings[0]['encoding'], None)
+        self.assertEqual(self.timings[0]['wire_bytes'], self.timings[0]['body_bytes'])
+
+
+class TestResponseCache(unittest.TestCase):
+    session = None
+    logger = None
+    requests = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.session = session.Session(logger=self.logger)
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        self.session.authenticate('test@test.com', 'supersecret')
+
+        self.requests = []
+        self.session.add_timing_hook(lambda timing: self.requests.append(timing['path']))
+
+    def tearDown(self):
+        pass
+
+    def test_not_cached(self):
+        """ test_not_cached
+        Nothing is cached by default
+        """
+        self.session.get('/browse/cashBalanceAj.action')
+        self.session.get('/browse/cashBalanceAj.action')
+        self.assertEqual(len(self.requests), 2)
+
+    def test_ttl(self):
+        self.session.cache.cache_endpoint('/browse/cashBalanceAj.action', 0.5)
+
+        first = self.session.get('/browse/cashBalanceAj.action')
+        second = self.session.get('/browse/cashBalanceAj.action')
+        self.assertTrue(first is second)
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.session.cache.hits, 1)
+
+        time.sleep(0.6)
+        self.session.get('/browse/cashBalanceAj.action')
+        self.assertEqual(len(self.requests), 2)
+
+    def test_lru(self):
+        """ test_lru
+        Query string variations are cached separately, up to the endpoint's limit
+        """
+        self.session.cache.cache_endpoint('/browse/getSavedFilterAj.action', 60, 2)
+
+        self.session.get('/browse/getSavedFilterAj.action', query={'id': 1})
+        self.session.get('/browse/getSavedFilterAj.action', query={'id': 2})
+        self.session.get('/browse/getSavedFilterAj.action', query={'id': 1})  # cached, now most recently used
+        self.session.get('/browse/getSavedFilterAj.action', query={'id': 3})  # removes 2
+        self.assertEqual(len(self.requests), 3)
+
+        self.session.get('/browse/getSavedFilterAj.action', query={'id': 1})
+        self.assertEqual(len(self.requests), 3)
+        self.session.get('/browse/getSavedFilterAj.action', query={'id': 2})
+        self.assertEqual(len(self.requests), 4)
+
+    def test_invalidate(self):
+        self.session.enable_cache()
+        self.session.get('/browse/cashBalanceAj.action')
+        self.session.get('/data/portfolioManagement?method=getLCPortfolios')
+
+        self.session.cache.invalidate('/browse/cashBalanceAj.action')
+        self.session.get('/browse/cashBalanceAj.action')
+        self.session.get('/data/portfolioManagement?method=getLCPortfolios')
+        self.assertEqual(len(self.requests), 3)
+
+        # Everything is invalidated when authenticating
+        self.session.authenticate()
+        self.session.get('/data/portfolioManagement?method=getLCPortfolios')
+        self.assertEqual(self.requests[-1], '/data/portfolioManagement?method=getLCPortfolios')
+
+    def test_post(self):
+        """ test_post
+        Only GET requests are cached
+        """
+        self.session.cache.cache_endpoint('/browse/browseNotesAj.action', 60)
+        self.session.post('/browse/browseNotesAj.action', data={'method': 'search'})
+        self.session.post('/browse/browseNotesAj.action', data={'method': 'search'})
+        self.assertEqual(len(self.requests), 2)
+
+
+class TestCoalescing(unittest.TestCase):
+    session = None
+    logger = None
+    requests = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.session = session.Session(logger=self.logger)
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        self.session.authenticate('test@test.com', 'supersecret')
+
+        self.requests = []
+        self.session.add_timing_hook(lambda timing: self.requests.append(timing['path']))
+
+    def tearDown(self):
+        pass
+
+    def send_all(self, send, count=5):
+        """
+        Call send from several threads at the same time and return the responses
+        """
+        responses = []
+
+        def run():
+            responses.append(send())
+
+        threads = [threading.Thread(target=run) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return responses
+
+    def test_get(self):
+        """ test_get
+        Identical GET requests in progress at the same time are sent once
+        """
+        responses = self.send_all(lambda: self.session.get('/sleep', query={'seconds': 0.5}))
+        self.assertEqual(len(responses), 5)
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.session.coalesced_hits, 4)
+        for response in responses:
+            self.assertTrue(response is responses[0])
+
+    def test_different_query(self):
+        self.send_all(lambda: self.session.get('/sleep', query={'seconds': 0.5}), 2)
+        self.send_all(lambda: self.session.get('/sleep', query={'seconds': 0.25}), 2)
+        self.assertEqual(len(self.requests), 2)
+
+    def test_post(self):
+        """ test_post
+        POST requests are only coalesced when they're idempotent
+        """
+        self.send_all(lambda: self.session.post('/sleep?seconds=0.5', data={'foo': 'bar'}), 3)
+        self.assertEqual(len(self.requests), 3)
+
+        self.send_all(lambda: self.session.post('/sleep?seconds=0.5', data={'foo': 'bar'}, idempotent=True), 3)
+        self.assertEqual(len(self.requests), 4)
+
+    def test_disabled(self):
+        self.session.coalesce_requests = False
+        self.send_all(lambda: self.session.get('/sleep', query={'seconds': 0.5}), 3)
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(self.session.coalesced_hits, 0)
+
+    def test_error(self):
+        """ test_error
+        Waiting requests get the same error
+        """
+        self.session.base_url = 'http://127.0.0.1:1/'
+        errors = []
+
+        def send():
+            try:
+                self.session.get('/sleep')
+            except session.NetworkError as e:
+                errors.append(e)
+
+        self.send_all(send, 3)
+        self.assertEqual(len(errors), 3)
+
+
+class TestScheduler(unittest.TestCase):
+    session = None
+    logger = None
+    order = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.session = session.Session(logger=self.logger)
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        self.session.authenticate('test@test.com', 'supersecret')
+        self.session.scheduler = session.RequestScheduler(1)
+
+        self.order = []
+        self.session.add_timing_hook(self.record)
+
+    def tearDown(self):
+        pass
+
+    def record(self, timing):
+        if timing['path'].startswith('/sleep?'):
+            self.order.append((timing['priority'], timing['path']))
+
+    def start(self, target):
+        thread = threading.Thread(target=target)
+        thread.start()
+        return thread
+
+    def test_slots(self):
+        """ test_slots
+        Waiting requests get the free slot in priority order, then in the order they arrived
+        """
+        scheduler = session.RequestScheduler(1)
+        scheduler.acquire()
+        granted = []
+
+        def wait(name, priority):
+            scheduler.acquire(priority)
+            granted.append(name)
+            scheduler.release()
+
+        threads = []
+        for name, priority in (('bulk', session.PRIORITY_BULK), ('normal', session.PRIORITY_NORMAL),
+                               ('high 1', session.PRIORITY_HIGH), ('high 2', session.PRIORITY_HIGH)):
+            threads.append(self.start(lambda: wait(name, priority)))
+            while scheduler.waiting() < len(threads):
+                time.sleep(0.01)
+
+        scheduler.release()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(granted, ['high 1', 'high 2', 'normal', 'bulk'])
+        self.assertEqual(scheduler.active, 0)
+
+    def test_slot_timeout(self):
+        """ test_slot_timeout
+        A request that times out waiting for a slot stops waiting and gives up its place
+        """
+        scheduler = session.RequestScheduler(1)
+        scheduler.acquire()
+
+        start = time.time()
+        self.assertEqual(scheduler.acquire(timeout=0.1), None)
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertEqual(scheduler.waiting(), 0)
+
+        scheduler.release()
+        self.assertEqual(scheduler.active, 0)
+
+    def test_priority(self):
+        """ test_priority
+        High priority requests jump ahead of bulk requests waiting for the session
+        """
+        threads = [self.start(lambda: self.session.get('/sleep?seconds=0.3', idempotent=False))]
+        time.sleep(0.1)
+
+        threads.append(self.start(lambda: self.session.get('/sleep?seconds=0.01', idempotent=False, priority=session.PRIORITY_BULK)))
+        while self.session.scheduler.waiting() < 1:
+            time.sleep(0.01)
+
+        def high():
+            with self.session.priority(session.PRIORITY_HIGH):
+                self.session.get('/sleep?seconds=0.02', idempotent=False)
+        threads.append(self.start(high))
+        while self.session.scheduler.waiting() < 2:
+            time.sleep(0.01)
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.order, [
+            ('normal', '/sleep?seconds=0.3'),
+            ('high', '/sleep?seconds=0.02'),
+            ('bulk', '/sleep?seconds=0.01')
+        ])
+
+    def test_metrics(self):
+        metrics = MetricsRegistry()
+        self.session.set_metrics(metrics)
+        self.session.get('/browse/cashBalanceAj.action', priority=session.PRIORITY_BULK)
+        self.assertEqual(metrics.value('request_queue_wait_seconds', {'priority': 'bulk'}), 1)
+
+
+class TestTimeouts(unittest.TestCase):
+    session = None
+    logger = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.session = session.Session(logger=self.logger)
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        self.session.authenticate('test@test.com', 'supersecret')
+
+    def tearDown(self):
+        pass
+
+    def test_endpoint_timeout(self):
+        """ test_endpoint_timeout
+        Each endpoint can have its own timeouts
+        """
+        self.assertEqual(self.session.endpoint_timeout('/sleep'), self.session.timeout)
+        self.session.set_endpoint_timeout('/sleep', read=0.1)
+        self.assertEqual(self.session.endpoint_timeout('/sleep?seconds=1'), (self.session.timeout[0], 0.1))
+
+        try:
+            self.session.get('/sleep', query={'seconds': 0.5})
+            self.fail('The request did not time out')
+        except session.NetworkError as e:
+            self.assertFalse(isinstance(e, session.DeadlineExceeded))
+            self.assertTrue(isinstance(e.origin, Timeout))
+
+        self.session.set_endpoint_timeout('/sleep')
+        self.assertEqual(self.session.endpoint_timeout('/sleep'), self.session.timeout)
+        self.session.get('/sleep', query={'seconds': 0.2})
+
+    def test_deadline(self):
+        """ test_deadline
+        Requests are cut off at the deadline
+        """
+        start = time.time()
+        with self.session.deadline(start + 0.2):
+            self.assertRaises(session.DeadlineExceeded, lambda: self.session.get('/sleep', query={'seconds': 1}))
+        self.assertTrue(time.time() - start < 0.9)
+
+        # The deadline ends with the block
+        self.session.get('/sleep', query={'seconds': 0.3})
+
+    def test_deadline_queued(self):
+        """ test_deadline_queued
+        A request waiting for a slot behind a slow request is cut off at the deadline
+        """
+        self.session.scheduler = session.RequestScheduler(1)
+        thread = threading.Thread(target=lambda: self.session.get('/sleep?seconds=1', idempotent=False, priority=session.PRIORITY_BULK))
+        thread.start()
+        time.sleep(0.1)
+
+        start = time.time()
+        with self.session.deadline(start + 0.1):
+            self.assertRaises(session.DeadlineExceeded, lambda: self.session.get('/browse/cashBalanceAj.action'))
+        self.assertTrue(time.time() - start < 0.5)
+        self.assertEqual(self.session.scheduler.waiting(), 0)
+
+        thread.join()
+        self.assertEqual(self.session.scheduler.active, 0)
+
+    def test_deadline_passed(self):
+        """ test_deadline_passed
+        Nothing is sent after the deadline, and inner deadlines can't extend it
+        """
+        timings = []
+        self.session.add_timing_hook(timings.append)
+
+        with self.session.deadline(time.time() - 1):
+            with self.session.deadline(time.time() + 10):
+                self.assertRaises(session.DeadlineExceeded, lambda: self.session.get('/browse/cashBalanceAj.action'))
+
+        self.assertEqual(len(timings), 1)
+        self.assertEqual(timings[0]['status'], None)
+        self.assertTrue(isinstance(timings[0]['error'], session.DeadlineExceeded))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    session = None
+    logger = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.session = session.Session(logger=self.logger)
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        self.session.circuit_breaker_threshold = 2
+        self.session.authenticate('test@test.com', 'supersecret')
+
+    def tearDown(self):
+        pass
+
+    def test_opens_after_failures(self):
+        """ test_opens_after_failures
+        The breaker opens after consecutive network errors and then fails fast
+        """
+        self.session.base_url = 'http://127.0.0.1:1/'
+        for i in range(2):
+            self.assertRaises(session.NetworkError, lambda: self.session.get('/browse/cashBalanceAj.action'))
+
+        breaker = self.session.circuit_breaker('/browse/cashBalanceAj.action')
+        self.assertEqual(breaker.state, session.CircuitBreaker.OPEN)
+
+        # Even with the server back, the open breaker doesn't let requests through
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        self.assertRaises(session.NetworkError, lambda: self.session.get('/browse/cashBalanceAj.action'))
+
+        # Other endpoints are not affected
+        self.assertEqual(self.session.get('/account/summary.action').status_code, 200)
+
+    def test_half_open_probe(self):
+        """ test_half_open_probe
+        After the reset timeout a single successful probe closes the breaker
+        """
+        self.session.circuit_breaker_timeout = 0
+        self.session.base_url = 'http://127.0.0.1:1/'
+        for i in range(2):
+            self.assertRaises(session.NetworkError, lambda: self.session.get('/browse/cashBalanceAj.action'))
+
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        breaker = self.session.circuit_breaker('/browse/cashBalanceAj.action')
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, session.CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())  # Only one probe at a time
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, session.CircuitBreaker.CLOSED)
+
+    def test_probe_released(self):
+        """ test_probe_released
+        A probe that fails for a reason unrelated to the endpoint doesn't leave the breaker stuck half-open
+        """
+        self.session.circuit_breaker_timeout = 0
+        self.session.base_url = 'http://127.0.0.1:1/'
+        for i in range(2):
+            self.assertRaises(session.NetworkError, lambda: self.session.get('/browse/cashBalanceAj.action'))
+
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        self.assertRaises(session.SessionError, lambda: self.session.request('PUT', '/browse/cashBalanceAj.action'))
+
+        breaker = self.session.circuit_breaker('/browse/cashBalanceAj.action')
+        self.assertEqual(breaker.state, session.CircuitBreaker.HALF_OPEN)
+        self.session.get('/browse/cashBalanceAj.action')
+        self.assertEqual(breaker.state, session.CircuitBreaker.CLOSED)
+
+    def test_stale_probe(self):
+        """ test_stale_probe
+        half_open() lets another probe through when the last one has been in flight too long
+        """
+        breaker = session.CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+        breaker.record_failure()
+        breaker.half_open()
+        self.assertTrue(breaker.allow())
+
+        breaker.half_open()
+        self.assertFalse(breaker.allow())  # The probe is still recent
+
+        time.sleep(0.15)
+        breaker.half_open()
+        self.assertTrue(breaker.allow())
+
+    def test_slow_responses(self):
+        """ test_slow_responses
+        Responses slower than the latency threshold count as failures
+        """
+        breaker = session.CircuitBreaker(failure_threshold=2, latency_threshold=1)
+        breaker.record_success(1.5)
+        breaker.record_success(2)
+        self.assertEqual(breaker.state, session.CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_site_available(self):
+        """ test_site_available
+        is_site_available() fails fast while down and half-opens other breakers when back up
+        """
+        self.session.base_url = 'http://127.0.0.1:1/'
+        for i in range(2):
+            self.assertRaises(session.NetworkError, lambda: self.session.get('/browse/cashBalanceAj.action'))
+            self.assertFalse(self.session.is_site_available())
+        self.assertEqual(self.session.circuit_breaker('/').state, session.CircuitBreaker.OPEN)
+
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        self.assertFalse(self.session.is_site_available())  # Still open
+
+        self.session.circuit_breaker('/').opened_at = 0
+        self.assertTrue(self.session.is_site_available())
+
+        breaker = self.session.circuit_breaker('/browse/cashBalanceAj.action')
+        self.assertEqual(breaker.state, session.CircuitBreaker.HALF_OPEN)
+        self.session.get('/browse/cashBalanceAj.action')
+        self.assertEqual(breaker.state, session.CircuitBreaker.CLOSED)
+
+
+class TestBatch(unittest.TestCase):
+    session = None
+    logger = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.session = session.Session(logger=self.logger)
+        self.session.base_url = 'http://127.0.0.1:8000/'
+        self.session.authenticate('test@test.com', 'supersecret')
+
+    def tearDown(self):
+        pass
+
+    def test_batch(self):
+        """ test_batch
+        Requests are sent at the same time, and results come back in order with per-request errors
+        """
+        specs = [{'path': '/sleep', 'query': {'seconds': 0.3 - i * 0.1}, 'idempotent': False} for i in range(3)]
+        specs.append({'method': 'PUT', 'path': '/session'})
+        specs.append({'path': '/browse/cashBalanceAj.action'})
+
+        results = self.session.batch(specs, max_workers=5)
+        self.assertTrue(results.elapsed < 0.55, results.elapsed)
+        self.assertEqual(len(results), 5)
+
+        for i in range(3):
+            self.assertTrue(results.responses[i].url.endswith('seconds={0}'.format(0.3 - i * 0.1)))
+            self.assertTrue(results.times[i] >= 0.3 - i * 0.1)
+        self.assertEqual(self.session.json(results.responses[4])['cashBalance'], u'$216.02')
+
+        self.assertEqual(results.failed(), [3])
+        self.assertEqual(results.responses[3], None)
+        self.assertTrue(isinstance(results.errors[3], session.SessionError))
+        self.assertRaises(session.SessionError, results.raise_for_errors)
+
+    def test_context(self):
+        """ test_context
+        The priority and deadline of the calling thread apply to every request in the batch
+        """
+        priorities = []
+        self.session.add_timing_hook(lambda timing: priorities.append(timing['priority']))
+
+        specs = [{'path': '/sleep', 'query': {'seconds': 0.5}, 'idempotent': False}] * 2
+        with self.session.priority(session.PRIORITY_HIGH), self.session.deadline(time.time() + 0.2):
+            results = self.session.batch(specs)
+
+        self.assertEqual(results.failed(), [0, 1])
+        self.assertTrue(isinstance(results.errors[0], session.DeadlineExceeded))
+        self.assertEqual(priorities, ['high', 'high'])
+
+
+class TestPrewarm(unittest.TestCase):
+    session = None
+    logger = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.session = session.Session(logger=self.logger)
+        self.session.base_url = 'http://127.0.0.1:8000/'
+
+    def tearDown(self):
+        self.session.clear_burst_windows()
+
+    def connections(self):
+        """
+        The number of connections opened in the session's pool
+        """
+        http_session = self.session._Session__session
+        if http_session is None:
+            return 0
+        adapter = http_session.get_adapter(self.session.base_url)
+        return adapter.poolmanager.connection_from_url(self.session.base_url).num_connections
+
+    def test_prewarm(self):
+        """ test_prewarm
+        Each HEAD request gets its own connection, without logging in
+        """
+        self.assertEqual(self.session.prewarm(3), 3)
+        self.assertEqual(self.connections(), 3)
+        self.assertEqual(self.session.last_request_time, 0)
+
+        self.session.base_url = 'http://127.0.0.1:1/'
+        self.assertEqual(self.session.prewarm(2), 0)
+
+    def test_burst_window(self):
+        """ test_burst_window
+        Connections are opened prewarm_lead seconds before the burst window
+        """
+        self.session.prewarm_lead = 1
+        self.session.add_burst_window(time.time() + 1.3, 2)
+        self.assertEqual(self.connections(), 0)
+
+        time.sleep(0.8)
+        self.assertEqual(self.connections(), 2)
+
+    def test_clear_burst_windows(self):
+        self.session.prewarm_lead = 1
+        self.session.add_burst_window(time.time() + 1.2)
+        self.session.clear_burst_windows()
+
+        time.sleep(0.5)
+        self.assertEqual(self.connections(), 0)
+
+    def test_site_available(self):
+        """ test_site_available
+        The site check goes through the session's connection pool
+        """
+        self.assertTrue(self.session.is_site_available())
+        self.assertTrue(self.session.is_site_available())
+        self.assertEqual(self.connections(), 1)
+
+
 if __name__ == '__main__':
     # Start the web-server in a background thread
     http = ServerThread()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+import unittest
+from logger import TestLogger
+from server import ServerThread, handle_request
+
+sys.path.insert(0, '.')
+sys.path.insert(0, '../')
+sys.path.insert(0, '../../')
+
+from lendingclub import LendingClub
+from lendingclub.session import NetworkError
+from lendingclub.transport import RecordingTransport, ReplayTransport, InMemoryTransport, RequestsTransport
+
+
+def create_lc(logger, transport, base_url='http://127.0.0.1:8000/'):
+    lc = LendingClub(logger=logger, transport=transport)
+    lc.session.base_url = base_url
+    lc.session.set_logger(None)
+    return lc
+
+
+def run_flow(lc):
+    """
+    Log in, build a portfolio and place an order
+    """
+    lc.authenticate('test@test.com', 'supersecret')
+    lc.session.request('delete', '/session')
+    lc.session.post('/session', data={'browseNotesAj': '3'})
+
+    results = {
+        'cash': lc.get_cash_balance(),
+        'portfolio': lc.build_portfolio(200, 25, 15, 16)
+    }
+
+    order = lc.start_order()
+    order.add_batch([
+        {
+            'loan_id': 123,
+            'invest_amount': 50
+        }, {
+            'loan_id': 234,
+            'invest_amount': 75
+        }
+    ])
+    results['order_id'] = order.execute()
+
+    return results
+
+
+class TestRecordReplay(unittest.TestCase):
+    temp_dir = None
+    logger = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def create_lc(self, transport, base_url='http://127.0.0.1:8000/'):
+        return create_lc(self.logger, transport, base_url)
+
+    def record_and_replay(self, file_name):
+        cassette = os.path.join(self.temp_dir, file_name)
+
+        recorder = RecordingTransport(cassette)
+        recorded = run_flow(self.create_lc(recorder))
+        recorder.close()
+
+        # Nothing is listening on port 1, so every response must come from the cassette
+        replayed = run_flow(self.create_lc(ReplayTransport(cassette), 'http://127.0.0.1:1/'))
+
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(replayed['cash'], 216.02)
+        self.assertNotEqual(replayed['order_id'], 0)
+
+        return cassette
+
+    def test_replay(self):
+        cassette = self.record_and_replay('flow.jsonl')
+
+        # The password is not saved
+        text = open(cassette).read()
+        self.assertTrue('/account/login.action' in text)
+        self.assertFalse('supersecret' in text)
+
+    def test_replay_gzip(self):
+        cassette = self.record_and_replay('flow.jsonl.gz')
+        self.assertEqual(open(cassette, 'rb').read(2), '\x1f\x8b')
+
+    def test_replay_repeats(self):
+        """ test_replay_repeats
+        Repeated requests are replayed in order, then the last response is repeated
+        """
+        cassette = os.path.join(self.temp_dir, 'repeat.jsonl')
+        recorder = RecordingTransport(cassette)
+        lc = self.create_lc(recorder)
+        lc.authenticate('test@test.com', 'supersecret')
+        lc.session.request('delete', '/session')
+        lc.session.post('/session', data={'foo': 'one'})
+        first = lc.session.get('/session').json()
+        lc.session.post('/session', data={'foo': 'two'})
+        second = lc.session.get('/session').json()
+        recorder.close()
+
+        lc = self.create_lc(ReplayTransport(cassette), 'http://127.0.0.1:1/')
+        lc.authenticate('test@test.com', 'supersecret')
+        self.assertEqual(lc.session.get('/session').json(), first)
+        self.assertEqual(lc.session.get('/session').json(), second)
+        self.assertEqual(lc.session.get('/session').json(), second)
+
+    def test_not_recorded(self):
+        cassette = os.path.join(self.temp_dir, 'empty.jsonl')
+        RecordingTransport(cassette).close()
+
+        lc = self.create_lc(ReplayTransport(cassette), 'http://127.0.0.1:1/')
+        self.assertRaises(NetworkError, lambda: lc.authenticate('test@test.com', 'supersecret'))
+
+
+class TestInMemoryTransport(unittest.TestCase):
+    logger = None
+
+    def setUp(self):
+        self.logger = TestLogger()
+
+    def tearDown(self):
+        pass
+
+    def test_default(self):
+        lc = create_lc(self.logger, None)
+        self.assertTrue(isinstance(lc.session.transport, RequestsTransport))
+
+    def test_test_server(self):
+        """ test_test_server
+        The test server handlers give the same results in-process as over HTTP
+        """
+        expected = run_flow(create_lc(self.logger, None))
+        results = run_flow(create_lc(self.logger, InMemoryTransport(handle_request), 'http://127.0.0.1:1/'))
+        self.assertEqual(results, expected)
+
+    def test_routes(self):
+        """ test_routes
+        Paths are routed to their handler, redirects are followed and unknown paths are not found
+        """
+        calls = []
+
+        def redirect(method, path, query, data):
+            calls.append((method, path, query, data))
+            return (302, {'Location': '/target?b=2'}, '')
+
+        def target(method, path, query, data):
+            calls.append((method, path, query, data))
+            return u'{"result": "success"}'
+
+        transport = InMemoryTransport()
+        transport.route('/redirect', redirect)
+        transport.route('target/', target)
+
+        lc = create_lc(self.logger, transport, 'http://127.0.0.1:1/')
+        lc.session.last_request_time = time.time()
+
+        response = lc.session.post('/redirect', query={'a': '1'}, data={'foo': 'bar'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(lc.session.json(response), {'result': 'success'})
+        self.assertEqual(response.url, 'http://127.0.0.1:1/target?b=2')
+        self.assertEqual(calls, [('POST', '/redirect', {'a': '1'}, {'foo': 'bar'}), ('GET', '/target', {'b': '2'}, {})])
+
+        response = lc.session.post('/redirect', redirects=False)
+        self.assertEqual(response.status_code, 302)
+
+        response = lc.session.get('/unknown')
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    # Start the web-server in a background thread
+    http = ServerThread()
+    http.start()
+
+    # Run tests
+    unittest.main()
+
+    # Stop threads
+    http.stop()
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+
+"""
+Transports send the HTTP requests from :class:`lendingclub.session.Session`. Each one implements
+the :class:`Transport` interface.
+
+By default requests are sent over HTTP with the `requests <http://docs.python-requests.org/>`_ library.
+A :class:`RecordingTransport` saves every request and response to a cassette file, which
+a :class:`ReplayTransport` can serve back later without opening any sockets. This makes
+whole flows, like building a portfolio and placing an order, repeatable in tests and benchmarks.
+An :class:`InMemoryTransport` routes requests straight to Python functions, for fake servers.
+"""
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2013 Jeremy Gillick
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import gzip
+import json
+import base64
+import urlparse
+import threading
+from io import BytesIO
+from requests import Response
+from requests.exceptions import RequestException, TooManyRedirects
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+REDACTED_FIELDS = frozenset(['login_password'])
+""" Request values that are never written to a cassette """
+
+# Headers that don't describe the recorded body, which is saved decompressed and without cookies
+SKIPPED_HEADERS = frozenset(['content-encoding', 'content-length', 'transfer-encoding', 'set-cookie'])
+
+
+def _redact(text, secrets):
+    """
+    Replace the secret values in a recorded string
+    """
+    for secret in secrets:
+        text = text.replace(secret, '********')
+    return text
+
+
+def request_key(method, path, params=None, data=None):
+    """
+    Get the key that a request is recorded and replayed under
+
+    Parameters
+    ----------
+    method : string
+        The HTTP method
+    path : string
+        The URL path, without the domain and query string
+    params : dict, optional
+        The query string values
+    data : dict, optional
+        The POST data values
+
+    Returns
+    -------
+    string
+    """
+    def normalize(values):
+        items = []
+        for key, value in sorted((values or {}).items()):
+            if key in REDACTED_FIELDS:
+                value = '********'
+            elif not isinstance(value, basestring):
+                value = '{0}'.format(value)
+            items.append([key, value])
+        return items
+
+    return json.dumps([method.upper(), '/' + path.strip('/'), normalize(params), normalize(data)])
+
+
+def _open(file_path, mode):
+    """
+    Open a cassette file, gzipped if the file name ends with .gz
+    """
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, mode)
+    return open(file_path, mode)
+
+
+def _build_response(url, status, headers, body):
+    """
+    Build a response object for a body that has already been downloaded
+    """
+    response = Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = url
+    response.raw = BytesIO(body)
+    return response
+
+
+class Transport:
+    """
+    The interface for sending HTTP requests from a session.
+    Set a session's transport with :func:`lendingclub.session.Session.set_transport()`.
+    """
+
+    def send(self, http_session, method, url, params=None, data=None, allow_redirects=True, timeout=None):
+        """
+        Send an HTTP request and return as soon as the response headers have been received.
+        Errors should be raised as `requests.exceptions.RequestException`, so the session
+        reports them as a :class:`lendingclub.session.NetworkError`.
+
+        Parameters
+        ----------
+        http_session : requests.Session
+            The HTTP session, with the cookies and headers of the user's session
+        method : {GET, POST, HEAD, DELETE}
+            The HTTP method
+        url : string
+            The full URL
+        params : dict, optional
+            The query string values
+        data : dict, optional
+            The POST data values
+        allow_redirects : boolean, optional
+            Follow redirects
+        timeout : tuple, optional
+            The (connect, read) timeouts, in seconds. None waits forever.
+
+        Returns
+        -------
+        requests.Response
+            The response, with the body not necessarily downloaded yet
+        """
+        raise NotImplementedError()
+
+
+class RequestsTransport(Transport):
+    """
+    Sends requests over HTTP with the `requests` library. This is the default transport.
+    """
+
+    def send(self, http_session, method, url, params=None, data=None, allow_redirects=True, timeout=None):
+        """
+        Send the request over HTTP. See :func:`Transport.send()`
+        """
+        return http_session.request(method, url, params=params, data=data, allow_redirects=allow_redirects, stream=True, timeout=timeout)
+
+
+class RecordingTransport(Transport):
+    """
+    Sends requests with another transport and saves each request and response to a cassette file,
+    one JSON object per line. The file is gzipped if its name ends with .gz.
+
+    Passwords (see :attr:`REDACTED_FIELDS`) and cookies are not saved.
+
+    Parameters
+    ----------
+    file_path : string
+        The cassette file to write. It's replaced if it already exists.
+    transport : :class:`Transport`, optional
+        The transport that sends the requests, :class:`RequestsTransport` by default
+
+    Examples
+    --------
+
+        >>> from lendingclub import LendingClub
+        >>> from lendingclub.transport import RecordingTransport
+        >>> lc = LendingClub()
+        >>> lc.session.set_transport(RecordingTransport('/tmp/order.jsonl.gz'))
+        >>> lc.authenticate()
+        >>> ...
+        >>> lc.session.transport.close()
+    """
+
+    transport = None
+    __file = None
+    __lock = None
+
+    def __init__(self, file_path, transport=None):
+        self.transport = transport or RequestsTransport()
+        self.__file = _open(file_path, 'wb')
+        self.__lock = threading.Lock()
+
+    def send(self, http_session, method, url, params=None, data=None, allow_redirects=True, timeout=None):
+        """
+        Send the request and record it. See :func:`Transport.send()`
+        """
+        response = self.transport.send(http_session, method, url, params, data, allow_redirects, timeout)
+        body = response.content
+
+        # The server might echo a password back, i.e. in an error message
+        secrets = []
+        for values in (params, data):
+            for key, value in (values or {}).items():
+                if key in REDACTED_FIELDS and value:
+                    secrets.append(value)
+
+        record = {
+            'key': request_key(method, urlparse.urlparse(url).path, params, data),
+            'status': response.status_code,
+            'url': urlparse.urlparse(response.url).path,
+            'headers': dict((k, _redact(v, secrets)) for k, v in response.headers.items() if k.lower() not in SKIPPED_HEADERS)
+        }
+        try:
+            record['body'] = _redact(body.decode('utf-8'), secrets)
+        except UnicodeDecodeError:
+            record['body_base64'] = base64.b64encode(body)
+
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.__lock:
+            self.__file.write(line)
+            self.__file.flush()
+
+        return response
+
+    def close(self):
+        """
+        Finish writing the cassette file
+        """
+        with self.__lock:
+            self.__file.close()
+
+
+class ReplayTransport(Transport):
+    """
+    Serves the responses from a cassette file written by :class:`RecordingTransport`, without
+    sending anything over the network.
+
+    Requests are matched by method, path, query string and POST data. When the same request was
+    recorded more than once, the responses are served in the order they were recorded, and then
+    the last one is repeated.
+
+    Parameters
+    ----------
+    file_path : string
+        The cassette file to read
+
+    Examples
+    --------
+
+        >>> from lendingclub import LendingClub
+        >>> from lendingclub.transport import ReplayTransport
+        >>> lc = LendingClub(email='test@test.com', password='secret123')
+        >>> lc.session.set_transport(ReplayTransport('/tmp/order.jsonl.gz'))
+        >>> lc.authenticate()
+        True
+    """
+
+    __responses = None
+    __lock = None
+
+    def __init__(self, file_path):
+        self.__responses = {}
+        self.__lock = threading.Lock()
+
+        with _open(file_path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self.__responses.setdefault(record['key'], []).append(record)
+
+    def send(self, http_session, method, url, params=None, data=None, allow_redirects=True, timeout=None):
+        """
+        Return the recorded response for this request. See :func:`Transport.send()`
+
+        Raises
+        ------
+        ReplayError
+            If the request was never recorded
+        """
+        key = request_key(method, urlparse.urlparse(url).path, params, data)
+        with self.__lock:
+            records = self.__responses.get(key)
+            if not records:
+                raise ReplayError('No recorded response for {0} {1}'.format(method.upper(), url))
+            record = records[0]
+            if len(records) > 1:
+                records.pop(0)
+
+        if 'body_base64' in record:
+            body = base64.b64decode(record['body_base64'])
+        else:
+            body = record['body'].encode('utf-8')
+
+        return _build_response(urlparse.urljoin(url, record['url']), record['status'], record['headers'], body)
+
+
+class InMemoryTransport(Transport):
+    """
+    Routes requests straight to handler functions, without any HTTP. Use this to run the
+    library against a fake LendingClub server in the same process.
+
+    A handler is called with the `method`, `path`, `query` and `data` of the request (the query
+    includes the values from the URL's query string) and returns the response body, or a
+    (status, headers, body) tuple. Redirects are followed like they are over HTTP.
+
+    Parameters
+    ----------
+    default : function, optional
+        The handler for paths that don't have a route. Without one, those paths return a 404 response.
+
+    Examples
+    --------
+
+        >>> from lendingclub import LendingClub
+        >>> from lendingclub.transport import InMemoryTransport
+        >>> transport = InMemoryTransport()
+        >>> transport.route('/browse/cashBalanceAj.action', lambda method, path, query, data: '{"cashBalance": 100}')
+        >>> lc = LendingClub(transport=transport)
+    """
+
+    max_redirects = 30
+    default = None
+    __routes = None
+
+    def __init__(self, default=None):
+        self.default = default
+        self.__routes = {}
+
+    def route(self, path, handler):
+        """
+        Send all requests for a path to a handler function
+
+        Parameters
+        ----------
+        path : string
+            The URL path, without the domain and query string
+        handler : function
+            The function that returns the response
+        """
+        self.__routes['/' + path.strip('/')] = handler
+
+    def send(self, http_session, method, url, params=None, data=None, allow_redirects=True, timeout=None):
+        """
+        Call the handler for this request. See :func:`Transport.send()`
+        """
+        method = method.upper()
+        for i in range(self.max_redirects + 1):
+            parts = urlparse.urlparse(url)
+            path = '/' + parts.path.strip('/')
+            query = dict(urlparse.parse_qsl(parts.query))
+            query.update(params or {})
+
+            handler = self.__routes.get(path, self.default)
+            if handler is None:
+                result = (404, {}, 'Not found')
+            else:
+                result = handler(method, path, query, data or {})
+            if type(result) is not tuple:
+                result = (200, {}, result)
+            status, headers, body = result
+
+            if type(body) is unicode:
+                body = body.encode('utf-8')
+            response = _build_response(url, status, headers, body)
+
+            location = response.headers.get('location')
+            if not allow_redirects or status not in (301, 302, 303, 307) or location is None:
+                return response
+
+            # Browsers follow redirects with a GET, just like requests
+            url = urlparse.urljoin(url, location)
+            params = None
+            if status != 307:
+                method = 'GET'
+                data = None
+
+        raise TooManyRedirects('Exceeded {0} redirects'.format(self.max_redirects))
+
+
+class ReplayError(RequestException):
+    """
+    A request was sent to a :class:`ReplayTransport` that isn't in the cassette
+    """
+    pass
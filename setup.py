@@ -20,6 +20,9 @@ setup(
         "html5lib >= 0.95",
         "pybars >= 0.0.4"
     ],
+    extras_require={
+        'session': ["cryptography"]
+    },
     platforms='osx, posix, linux, windows',
     classifiers=[
         'Development Status :: 4 - Beta',